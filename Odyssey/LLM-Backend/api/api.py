@@ -1,22 +1,205 @@
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Request, Header, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse
 from entity.llama import LlamaRequest, LlamaResponse
+from api.metrics import BackendMetrics
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
 import asyncio
+import heapq
+import itertools
+import math
+import time
 
-semaphore = asyncio.Semaphore(18)
+# models without a `max_concurrency` attribute or a "concurrency" entry in the config
+# run one call at a time, which is what a single local model on a GPU can serve
+DEFAULT_MAX_CONCURRENCY = 1
+# waiting requests are served highest class first: interactive agent turns ("high"),
+# everything else ("normal") and background batches like description generation ("low")
+PRIORITIES = ("high", "normal", "low")
+DEFAULT_PRIORITY = "normal"
+# how many requests of a class may wait for one model before new ones are refused with 429
+DEFAULT_BACKLOG = {"high": 64, "normal": 64, "low": 16}
 concurrent_requests = 0
 
 
-def create_app(models)->FastAPI:
+class Backlogged(Exception):
+    def __init__(self, priority, queue_depth, retry_after):
+        super().__init__(f"{priority} backlog full, {queue_depth} requests ahead")
+        self.priority = priority
+        self.queue_depth = queue_depth
+        self.retry_after = retry_after
+
+
+class ModelRunner:
+    """
+    Runs the blocking calls of one model in the executor, at most `limit` at a
+    time. Requests above the limit wait in a priority queue; a class whose
+    queue is at its backlog limit is refused with `Backlogged`.
+    """
+
+    def __init__(self, model, limit, executor, backlog=None, name=None, metrics=None):
+        self.name = name
+        self.metrics = metrics
+        self.model = model
+        self.limit = limit
+        self.executor = executor
+        self.backlog = dict(DEFAULT_BACKLOG, **(backlog or {}))
+        self.running = 0
+        self.served = 0
+        # mean duration of a model call, for the Retry-After hint
+        self.service_time = 0.0
+        self.classes = {
+            priority: {"queued": 0, "admitted": 0, "rejected": 0, "wait": 0.0, "max_wait": 0.0}
+            for priority in PRIORITIES
+        }
+        self._waiters = []
+        self._order = itertools.count()
+
+    async def __call__(self, priority=DEFAULT_PRIORITY, **kwargs):
+        await self._acquire(priority)
+        start = time.monotonic()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, lambda: self.model(**kwargs))
+        finally:
+            elapsed = time.monotonic() - start
+            self.served += 1
+            self.service_time += (elapsed - self.service_time) / min(self.served, 20)
+            if self.metrics is not None:
+                self.metrics.model_time.observe((self.name,), elapsed)
+            self._release()
+
+    def queue_depth(self, priority):
+        """Requests waiting that are served before a new request of `priority`."""
+        rank = PRIORITIES.index(priority)
+        return sum(self.classes[p]["queued"] for p in PRIORITIES[:rank + 1])
+
+    async def _acquire(self, priority):
+        counts = self.classes[priority]
+        enqueued = time.monotonic()
+        if self.running < self.limit:
+            self.running += 1
+        elif counts["queued"] >= self.backlog[priority]:
+            counts["rejected"] += 1
+            depth = self.queue_depth(priority)
+            retry_after = max(1, math.ceil(depth / self.limit * self.service_time))
+            raise Backlogged(priority, depth, retry_after)
+        else:
+            future = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._waiters, (PRIORITIES.index(priority), next(self._order), future))
+            counts["queued"] += 1
+            try:
+                await future
+            except asyncio.CancelledError:
+                # the client went away right after its turn came, pass the slot on
+                if future.done() and not future.cancelled():
+                    self._release()
+                raise
+            finally:
+                counts["queued"] -= 1
+        wait = time.monotonic() - enqueued
+        counts["admitted"] += 1
+        counts["wait"] += wait
+        counts["max_wait"] = max(counts["max_wait"], wait)
+        if self.metrics is not None:
+            self.metrics.queue_wait.observe((self.name, priority), wait)
+
+    def _release(self):
+        # a finished call hands its slot straight to the first waiter, so `running` stays put
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.cancelled():
+                future.set_result(None)
+                return
+        self.running -= 1
+
+    def status(self):
+        classes = {
+            priority: {
+                "queued": counts["queued"],
+                "backlog": self.backlog[priority],
+                "admitted": counts["admitted"],
+                "rejected": counts["rejected"],
+                "mean_wait_ms": counts["wait"] / counts["admitted"] * 1e3 if counts["admitted"] else 0.0,
+                "max_wait_ms": counts["max_wait"] * 1e3,
+            }
+            for priority, counts in self.classes.items()
+        }
+        status = {
+            "limit": self.limit,
+            "running": self.running,
+            "waiting": sum(counts["queued"] for counts in self.classes.values()),
+            "served": self.served,
+            "classes": classes,
+        }
+        if hasattr(self.model, "batch_stats"):
+            status["batching"] = self.model.batch_stats()
+        return status
+
+
+def create_app(models, concurrency=None, backlog=None)->FastAPI:
+    """
+    `concurrency` maps model names to how many calls of that model may run at
+    once; otherwise the model's `max_concurrency` attribute is used. `backlog`
+    maps priority classes to how many requests of the class may wait per model.
+    Names registered with the same model object share one runner, so its limit
+    and backlog hold across all of them; the runner is named after the first.
+    """
     app = FastAPI()
+    concurrency = concurrency or {}
+    aliases = {}
+    for name, model in models.items():
+        aliases.setdefault(id(model), []).append(name)
+    limits = {
+        names[0]: next((concurrency[name] for name in names if concurrency.get(name)), None)
+        or getattr(models[names[0]], "max_concurrency", DEFAULT_MAX_CONCURRENCY)
+        for names in aliases.values()
+    }
+    # model calls block (HTTP to an API or generate on the GPU), they run here and not on the event loop
+    executor = ThreadPoolExecutor(max_workers=sum(limits.values()), thread_name_prefix="model")
+    runners = {}
+    metrics = BackendMetrics(runners, lambda: concurrent_requests)
+    runners.update({
+        name: ModelRunner(models[name], limit, executor, backlog, name, metrics)
+        for name, limit in limits.items()
+    })
+    # route name -> the runner of its model
+    routes = {name: runners[names[0]] for names in aliases.values() for name in names}
+
+    @app.on_event("shutdown")
+    def shutdown():
+        executor.shutdown(wait=False)
 
     @app.get("/ping")
     def ping():
         return {"data": "pong!"}
-    
+
+    # status and metrics read the counters on the event loop thread, where they are updated
     @app.get("/status")
-    def status():
-        return {"concurrent_requests": concurrent_requests}
-    
+    async def status():
+        models_status = {
+            names[0]: dict(runners[names[0]].status(), names=names) for names in aliases.values()
+        }
+        classes = {}
+        for priority in PRIORITIES:
+            counts = [runner.classes[priority] for runner in runners.values()]
+            admitted = sum(c["admitted"] for c in counts)
+            classes[priority] = {
+                "queued": sum(c["queued"] for c in counts),
+                "admitted": admitted,
+                "rejected": sum(c["rejected"] for c in counts),
+                "mean_wait_ms": sum(c["wait"] for c in counts) / admitted * 1e3 if admitted else 0.0,
+            }
+        return {
+            "concurrent_requests": concurrent_requests,
+            "classes": classes,
+            "models": models_status,
+        }
+
+    @app.get("/metrics", response_class=PlainTextResponse)
+    async def metrics_route():
+        return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
     @app.middleware("http")
     async def record_concurrent_requests(request: Request, call_next):
         global concurrent_requests
@@ -26,15 +209,33 @@ def create_app(models)->FastAPI:
             return response
         finally:
             concurrent_requests -= 1
-            
+
     def create_route(model_name):
         @app.post(f"/{model_name}", response_model=LlamaResponse)
-        async def llama(llama_request: LlamaRequest):
-            async with semaphore:
-                response = models[model_name](user_prompt=llama_request.user_prompt, system_prompt=llama_request.system_prompt)
-                return {"status": 0, "data": response}
-        
+        async def llama(llama_request: LlamaRequest, x_priority: Optional[str] = Header(None)):
+            priority = llama_request.priority or x_priority or DEFAULT_PRIORITY
+            if priority not in PRIORITIES:
+                raise HTTPException(status_code=400, detail=f"priority must be one of {', '.join(PRIORITIES)}")
+            start = time.monotonic()
+            metrics.input_chars.inc((model_name,), len(llama_request.system_prompt) + len(llama_request.user_prompt))
+            try:
+                response = await routes[model_name](priority, user_prompt=llama_request.user_prompt, system_prompt=llama_request.system_prompt)
+            except Backlogged as e:
+                metrics.requests.inc((model_name, priority, "rejected"))
+                return JSONResponse(
+                    status_code=429,
+                    headers={"Retry-After": str(e.retry_after)},
+                    content={"status": 1, "data": None, "priority": e.priority, "queue_depth": e.queue_depth},
+                )
+            except Exception:
+                metrics.requests.inc((model_name, priority, "error"))
+                raise
+            metrics.requests.inc((model_name, priority, "ok"))
+            metrics.output_chars.inc((model_name,), len(response or ""))
+            metrics.total_time.observe((model_name, priority), time.monotonic() - start)
+            return {"status": 0, "data": response}
+
     for name in models.keys():
         create_route(name)
-        
-    return app
\ No newline at end of file
+
+    return app
@@ -0,0 +1,151 @@
+"""
+Prometheus text-format metrics for the backend.
+
+Every update happens on the event loop thread (in the route handlers and in
+ModelRunner after its awaits), so the metrics are plain dicts of numbers with
+no locks on the request path. `/metrics` renders them on the loop thread too.
+Gauges are read from a callback at scrape time instead of being updated per
+request.
+"""
+from bisect import bisect_left
+
+# seconds, from a cached answer up to a long local generate
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _labels(names, values, extra=""):
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values = {}
+
+    def inc(self, labels=(), value=1):
+        self.values[labels] = self.values.get(labels, 0) + value
+
+    def samples(self):
+        for labels, value in self.values.items():
+            yield self.name, _labels(self.labels, labels), value
+
+
+class Gauge:
+    kind = "gauge"
+
+    def __init__(self, name, help, labels, collect):
+        """`collect()` returns {label values: value} when scraped."""
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.collect = collect
+
+    def samples(self):
+        for labels, value in self.collect().items():
+            yield self.name, _labels(self.labels, labels), value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        # per label values: [count per bucket (the last one is +Inf), sum]
+        self.values = {}
+
+    def observe(self, labels, value):
+        entry = self.values.get(labels)
+        if entry is None:
+            entry = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        entry[0][bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+
+    def samples(self):
+        for labels, (counts, total) in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                yield f"{self.name}_bucket", _labels(self.labels, labels, f'le="{bound}"'), cumulative
+            yield f"{self.name}_sum", _labels(self.labels, labels), total
+            yield f"{self.name}_count", _labels(self.labels, labels), cumulative
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+class BackendMetrics:
+    """The metrics of the model routes. `runners` is {model name: ModelRunner} for the gauges."""
+
+    def __init__(self, runners, http_in_flight):
+        self.registry = Registry()
+        register = self.registry.register
+        self.requests = register(Counter(
+            "llm_requests_total", "Model requests by outcome (ok, error, rejected).",
+            ("model", "priority", "outcome"),
+        ))
+        self.input_chars = register(Counter(
+            "llm_input_chars_total", "Characters of system and user prompts received.", ("model",),
+        ))
+        self.output_chars = register(Counter(
+            "llm_output_chars_total", "Characters of model responses returned.", ("model",),
+        ))
+        self.queue_wait = register(Histogram(
+            "llm_queue_wait_seconds", "Time a request waited for a model slot.", ("model", "priority"),
+        ))
+        self.model_time = register(Histogram(
+            "llm_model_seconds", "Time spent in the model call.", ("model",),
+        ))
+        self.total_time = register(Histogram(
+            "llm_request_seconds", "Time from receiving a request to its response.", ("model", "priority"),
+        ))
+        register(Gauge(
+            "llm_requests_in_flight", "Model calls running now.", ("model",),
+            lambda: {(name,): runner.running for name, runner in runners.items()},
+        ))
+        register(Gauge(
+            "llm_requests_queued", "Requests waiting for a model slot.", ("model", "priority"),
+            lambda: {
+                (name, priority): counts["queued"]
+                for name, runner in runners.items() for priority, counts in runner.classes.items()
+            },
+        ))
+        register(Gauge(
+            "llm_model_concurrency_limit", "Model calls allowed to run at once.", ("model",),
+            lambda: {(name,): runner.limit for name, runner in runners.items()},
+        ))
+        register(Gauge(
+            "llm_http_requests_in_flight", "HTTP requests being handled, all routes.", (),
+            lambda: {(): http_in_flight()},
+        ))
+
+    def render(self):
+        return self.registry.render()
@@ -0,0 +1,98 @@
+"""
+Micro-batching benchmark for model/llama.py, runs on CPU.
+
+Builds a tiny randomly initialised Llama causal LM with a small BPE tokenizer
+and a Llama 3 style chat template in a temporary directory, loads it through
+Llama3 (so the real generate_batch / BatchScheduler path is measured), and
+sends concurrent requests with prompts of different lengths with
+max_batch_size 1 (one generate per request, as before) and with batching.
+Decoding is greedy in float32, and every batched answer must equal the answer
+to the same prompt generated alone: each caller gets its own slice back and
+batching does not change what it says. The run fails otherwise. System
+prompts are long enough for the prefix cache, so the rows that start from a
+cached system turn are checked as well.
+
+Run from the LLM-Backend directory:
+    python benchmarks/bench_batching.py [requests] [max_batch_size] [batch_wait_ms]
+"""
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import torch
+from tokenizers import Tokenizer, models, pre_tokenizers, trainers, decoders
+from transformers import LlamaConfig, LlamaForCausalLM, PreTrainedTokenizerFast
+
+from model.llama import Llama3
+
+SPECIAL_TOKENS = ["<|begin_of_text|>", "<|eot_id|>", "<|start_header_id|>", "<|end_header_id|>"]
+CHAT_TEMPLATE = (
+    "<|begin_of_text|>{% for message in messages %}<|start_header_id|>{{ message['role'] }}<|end_header_id|>"
+    "{{ message['content'] }}<|eot_id|>{% endfor %}"
+    "{% if add_generation_prompt %}<|start_header_id|>assistant<|end_header_id|>{% endif %}"
+)
+CORPUS = [
+    "You are a helpful assistant that tells me the next immediate task to do in Minecraft.",
+    "Mine 3 iron ore, craft an iron pickaxe and then find diamonds near lava at level 11.",
+    "The bot has 4 oak logs, 2 sticks and a crafting table in its inventory.",
+]
+
+
+def build_tiny_model(path, hidden_size=128, num_hidden_layers=4, max_position_embeddings=1024):
+    tokenizer = Tokenizer(models.BPE())
+    tokenizer.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    tokenizer.decoder = decoders.ByteLevel()
+    tokenizer.train_from_iterator(CORPUS * 10, trainers.BpeTrainer(vocab_size=512, special_tokens=SPECIAL_TOKENS))
+    PreTrainedTokenizerFast(
+        tokenizer_object=tokenizer,
+        bos_token="<|begin_of_text|>",
+        eos_token="<|eot_id|>",
+        chat_template=CHAT_TEMPLATE,
+    ).save_pretrained(path)
+    config = LlamaConfig(
+        vocab_size=tokenizer.get_vocab_size(), hidden_size=hidden_size, intermediate_size=2 * hidden_size,
+        num_hidden_layers=num_hidden_layers, num_attention_heads=4, num_key_value_heads=4,
+        max_position_embeddings=max_position_embeddings,
+    )
+    LlamaForCausalLM(config).save_pretrained(path)
+
+
+def run(model, prompts):
+    with ThreadPoolExecutor(len(prompts)) as pool:
+        start = time.perf_counter()
+        answers = list(pool.map(lambda prompt: model(*prompt), prompts))
+    return answers, time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    max_batch_size = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    batch_wait = float(sys.argv[3]) / 1000 if len(sys.argv) > 3 else 0.02
+    prompts = [
+        (CORPUS[0], " ".join(CORPUS[1:]) * (1 + i % 4) + f" Step {i}.")
+        for i in range(requests)
+    ]
+    with tempfile.TemporaryDirectory() as path:
+        build_tiny_model(path)
+        options = dict(device_map="cpu", max_new_tokens=32, do_sample=False, torch_dtype=torch.float32,
+                       min_prefix_tokens=8)
+        single = Llama3(path, max_batch_size=1, **options)
+        batched = Llama3(path, max_batch_size=max_batch_size, batch_wait=batch_wait, **options)
+        # warm up outside the schedulers so their stats only cover the run
+        single.generate_batch([("warm", "up")])
+        batched.generate_batch([("warm", "up")])
+
+        expected, single_time = run(single, prompts)
+        answers, batched_time = run(batched, prompts)
+
+    mismatches = sum(answer != reference for answer, reference in zip(answers, expected))
+    print(f"requests: {requests}, max_new_tokens: 32, prompt tokens: varied x1..x4")
+    print(f"unbatched         : {requests / single_time:6.2f} req/s")
+    print(f"batched (max {max_batch_size:2d}) : {requests / batched_time:6.2f} req/s")
+    print(f"answers differing from unbatched: {mismatches}/{requests}")
+    print(f"batching stats: {batched.batch_stats()}")
+    assert mismatches == 0, f"{mismatches} batched answers differ from the unbatched ones"
@@ -0,0 +1,93 @@
+"""
+Load test for the LLM backend routes.
+
+Serves create_app with a stand-in model that blocks for a fixed time per call
+(like a Gemini request or a generate call), fires concurrent requests at it
+and reports throughput, request latency and /ping latency while the model
+routes are busy. Run with --limit 1 to see the queueing of a single local
+model, and with the default limit for an API model.
+
+Run from the LLM-Backend directory:
+    python benchmarks/bench_concurrency.py [--requests 64] [--clients 32] [--latency-ms 200] [--limit 18]
+"""
+import argparse
+import os
+import socket
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import requests
+import uvicorn
+
+from api.api import create_app
+
+
+class SleepModel:
+    def __init__(self, latency, max_concurrency):
+        self.latency = latency
+        self.max_concurrency = max_concurrency
+
+    def __call__(self, user_prompt, system_prompt):
+        time.sleep(self.latency)
+        return "{\"success\": true}"
+
+
+def serve(app):
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    base_url = f"http://127.0.0.1:{port}"
+    while not server.started:
+        time.sleep(0.05)
+    return base_url
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--latency-ms", type=float, default=200)
+    parser.add_argument("--limit", type=int, default=18)
+    args = parser.parse_args()
+
+    base_url = serve(create_app({"llama3_8b": SleepModel(args.latency_ms / 1000, args.limit)}))
+    body = {"user_prompt": "Did the bot succeed?", "system_prompt": "You are a critic."}
+    local = threading.local()
+
+    def post(_):
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        start = time.perf_counter()
+        local.session.post(f"{base_url}/llama3_8b", json=body).raise_for_status()
+        return time.perf_counter() - start
+
+    pings = []
+    done = threading.Event()
+
+    def ping():
+        while not done.is_set():
+            start = time.perf_counter()
+            requests.get(f"{base_url}/ping", timeout=60)
+            pings.append(time.perf_counter() - start)
+            time.sleep(0.05)
+
+    pinger = threading.Thread(target=ping)
+    start = time.perf_counter()
+    pinger.start()
+    with ThreadPoolExecutor(args.clients) as pool:
+        latencies = sorted(pool.map(post, range(args.requests)))
+    elapsed = time.perf_counter() - start
+    done.set()
+    pinger.join()
+
+    print(f"requests: {args.requests}, clients: {args.clients}, model latency: {args.latency_ms:.0f} ms, limit: {args.limit}")
+    print(f"throughput: {args.requests / elapsed:7.1f} req/s ({elapsed:.2f} s)")
+    print(f"latency:    p50 {statistics.median(latencies) * 1e3:7.0f} ms, max {latencies[-1] * 1e3:7.0f} ms")
+    print(f"/ping:      p50 {statistics.median(pings) * 1e3:7.1f} ms, max {max(pings) * 1e3:7.1f} ms")
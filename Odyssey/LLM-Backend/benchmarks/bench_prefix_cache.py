@@ -0,0 +1,64 @@
+"""
+Time-to-first-token benchmark for the system-prompt KV prefix cache in
+model/llama.py, runs on CPU.
+
+Loads a small randomly initialised Llama (see bench_batching.py) through
+Llama3 with and without the prefix cache and sends one request at a time:
+a long shared system prompt, as Odyssey's action / critic prompts are, and a
+different short user message each time. Time to first token is the time of a
+generate with max_new_tokens=1; the cached run includes the one miss that
+computes the prefix. Greedy answers of both runs are compared.
+
+Run from the LLM-Backend directory:
+    python benchmarks/bench_prefix_cache.py [requests] [system_prompt_repeats]
+"""
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from bench_batching import CORPUS, build_tiny_model
+from model.llama import Llama3
+
+
+def first_token_times(model, system_prompt, user_prompts):
+    model.max_new_tokens = 1
+    times = []
+    for user_prompt in user_prompts:
+        start = time.perf_counter()
+        model.generate_batch([(system_prompt, user_prompt)])
+        times.append(time.perf_counter() - start)
+    return times
+
+
+if __name__ == '__main__':
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+    system_prompt = " ".join(CORPUS * repeats)
+    user_prompts = [f"The bot has {i} oak logs. What is the next task?" for i in range(requests)]
+    with tempfile.TemporaryDirectory() as path:
+        build_tiny_model(path, hidden_size=256, num_hidden_layers=6, max_position_embeddings=8192)
+        options = dict(device_map="cpu", do_sample=False)
+        uncached = Llama3(path, prefix_cache_size=0, **options)
+        cached = Llama3(path, prefix_cache_size=4, **options)
+        uncached.generate_batch([("warm", "up")])
+        cached.generate_batch([("warm", "up")])
+        prefix, rest = cached.split_prompt(system_prompt, user_prompts[0])
+
+        uncached_times = first_token_times(uncached, system_prompt, user_prompts)
+        cached_times = first_token_times(cached, system_prompt, user_prompts)
+
+        uncached.max_new_tokens = cached.max_new_tokens = 16
+        batch = [(system_prompt, user_prompt) for user_prompt in user_prompts[:8]]
+        expected, _ = uncached.generate_batch(batch)
+        answers, _ = cached.generate_batch(batch)
+
+    mismatches = sum(answer != reference for answer, reference in zip(answers, expected))
+    print(f"requests: {requests}, system prompt: {len(prefix)} tokens, user turn: ~{len(rest)} tokens")
+    print(f"TTFT uncached: p50 {statistics.median(uncached_times) * 1e3:7.1f} ms")
+    print(f"TTFT cached  : p50 {statistics.median(cached_times) * 1e3:7.1f} ms (first, computing the prefix: {cached_times[0] * 1e3:.1f} ms)")
+    print(f"batch of 8 greedy answers differing from uncached: {mismatches}/8")
+    print(f"prefix cache: {cached.batch_stats()['prefix_cache']}")
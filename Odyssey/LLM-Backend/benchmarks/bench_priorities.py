@@ -0,0 +1,65 @@
+"""
+Priority and admission control benchmark for the LLM backend routes.
+
+A model that blocks for a fixed time per call and serves `limit` calls at
+once gets a flood of background requests, and interactive requests arrive
+while the flood is queued. The run is done twice: once with every request
+at the default priority (the old single queue) and once with the flood sent
+as "low" and the interactive requests as "high". Reports latency of the
+interactive requests and how many background requests were refused with 429.
+
+Run from the LLM-Backend directory:
+    python benchmarks/bench_priorities.py [--background 48] [--interactive 8] [--latency-ms 100] [--limit 2]
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import requests
+
+from api.api import create_app
+from bench_concurrency import SleepModel, serve
+
+
+def run(base_url, background, interactive, background_priority, interactive_priority):
+    body = {"user_prompt": "Did the bot succeed?", "system_prompt": "You are a critic."}
+
+    def post(priority):
+        start = time.perf_counter()
+        response = requests.post(f"{base_url}/llama3_8b", json=body, headers={"X-Priority": priority})
+        return response.status_code, time.perf_counter() - start
+
+    with ThreadPoolExecutor(background + interactive) as pool:
+        flood = [pool.submit(post, background_priority) for _ in range(background)]
+        time.sleep(0.2)
+        turns = [pool.submit(post, interactive_priority) for _ in range(interactive)]
+        turn_latencies = [future.result()[1] for future in turns]
+        flood_codes = [future.result()[0] for future in flood]
+    return turn_latencies, flood_codes.count(429)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--background", type=int, default=48)
+    parser.add_argument("--interactive", type=int, default=8)
+    parser.add_argument("--latency-ms", type=float, default=100)
+    parser.add_argument("--limit", type=int, default=2)
+    args = parser.parse_args()
+
+    print(f"background: {args.background}, interactive: {args.interactive}, "
+          f"model latency: {args.latency_ms:.0f} ms, limit: {args.limit}")
+    for name, priorities in (("single queue", ("normal", "normal")), ("priorities", ("low", "high"))):
+        base_url = serve(create_app({"llama3_8b": SleepModel(args.latency_ms / 1000, args.limit)}))
+        latencies, rejected = run(base_url, args.background, args.interactive, *priorities)
+        status = requests.get(f"{base_url}/status").json()["classes"]
+        print(f"{name:12s}: interactive p50 {statistics.median(latencies) * 1e3:6.0f} ms, "
+              f"max {max(latencies) * 1e3:6.0f} ms; background refused {rejected:2d}")
+        print(f"{'':12s}  per class: " + ", ".join(
+            f"{priority} {counts['admitted']} admitted / {counts['mean_wait_ms']:.0f} ms mean wait"
+            for priority, counts in status.items() if counts["admitted"] or counts["rejected"]))
@@ -8,4 +8,6 @@ class LlamaResponse(BaseModel):
 
 class LlamaRequest(BaseModel):
     user_prompt: str
-    system_prompt: str
\ No newline at end of file
+    system_prompt: str
+    # "high", "normal" or "low", the X-Priority header works as well
+    priority: Optional[str] = None
\ No newline at end of file
@@ -18,5 +18,5 @@ MODEL_NAMES = [
 
 if __name__ == "__main__":
     models = {name: gemini for name in MODEL_NAMES}
-    app = create_app(models)
+    app = create_app(models, concurrency=config_manager.get('concurrency'), backlog=config_manager.get('backlog'))
     uvicorn.run(app, host="0.0.0.0", port=config_manager.get('port'))
@@ -11,6 +11,9 @@ if not GEMINI_API_KEY:
 client = genai.Client(api_key=GEMINI_API_KEY)
 
 class GeminiModel:
+    # calls are HTTP requests to the Gemini API, many can be in flight at once
+    max_concurrency = 18
+
     def __init__(self, model_name="gemini-2.5-flash"):
         self.model_name = model_name
 
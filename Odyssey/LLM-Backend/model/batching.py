@@ -0,0 +1,84 @@
+"""
+Dynamic micro-batching for the local models.
+
+`BatchScheduler` funnels the calls of one model through a single worker
+thread. The worker takes the first waiting request, gathers whatever else
+arrives within `max_wait` seconds (up to `max_batch_size` requests) and hands
+them to `generate_batch` as one list, so concurrent bots share one `generate`
+instead of queueing behind each other. `generate_batch` returns the outputs
+in request order together with (padding tokens, total tokens) of the batch,
+which is reported as padding waste.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class BatchScheduler:
+    def __init__(self, generate_batch, max_batch_size=8, max_wait=0.02):
+        self.generate_batch = generate_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.batches = 0
+        self.requests = 0
+        self.largest_batch = 0
+        self.padding_tokens = 0
+        self.total_tokens = 0
+        self.queue_wait = 0.0
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name="BatchScheduler", daemon=True)
+        self._worker.start()
+
+    def __call__(self, request):
+        return self.submit(request).result()
+
+    def submit(self, request):
+        future = Future()
+        self._queue.put((request, future, time.monotonic()))
+        return future
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            started = time.monotonic()
+            try:
+                outputs, (padding, total) = self.generate_batch([request for request, _, _ in batch])
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            self.batches += 1
+            self.requests += len(batch)
+            self.largest_batch = max(self.largest_batch, len(batch))
+            self.padding_tokens += padding
+            self.total_tokens += total
+            self.queue_wait += sum(started - submitted for _, _, submitted in batch)
+            for (_, future, _), output in zip(batch, outputs):
+                future.set_result(output)
+
+    def stats(self):
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1e3,
+            "batches": self.batches,
+            "requests": self.requests,
+            "mean_batch_size": self.requests / self.batches if self.batches else 0.0,
+            "largest_batch": self.largest_batch,
+            "mean_queue_wait_ms": self.queue_wait / self.requests * 1e3 if self.requests else 0.0,
+            "padding_waste": self.padding_tokens / self.total_tokens if self.total_tokens else 0.0,
+            "waiting": self._queue.qsize(),
+        }
@@ -1,4 +1,5 @@
 import os
+import copy
 import torch
 from typing import Union
 from pathlib import Path
@@ -11,6 +12,8 @@ from transformers import (
     pipeline,
     logging,
 )
+from .batching import BatchScheduler
+from .prefix_cache import PrefixCache
 
 class Llama2:
     use_4bit = True
@@ -20,7 +23,8 @@ class Llama2:
 
     def __init__(self, model_path: Path, max_length:int =1024, device_map: Union[dict,str]='',
                  repetition_penalty:float = 1.18, no_repeat_ngram_size:int = 5,
-                 return_full_text:bool = False, temperature: float = 0.8) -> None:
+                 return_full_text:bool = False, temperature: float = 0.8,
+                 max_batch_size:int = 8, batch_wait:float = 0.02) -> None:
         self.compute_dtype = getattr(torch, self.bnb_4bit_compute_dtype)
         bnb_config = BitsAndBytesConfig(
             load_in_4bit=self.use_4bit,
@@ -42,69 +46,145 @@ class Llama2:
                                     return_full_text=return_full_text,
                                     temperature=temperature
                                 )
-        
-        
+        # batched prompts are left padded so every generation starts right after its prompt
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+        self.tokenizer.padding_side = 'left'
+        # the api lets up to a batch of requests through, the scheduler runs them as one
+        self.max_concurrency = max_batch_size
+        self.scheduler = BatchScheduler(self.generate_batch, max_batch_size, batch_wait)
 
     def __call__(self, system_prompt: str, user_prompt: str) -> str:
-        prompttext = f'[INST]<<SYS>>\n{system_prompt}\n<</SYS>>\n\n {user_prompt} \n[/INST]' 
-        print('==='*30)
-        print(prompttext)
-        print('---'*30)
-        resp = self.pipeline(prompttext)
-        if len(resp) > 0:
-            resp = resp[0]
-            resp = resp.get('generated_text', None)
-            print(resp)
+        return self.scheduler((system_prompt, user_prompt))
+
+    def batch_stats(self) -> dict:
+        return self.scheduler.stats()
+
+    def generate_batch(self, prompts):
+        prompttexts = [f'[INST]<<SYS>>\n{system_prompt}\n<</SYS>>\n\n {user_prompt} \n[/INST]'
+                       for system_prompt, user_prompt in prompts]
+        lengths = [len(ids) for ids in self.tokenizer(prompttexts).input_ids]
+        padding = (max(lengths) * len(lengths) - sum(lengths), max(lengths) * len(lengths))
+        resps = self.pipeline(prompttexts, batch_size=len(prompttexts))
+        outputs = []
+        for prompttext, resp in zip(prompttexts, resps):
             print('==='*30)
-            return resp
-        else:
+            print(prompttext)
+            print('---'*30)
+            resp = resp[0].get('generated_text', None) if len(resp) > 0 else None
+            if resp is not None:
+                print(resp)
             print('==='*30)
-            return None
+            outputs.append(resp)
+        return outputs, padding
     
 class Llama3:
-    def __init__(self, model_path: Path, device_map: Union[dict,str]='',max_new_tokens:int=256,do_sample:bool=True,temperature:float=0.6,top_p:float=0.9):
+    def __init__(self, model_path: Path, device_map: Union[dict,str]='',max_new_tokens:int=256,do_sample:bool=True,temperature:float=0.6,top_p:float=0.9,
+                 max_batch_size:int=8, batch_wait:float=0.02, prefix_cache_size:int=4, min_prefix_tokens:int=64,
+                 torch_dtype:torch.dtype=torch.bfloat16):
         self.tokenizer = AutoTokenizer.from_pretrained(model_path)
+        # batched prompts are left padded so every generation starts right after its prompt
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+        self.tokenizer.padding_side = 'left'
         self.model = AutoModelForCausalLM.from_pretrained(
             model_path,
-            torch_dtype=torch.bfloat16,
+            # bfloat16 matmuls round differently with the batch shape, so a near tie can decode to another
+            # token batched than alone; float32 keeps batched answers identical to unbatched ones
+            torch_dtype=torch_dtype,
             device_map = device_map,
         )
         self.max_new_tokens = max_new_tokens
         self.do_sample= do_sample
         self.temperature = temperature
         self.top_p = top_p
-    
+        # system turns of at least min_prefix_tokens keep their KV, so only the user turn is prefilled
+        self.prefix_cache = PrefixCache(prefix_cache_size) if prefix_cache_size else None
+        self.min_prefix_tokens = min_prefix_tokens
+        # the api lets up to a batch of requests through, the scheduler runs them as one
+        self.max_concurrency = max_batch_size
+        self.scheduler = BatchScheduler(self.generate_batch, max_batch_size, batch_wait)
+
     def __call__(self, system_prompt: str, user_prompt: str) -> str:
+        return self.scheduler((system_prompt, user_prompt))
+
+    def batch_stats(self) -> dict:
+        stats = self.scheduler.stats()
+        if self.prefix_cache is not None:
+            stats["prefix_cache"] = self.prefix_cache.stats()
+        return stats
+
+    def split_prompt(self, system_prompt: str, user_prompt: str):
+        """(system turn token ids, rest token ids); the system turn is empty when it is not cached."""
         messages = [
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": user_prompt},
         ]
-        input_ids = self.tokenizer.apply_chat_template(
-            messages,
-            add_generation_prompt=True,
-            return_tensors="pt"
-        ).to(self.model.device)
+        prompttext = self.tokenizer.apply_chat_template(messages, add_generation_prompt=True, tokenize=False)
+        # the chat template already starts with the bos token
+        encode = lambda text: tuple(self.tokenizer(text, add_special_tokens=False).input_ids)
+        if self.prefix_cache is not None:
+            prefixtext = self.tokenizer.apply_chat_template(messages[:1], tokenize=False)
+            if prompttext.startswith(prefixtext):
+                prefix = encode(prefixtext)
+                if len(prefix) >= self.min_prefix_tokens:
+                    return prefix, encode(prompttext[len(prefixtext):])
+        return (), encode(prompttext)
+
+    def prefix_past(self, prefix, batch_size):
+        """A fresh copy of the prefix's past_key_values for `batch_size` rows, computed on a miss."""
+        past = self.prefix_cache.get(prefix)
+        if past is None:
+            with torch.no_grad():
+                input_ids = torch.tensor([prefix], device=self.model.device)
+                past = self.model(input_ids=input_ids, use_cache=True).past_key_values
+            self.prefix_cache.put(prefix, past)
+        # generate extends the cache in place
+        past = copy.deepcopy(past)
+        if batch_size > 1:
+            past.batch_repeat_interleave(batch_size)
+        return past
+
+    def generate_batch(self, prompts):
+        # requests with the same cached system turn run together, starting from its KV
+        groups = {}
+        for i, (system_prompt, user_prompt) in enumerate(prompts):
+            prefix, rest = self.split_prompt(system_prompt, user_prompt)
+            groups.setdefault(prefix, []).append((i, rest))
 
         terminators = [
             self.tokenizer.eos_token_id,
             self.tokenizer.convert_tokens_to_ids("<|eot_id|>")
         ]
+        responses = [None] * len(prompts)
+        padding = [0, 0]
+        for prefix, rows in groups.items():
+            # pad between the system turn and the rest, so every continuation starts at the same column
+            width = max(len(rest) for _, rest in rows)
+            pad = self.tokenizer.pad_token_id
+            input_ids = [list(prefix) + [pad] * (width - len(rest)) + list(rest) for _, rest in rows]
+            attention_mask = [[1] * len(prefix) + [0] * (width - len(rest)) + [1] * len(rest) for _, rest in rows]
+            padding[0] += sum(width - len(rest) for _, rest in rows)
+            padding[1] += (len(prefix) + width) * len(rows)
+            input_ids = torch.tensor(input_ids, device=self.model.device)
+            past_key_values = self.prefix_past(prefix, len(rows)) if prefix else None
 
-        outputs = self.model.generate(
-            input_ids,
-            max_new_tokens=self.max_new_tokens,
-            eos_token_id=terminators,
-            do_sample=self.do_sample,
-            temperature=self.temperature,
-            top_p=self.top_p,
-            # pad_token_id=self.tokenizer.eos_token_id,
-            # repetition_penalty=1.3, 
-        )
-        if len(outputs) > 0:
-            response = outputs[0][input_ids.shape[-1]:]
-            return self.tokenizer.decode(response, skip_special_tokens=True)
-        else:
-            return None
+            outputs = self.model.generate(
+                input_ids=input_ids,
+                attention_mask=torch.tensor(attention_mask, device=self.model.device),
+                past_key_values=past_key_values,
+                max_new_tokens=self.max_new_tokens,
+                eos_token_id=terminators,
+                do_sample=self.do_sample,
+                temperature=self.temperature,
+                top_p=self.top_p,
+                pad_token_id=pad,
+                # repetition_penalty=1.3, 
+            )
+            decoded = self.tokenizer.batch_decode(outputs[:, input_ids.shape[-1]:], skip_special_tokens=True)
+            for (i, _), response in zip(rows, decoded):
+                responses[i] = response
+        return responses, tuple(padding)
         
     
 if __name__ == '__main__':
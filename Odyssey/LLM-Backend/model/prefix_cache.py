@@ -0,0 +1,56 @@
+"""
+LRU of precomputed `past_key_values` for prompt prefixes.
+
+Every Odyssey agent sends the same long system prompt with a different user
+message, so the keys and values of the system turn are computed once and kept
+here, keyed by a hash of its token ids. A request whose prompt starts with a
+cached prefix only prefills its user turn. Each entry holds the full KV of
+the prefix on the model's device (for an 8B model roughly 128 KB per token),
+so keep `max_entries` small.
+"""
+import hashlib
+from array import array
+from collections import OrderedDict
+
+
+def prefix_key(token_ids):
+    return hashlib.sha256(array("q", token_ids).tobytes()).hexdigest()
+
+
+class PrefixCache:
+    def __init__(self, max_entries=4):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.saved_tokens = 0
+        self._entries = OrderedDict()
+
+    def get(self, token_ids):
+        key = prefix_key(token_ids)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        self.saved_tokens += len(token_ids)
+        return entry
+
+    def put(self, token_ids, past_key_values):
+        self._entries[prefix_key(token_ids)] = past_key_values
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "saved_prefill_tokens": self.saved_tokens,
+        }
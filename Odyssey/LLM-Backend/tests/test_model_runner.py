@@ -0,0 +1,133 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from api.api import Backlogged, ModelRunner, create_app
+
+
+class GatedModel:
+    """Blocks every call until `gate` is set, and records the order calls start in."""
+    def __init__(self, max_concurrency=1):
+        self.max_concurrency = max_concurrency
+        self.gate = threading.Event()
+        self.started = []
+        self.running = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, user_prompt, system_prompt):
+        with self._lock:
+            self.started.append(user_prompt)
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        self.gate.wait(5)
+        with self._lock:
+            self.running -= 1
+        return user_prompt
+
+
+async def settle():
+    # let queued tasks reach their await
+    for _ in range(5):
+        await asyncio.sleep(0.01)
+
+
+def test_full_backlog_is_refused_with_a_retry_hint():
+    async def main():
+        model = GatedModel()
+        runner = ModelRunner(model, 1, ThreadPoolExecutor(1), backlog={"low": 1})
+        running = asyncio.ensure_future(runner("low", user_prompt="a", system_prompt=""))
+        queued = asyncio.ensure_future(runner("low", user_prompt="b", system_prompt=""))
+        await settle()
+        with pytest.raises(Backlogged) as refused:
+            await runner("low", user_prompt="c", system_prompt="")
+        # other classes still have room
+        normal = asyncio.ensure_future(runner("normal", user_prompt="d", system_prompt=""))
+        await settle()
+        model.gate.set()
+        assert await asyncio.gather(running, queued, normal) == ["a", "b", "d"]
+        return refused.value, runner
+
+    refused, runner = asyncio.run(main())
+    assert refused.priority == "low"
+    assert refused.queue_depth == 1
+    assert refused.retry_after >= 1
+    assert runner.classes["low"]["rejected"] == 1
+    assert runner.status()["running"] == 0 and runner.status()["waiting"] == 0
+
+
+def test_waiters_are_served_by_priority():
+    async def main():
+        model = GatedModel()
+        runner = ModelRunner(model, 1, ThreadPoolExecutor(1))
+        calls = [asyncio.ensure_future(runner("normal", user_prompt="first", system_prompt=""))]
+        await settle()
+        for priority in ("low", "normal", "high"):
+            calls.append(asyncio.ensure_future(runner(priority, user_prompt=priority, system_prompt="")))
+            await settle()
+        model.gate.set()
+        await asyncio.gather(*calls)
+        return model.started
+
+    assert asyncio.run(main()) == ["first", "high", "normal", "low"]
+
+
+def test_cancelled_waiter_passes_its_slot_on():
+    async def main():
+        model = GatedModel()
+        runner = ModelRunner(model, 1, ThreadPoolExecutor(1))
+        running = asyncio.ensure_future(runner(user_prompt="a", system_prompt=""))
+        await settle()
+        gone = asyncio.ensure_future(runner(user_prompt="b", system_prompt=""))
+        waiting = asyncio.ensure_future(runner(user_prompt="c", system_prompt=""))
+        await settle()
+        gone.cancel()
+        model.gate.set()
+        assert await asyncio.gather(running, waiting) == ["a", "c"]
+        return runner
+
+    runner = asyncio.run(main())
+    assert runner.running == 0
+
+
+httpx = pytest.importorskip("httpx")
+
+
+def post_all(app, paths):
+    async def main():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            responses = await asyncio.gather(
+                *(client.post(path, json={"user_prompt": str(i), "system_prompt": ""}) for i, path in enumerate(paths))
+            )
+            status = (await client.get("/status")).json()
+        return responses, status
+    return asyncio.run(main())
+
+
+def test_route_answers_429_with_retry_after():
+    model = GatedModel()
+    app = create_app({"llama3_8b": model}, backlog={"normal": 1})
+    threading.Timer(0.5, model.gate.set).start()
+    responses, status = post_all(app, ["/llama3_8b"] * 3)
+    codes = sorted(response.status_code for response in responses)
+    assert codes == [200, 200, 429]
+    refused = next(response for response in responses if response.status_code == 429)
+    assert int(refused.headers["Retry-After"]) >= 1
+    assert refused.json()["priority"] == "normal"
+    assert status["classes"]["normal"]["rejected"] == 1
+
+
+def test_names_of_one_model_share_its_limit():
+    model = GatedModel(max_concurrency=2)
+    names = ["llama3_8b", "llama3_70b_v1", "qwen2-7b"]
+    app = create_app({name: model for name in names}, backlog={"normal": 64})
+    threading.Timer(0.3, model.gate.set).start()
+    responses, status = post_all(app, [f"/{names[i % 3]}" for i in range(9)])
+    assert all(response.status_code == 200 for response in responses)
+    assert model.peak == 2
+    assert list(status["models"]) == ["llama3_8b"]
+    assert status["models"]["llama3_8b"]["names"] == names
+    assert status["models"]["llama3_8b"]["served"] == 9
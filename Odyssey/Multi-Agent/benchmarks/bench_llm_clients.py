@@ -0,0 +1,92 @@
+"""
+Per-call client overhead benchmark for odyssey/agents/llm.py.
+
+Starts a local OpenAI-compatible stub (POST /chat/completions) and a stub of
+the Llama server route, then times sequential calls:
+    openai fresh     a new OpenAI client per call, as call_with_messages did before
+    openai pooled    the shared client from _openai_client
+    llama post       a bare requests.post per call, as before
+    llama session    the shared keep-alive _session
+The stub answers immediately, so the numbers are client and connection
+overhead only. The stub is plain HTTP; against the real providers every
+fresh client also pays a TLS handshake, so the gap is larger there.
+
+Run from the Multi-Agent directory (needs conf/config.json):
+    python benchmarks/bench_llm_clients.py [calls]
+"""
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import requests
+from openai import OpenAI
+
+from odyssey.agents.llm import _openai_client, _session
+
+
+class StubServer(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # headers and body go out as separate writes, without this keep-alive
+    # connections stall on delayed ACKs and the stub itself dominates
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path.endswith("/chat/completions"):
+            body = {
+                "id": "stub", "object": "chat.completion", "created": 0, "model": "stub",
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": "{\"success\": true}"}}],
+            }
+        else:
+            body = {"data": "{\"success\": true}"}
+        body = json.dumps(body).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def timed(calls, fn):
+    fn()  # warm up
+    start = time.perf_counter()
+    for _ in range(calls):
+        fn()
+    return (time.perf_counter() - start) / calls
+
+
+if __name__ == '__main__':
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubServer)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    llama_url = f"http://127.0.0.1:{server.server_address[1]}/llama3_8b_1"
+    messages = [{"role": "system", "content": "You are a critic."}, {"role": "user", "content": "Did the bot succeed?"}]
+    llama_msg = {"system_prompt": "You are a critic.", "user_prompt": "Did the bot succeed?"}
+
+    def openai_fresh():
+        OpenAI(api_key="stub", base_url=base_url).chat.completions.create(model="stub", messages=messages)
+
+    def openai_pooled():
+        _openai_client("stub", base_url).chat.completions.create(model="stub", messages=messages)
+
+    def llama_post():
+        requests.post(llama_url, json=llama_msg).json()
+
+    def llama_session():
+        _session.post(llama_url, json=llama_msg).json()
+
+    print(f"calls: {calls}")
+    for name, fn in (("openai fresh", openai_fresh), ("openai pooled", openai_pooled),
+                     ("llama post", llama_post), ("llama session", llama_session)):
+        print(f"{name:14s}: {timed(calls, fn) * 1e3:7.2f} ms/call")
@@ -1,11 +1,15 @@
 import requests
 from http import HTTPStatus
 import json
+import threading
 import dashscope
 from langchain.schema import AIMessage, HumanMessage, SystemMessage
 from pathlib import Path
 from odyssey.utils import config
+from odyssey.utils.single_flight import SingleFlight, request_key
 from openai import OpenAI
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 with open(Path(__file__).parent.parent.parent / "conf/config.json", "r") as config_file:
     config = json.load(config_file)
@@ -18,7 +22,72 @@ class ModelType:
     GPT = 'gpt'
     ALI = 'ali'
 
-def call_with_messages(msgs, model_type:ModelType=ModelType.ALI, model_id=1, mode='text', input_url=None, openai_model='gpt-4o', deepseek_model='deepseek-chat', json_format=True, dashscope_model='qwen-plus', dashscope_vision_model='qwen-vl-plus'):
+# identical prompts in flight at the same time share one request; with "single_flight_dir"
+# in conf/config.json this also holds across the agent processes using that directory
+_flight = SingleFlight(config.get('single_flight_dir'))
+
+# clients are shared per provider and base URL so every turn reuses the open
+# keep-alive connections instead of a new TLS handshake and connection pool;
+# the OpenAI client retries 429 / 5xx / connection errors with exponential backoff itself
+_max_retries = config.get('llm_max_retries', 3)
+_clients = {}
+_clients_lock = threading.Lock()
+
+def _openai_client(api_key, base_url=None):
+    key = (api_key, base_url)
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                client = _clients[key] = OpenAI(api_key=api_key, base_url=base_url, max_retries=_max_retries)
+    return client
+
+class _RetryAfter(Retry):
+    """Retries a status only when it comes with Retry-After, i.e. the server refused the request before generating."""
+    def is_retry(self, method, status_code, has_retry_after=False):
+        return has_retry_after and super().is_retry(method, status_code, has_retry_after)
+
+# the local Llama server path goes through one keep-alive session; generation POSTs are not
+# idempotent, so only connect errors and 429 / 503 with Retry-After are retried, never
+# a request the server may already be generating for
+_adapter = HTTPAdapter(
+    pool_maxsize=32,
+    max_retries=_RetryAfter(
+        total=_max_retries,
+        connect=_max_retries,
+        read=0,
+        other=0,
+        status=_max_retries,
+        backoff_factor=0.5,
+        status_forcelist=(429, 503),
+        allowed_methods=None,
+        raise_on_status=False,
+    ),
+)
+_session = requests.Session()
+_session.mount('http://', _adapter)
+_session.mount('https://', _adapter)
+
+def call_with_messages(msgs, model_type:ModelType=ModelType.ALI, model_id=1, mode='text', input_url=None, openai_model='gpt-4o', deepseek_model='deepseek-chat', json_format=True, dashscope_model='qwen-plus', dashscope_vision_model='qwen-vl-plus', priority=None):
+    # `priority` ("high", "normal" or "low") orders the request in the LLM-Backend queue,
+    # it does not change the answer and is not part of the key
+    key = request_key(
+        model_type, model_id, mode, input_url, openai_model, deepseek_model, json_format,
+        dashscope_model, dashscope_vision_model, msgs[0].content, msgs[1].content,
+    )
+
+    def call():
+        message = _call_with_messages(
+            msgs, model_type, model_id, mode, input_url, openai_model, deepseek_model,
+            json_format, dashscope_model, dashscope_vision_model, priority,
+        )
+        return message.content if message is not None else None
+
+    content = _flight.do(key, call)
+    return AIMessage(content=content) if content is not None else None
+
+def _call_with_messages(msgs, model_type, model_id, mode, input_url, openai_model, deepseek_model, json_format, dashscope_model, dashscope_vision_model, priority=None):
     if mode == 'text':
         apikey_messages =  [{'role': 'system', 'content': msgs[0].content},
                             {'role': 'user', 'content': msgs[1].content}]
@@ -28,7 +97,7 @@ def call_with_messages(msgs, model_type:ModelType=ModelType.ALI, model_id=1, mod
     # use openai key
     if model_type == ModelType.GPT:
         openai_key = config.get('openai_key')
-        client = OpenAI(api_key=openai_key)
+        client = _openai_client(openai_key)
         try:
             response = client.chat.completions.create(
                 model=openai_model,
@@ -41,7 +110,7 @@ def call_with_messages(msgs, model_type:ModelType=ModelType.ALI, model_id=1, mod
     elif model_type == ModelType.DEEPSEEK:
         deepseek_key = config.get('deepseek_key')
         if json_format:
-            client=OpenAI(api_key=deepseek_key, base_url="https://api.deepseek.com/beta")
+            client = _openai_client(deepseek_key, "https://api.deepseek.com/beta")
             messages = [{'role': 'system', 'content': msgs[0].content},
                         {'role': 'user', 'content': msgs[1].content},
                         {'role': 'assistant', 'content': '```json\n', 'prefix':True}]
@@ -55,7 +124,7 @@ def call_with_messages(msgs, model_type:ModelType=ModelType.ALI, model_id=1, mod
             except Exception as e:
                 print(f"Error calling deepseek API: {e}")
         else:
-            client=OpenAI(api_key=deepseek_key, base_url="https://api.deepseek.com")
+            client = _openai_client(deepseek_key, "https://api.deepseek.com")
             try:
                 response = client.chat.completions.create(
                     model=deepseek_model,
@@ -66,10 +135,7 @@ def call_with_messages(msgs, model_type:ModelType=ModelType.ALI, model_id=1, mod
                 print(f"Error calling deepseek API: {e}")
     # use alibaba key
     elif model_type == ModelType.ALI:
-        client = OpenAI(
-            api_key=config.get('dashscope_key'),
-            base_url="https://dashscope.aliyuncs.com/compatible-mode/v1"
-        )
+        client = _openai_client(config.get('dashscope_key'), "https://dashscope.aliyuncs.com/compatible-mode/v1")
         try:
             response = client.chat.completions.create(
                 model=dashscope_model if mode == 'text' else dashscope_vision_model,
@@ -85,9 +151,11 @@ def call_with_messages(msgs, model_type:ModelType=ModelType.ALI, model_id=1, mod
             "user_prompt": msgs[1].content,
             "system_prompt": msgs[0].content
         }
-        result = requests.post(url, json = input_msg)
-        # if result.status_code != HTTPStatus.OK:
-        #     return AIMessage(content="")
+        # a full backlog answers 429 with Retry-After, which the session's retry policy waits out
+        headers = {"X-Priority": priority} if priority else None
+        result = _session.post(url, json = input_msg, headers = headers)
+        if result.status_code != HTTPStatus.OK:
+            raise RuntimeError(f"LLM server {url} answered {result.status_code}: {result.text[:200]}")
         json_result = result.json()
         # if json_result['data'] is None:
         #     return AIMessage(content="")
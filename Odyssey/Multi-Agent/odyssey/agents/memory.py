@@ -230,7 +230,7 @@ class MemoryManager:
         system_message = SystemMessage(content=system_message_content)
         human_message = HumanMessage(content=self.render_latest_chat_log(count=50))
         self.messages = [system_message, human_message]
-        ai_message = call_with_messages(self.messages, model_type=self.model_type, dashscope_model=self.dashscope_model)
+        ai_message = call_with_messages(self.messages, model_type=self.model_type, dashscope_model=self.dashscope_model, priority='low')
         self.logger.info("LLM response content in chat log reading: " + ai_message.content)
         return ai_message.content
     
@@ -1,3 +1,4 @@
+import hashlib
 import os.path
 import time
 import warnings
@@ -54,6 +55,8 @@ class VoyagerEnv(gym.Env):
         self.reset_options = None
         self.connected = False
         self.server_paused = False
+        # hashes of program bundles the current mineflayer process already holds
+        self.registered_programs = set()
 
     def get_mineflayer_process(self, server_port):
         U.f_mkdir(self.log_path, "mineflayer")
@@ -88,6 +91,7 @@ class VoyagerEnv(gym.Env):
         retry = 0
         while not self.mineflayer.is_running:
             self.logger.info("Mineflayer process has exited, restarting")
+            self.registered_programs.clear()
             self.mineflayer.run()
             if not self.mineflayer.is_running:
                 if retry > 3:
@@ -108,6 +112,21 @@ class VoyagerEnv(gym.Env):
             return res.json()
 
 
+    def register_programs(self, programs: str) -> str:
+        """Upload a program bundle once per mineflayer session and return its hash."""
+        programs_hash = hashlib.sha256(programs.encode("utf-8")).hexdigest()
+        if programs_hash in self.registered_programs:
+            return programs_hash
+        res = requests.post(
+            f"{self.server}/programs",
+            json={"programsHash": programs_hash, "programs": programs},
+            timeout=self.request_timeout,
+        )
+        if res.status_code != 200:
+            raise RuntimeError(f"Register programs failed with code {res.status_code}")
+        self.registered_programs.add(programs_hash)
+        return programs_hash
+
     def step(
         self,
         code: str,
@@ -119,7 +138,7 @@ class VoyagerEnv(gym.Env):
         self.check_process()
         data = {
             "code": code,
-            "programs": programs,
+            "programsHash": self.register_programs(programs) if programs else None,
         }
         while retry > 0:
             try:
@@ -130,6 +149,14 @@ class VoyagerEnv(gym.Env):
                     if res.status_code == 200:
                         self.logger.debug(f'response:{res.json()}')
                         break
+                    elif res.status_code == 409:
+                        # mineflayer lost the bundle (restart or eviction), upload it again
+                        retry -= 1
+                        self.logger.warning(f"Programs {data['programsHash']} unknown to mineflayer, re-registering")
+                        self.registered_programs.discard(data["programsHash"])
+                        self.register_programs(programs)
+                        if retry == 0:
+                            raise RuntimeError("Step Minecraft server failed!")
                     else:
                         retry -= 1
                         self.logger.warning(f"Step Minecraft server failed, retrying")
@@ -1,6 +1,7 @@
 const fs = require("fs");
 const fsp = require("fs").promises;
 const path = require("path");
+const crypto = require("crypto");
 const express = require("express");
 const bodyParser = require("body-parser");
 const mineflayer = require("mineflayer");
@@ -26,6 +27,11 @@ let browser = null; // Stores the puppeteer browser instance
 let bot = null;
 let observeInterval = null;
 
+// Program bundles uploaded through /programs, keyed by the sha256 of their source.
+// Steps reference a bundle by hash so the library is only sent once per session.
+const MAX_REGISTERED_PROGRAMS = 64;
+const registeredPrograms = new Map();
+
 const app = express();
 
 app.use(bodyParser.json({ limit: "50mb" }));
@@ -348,7 +354,39 @@ async function writeObservationToFile(playerName, teamName, observation) {
     }
 }
 
+app.post("/programs", (req, res) => {
+    const programs = req.body.programs || "";
+    const programsHash = crypto
+        .createHash("sha256")
+        .update(programs, "utf8")
+        .digest("hex");
+    if (req.body.programsHash && req.body.programsHash !== programsHash) {
+        res.status(400).json({ error: "Programs hash mismatch", programsHash });
+        return;
+    }
+    // re-insert so the most recently used bundles are evicted last
+    registeredPrograms.delete(programsHash);
+    registeredPrograms.set(programsHash, programs);
+    while (registeredPrograms.size > MAX_REGISTERED_PROGRAMS) {
+        registeredPrograms.delete(registeredPrograms.keys().next().value);
+    }
+    res.json({ programsHash });
+});
+
 app.post("/step", async (req, res) => {
+    let programs = req.body.programs || "";
+    if (req.body.programsHash) {
+        if (!registeredPrograms.has(req.body.programsHash)) {
+            res.status(409).json({
+                error: "Unknown programs hash",
+                programsHash: req.body.programsHash,
+            });
+            return;
+        }
+        programs = registeredPrograms.get(req.body.programsHash);
+        registeredPrograms.delete(req.body.programsHash);
+        registeredPrograms.set(req.body.programsHash, programs);
+    }
     // import useful package
     let response_sent = false;
     function otherError(err) {
@@ -430,7 +468,6 @@ app.post("/step", async (req, res) => {
 
     // Retrieve array form post bod
     const code = req.body.code;
-    const programs = req.body.programs;
     bot.cumulativeObs = [];
     await bot.waitForTicks(bot.waitTicks);
     const r = await evaluateCode(code, programs);
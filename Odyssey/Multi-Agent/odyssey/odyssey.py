@@ -187,7 +187,7 @@ class Odyssey:
                 human_message = self.skill_manager.render_human_message(goal_str, self.cur_action, information)
                 self.messages = [system_message, human_message]
                 self.logger.info("obs in step:" + human_message.content)
-                ai_message = call_with_messages(self.messages, self.model_type, self.model_id)
+                ai_message = call_with_messages(self.messages, self.model_type, self.model_id, priority='high')
                 self.logger.success("LLM response content in step:" + ai_message.content)
                 self.memory_manager.update_action_memory(llm_str=ai_message.content)
                 # Parse JSON response
@@ -257,7 +257,7 @@ class Odyssey:
                     # Retry LLM call indefinitely until successful
                     while not self.exit_event.is_set():
                         try:
-                            ai_message = call_with_messages(self.messages, self.model_type, self.model_id)
+                            ai_message = call_with_messages(self.messages, self.model_type, self.model_id, priority='high')
                             self.logger.success("LLM response content in step:" + ai_message.content)
                             self.memory_manager.update_action_memory(llm_str=ai_message.content)
 
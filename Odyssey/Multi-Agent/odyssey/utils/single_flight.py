@@ -0,0 +1,164 @@
+"""
+Single-flight request coalescing.
+
+Concurrent calls with the same key share one execution: the first caller
+runs the function and every caller asking for the same key while it runs
+gets the same result (or exception). With a `lock_dir` this also holds
+across processes on one machine: the leader holds an flock on
+`<lock_dir>/<key>.lock` while it runs and writes its result to
+`<key>.json`; processes that found the lock taken wait for it and read the
+result back instead of repeating the call. Cross-process results must be
+JSON serialisable, and a `None` result is not shared across processes.
+Keys are computed by the caller with `request_key`.
+
+A synchronous cut of Odyssey's odyssey/utils/single_flight.py, which also
+coalesces coroutines; fixes to one belong in both.
+"""
+import fcntl
+import hashlib
+import json
+import os
+import threading
+import time
+
+__all__ = ["SingleFlight", "request_key"]
+
+
+def request_key(*parts):
+    return hashlib.sha256(json.dumps(parts, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self, lock_dir=None, result_ttl=120):
+        self.lock_dir = lock_dir
+        self.result_ttl = result_ttl
+        if lock_dir:
+            os.makedirs(lock_dir, exist_ok=True)
+        self.leaders = 0
+        self.shared = 0
+        self.shared_across_processes = 0
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._cleaned_at = 0
+
+    def stats(self):
+        return {
+            "leaders": self.leaders,
+            "shared": self.shared,
+            "shared_across_processes": self.shared_across_processes,
+        }
+
+    def do(self, key, fn):
+        """Run `fn()` once for all concurrent callers of `key` in this process (and beyond, with a lock_dir)."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            call.done.wait()
+            self.shared += 1
+            if call.error is not None:
+                raise call.error
+            return call.result
+        self.leaders += 1
+        try:
+            if self.lock_dir:
+                fp, shared = self._acquire(key, time.time())
+                try:
+                    call.result = shared[0] if shared else fn()
+                finally:
+                    self._release(fp, key, call.result, publish=not shared)
+            else:
+                call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def _paths(self, key):
+        return os.path.join(self.lock_dir, f"{key}.lock"), os.path.join(self.lock_dir, f"{key}.json")
+
+    @staticmethod
+    def _lock_file(lock_path, flags):
+        """Open and flock `lock_path`, again if `_clean` removed the file before the lock was taken."""
+        while True:
+            fp = open(lock_path, "a")
+            try:
+                fcntl.flock(fp, flags)
+            except BaseException:
+                fp.close()
+                raise
+            try:
+                if os.stat(lock_path).st_ino == os.fstat(fp.fileno()).st_ino:
+                    return fp
+            except FileNotFoundError:
+                pass
+            fcntl.flock(fp, fcntl.LOCK_UN)
+            fp.close()
+
+    def _acquire(self, key, started):
+        """Take the key's file lock. Returns (lock file, (result,) if another process just produced it)."""
+        lock_path, result_path = self._paths(key)
+        try:
+            return self._lock_file(lock_path, fcntl.LOCK_EX | fcntl.LOCK_NB), None
+        except BlockingIOError:
+            pass
+        # another process is running the same request, wait for it and take its result
+        fp = self._lock_file(lock_path, fcntl.LOCK_EX)
+        try:
+            with open(result_path, "r") as result_file:
+                entry = json.load(result_file)
+            if entry["time"] >= started:
+                self.shared_across_processes += 1
+                return fp, (entry["result"],)
+        except (OSError, ValueError, KeyError):
+            pass
+        return fp, None
+
+    def _release(self, fp, key, result, publish=True):
+        try:
+            if publish and result is not None:
+                _, result_path = self._paths(key)
+                tmp_path = f"{result_path}.{os.getpid()}.tmp"
+                with open(tmp_path, "w") as result_file:
+                    json.dump({"time": time.time(), "result": result}, result_file)
+                os.replace(tmp_path, result_path)
+        finally:
+            fcntl.flock(fp, fcntl.LOCK_UN)
+            fp.close()
+        self._clean()
+
+    def _clean(self):
+        # drop old lock and result files now and then, one pair is left per distinct request
+        now = time.time()
+        if now - self._cleaned_at < self.result_ttl:
+            return
+        self._cleaned_at = now
+        for entry in os.scandir(self.lock_dir):
+            try:
+                if now - entry.stat().st_mtime <= self.result_ttl:
+                    continue
+                if not entry.name.endswith(".lock"):
+                    os.remove(entry.path)
+                    continue
+                # a lock file is old whenever its key is, skip it while a leader still holds it
+                with open(entry.path, "a") as fp:
+                    try:
+                        fcntl.flock(fp, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except BlockingIOError:
+                        continue
+                    os.remove(entry.path)
+            except OSError:
+                pass
@@ -0,0 +1,58 @@
+"""
+Throughput benchmark for batched embedding.
+
+Embeds the skill descriptions in ./skill_library with the sentence model
+configured as SENTENT_EMBEDDING_DIR (or the model path given on the command
+line) three ways: one text per forward pass as the old reload loop did, one
+`embed_documents` call through BatchedEmbeddings, and concurrent single-text
+`embed_query` callers coalesced by BatchedEmbeddings. Pin the device with
+CUDA_VISIBLE_DEVICES="" to get CPU numbers.
+
+Run from the Odyssey directory:
+    python benchmarks/bench_embeddings.py [model_path] [threads]
+"""
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import odyssey.utils as U
+from odyssey.utils.embeddings import BatchedEmbeddings
+from langchain_community.embeddings.huggingface import HuggingFaceEmbeddings
+
+
+def throughput(fn, texts):
+    start = time.perf_counter()
+    fn(texts)
+    return len(texts) / (time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    model_path = sys.argv[1] if len(sys.argv) > 1 else U.config.get('SENTENT_EMBEDDING_DIR')
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    skills = U.load_json("skill_library/skill/skills.json")
+    texts = [entry['description'] for entry in skills.values()]
+
+    embeddings = HuggingFaceEmbeddings(model_name=model_path)
+    batched = BatchedEmbeddings(embeddings)
+    embeddings.embed_documents(texts[:8])  # warm up
+
+    def one_at_a_time(texts):
+        for text in texts:
+            embeddings.embed_documents([text])
+
+    def concurrent_queries(texts):
+        with ThreadPoolExecutor(threads) as pool:
+            list(pool.map(batched.embed_query, texts))
+
+    results = {
+        "one text per call": throughput(one_at_a_time, texts),
+        "batched embed_documents": throughput(batched.embed_documents, texts),
+        f"{threads} threads of embed_query": throughput(concurrent_queries, texts),
+    }
+    print(f"texts: {len(texts)}, model: {model_path}")
+    for name, texts_per_second in results.items():
+        print(f"{name:28s}: {texts_per_second:8.1f} texts/s")
+    print(f"{'forward passes (batched)':28s}: {batched.batches:8d}")
@@ -0,0 +1,128 @@
+"""
+Reset latency benchmark for VoyagerEnv.reset.
+
+Runs VoyagerEnv against a mock mineflayer process (this file with --serve)
+that SubprocessMonitor starts and stops like node index.js. The mock takes
+`startup` seconds before it listens, as node does loading mineflayer and its
+plugins, and `login` seconds in /start for the bot to connect and spawn;
+/start, /reset and /pause also wait their waitTicks (50 ms each), once per
+item handed out on a hard reset, like index.js, and /step twice. Compares:
+    restart   stop node, sleep 1 s, start node, /start (warm_reset=False, as before)
+    warm      /reset on the running process and bot
+for hard resets with an inventory and for soft resets. The startup and login
+times are assumptions about the real server, the rest is measured.
+
+Run from the Odyssey directory (the Timer logs of each reset are printed as well):
+    python benchmarks/bench_env_reset.py [resets] [startup_s] [login_s]
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+TICK = 0.05
+INVENTORY = {"oak_log": 4, "stone_pickaxe": 1, "bread": 8}
+
+
+class MockMineflayer(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    login = 1.5
+    bot = None  # connection key of the spawned bot
+    wait_ticks = 5
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        cls = type(self)
+        status = 200
+        response = [["observe", {"status": {}, "inventory": {}}]]
+        if self.path in ("/start", "/reset"):
+            key = f"{body['host']}:{body['port']}:{body['username']}"
+            if self.path == "/reset" and cls.bot != key:
+                status, response = 409, {"error": "No bot to reset, use /start"}
+            else:
+                if self.path == "/start":
+                    time.sleep(cls.login)
+                    cls.bot = key
+                cls.wait_ticks = body["waitTicks"]
+                item_ticks = 1 + len(body["inventory"]) if body["reset"] == "hard" else 1
+                time.sleep(cls.wait_ticks * item_ticks * TICK)
+                response = [["observe", {"status": {}, "inventory": body["inventory"]}]]
+        elif self.path == "/pause":
+            time.sleep(cls.wait_ticks * TICK)
+            response = {"message": "Success"}
+        elif self.path == "/step":
+            time.sleep(2 * cls.wait_ticks * TICK)
+        else:
+            response = {"message": "Bot stopped"}
+        data = json.dumps(response).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port, startup, login):
+    time.sleep(startup)
+    MockMineflayer.login = login
+    server = ThreadingHTTPServer(("127.0.0.1", port), MockMineflayer)
+    print(f"Server started on port {port}", flush=True)
+    server.serve_forever()
+
+
+def run(resets, warm, startup, login, log_path):
+    from odyssey.env.bridge import VoyagerEnv
+    from odyssey.env.process_monitor import SubprocessMonitor
+    import odyssey.utils as U
+
+    class MockEnv(VoyagerEnv):
+        def get_mineflayer_process(self, server_port):
+            U.f_mkdir(self.log_path, "mineflayer")
+            return SubprocessMonitor(
+                commands=[sys.executable, os.path.abspath(__file__), "--serve", str(server_port), str(startup), str(login)],
+                name="mineflayer",
+                ready_match=r"Server started on port (\d+)",
+                log_path=U.f_join(self.log_path, "mineflayer"),
+            )
+
+    env = MockEnv(mc_port=25565, server_port=3017, log_path=log_path, warm_reset=warm)
+    results = {}
+    try:
+        # the first reset always starts the process
+        env.reset(options={"mode": "hard", "wait_ticks": 5})
+        for name, options in (
+            ("hard", {"mode": "hard", "wait_ticks": 5, "inventory": INVENTORY}),
+            ("soft", {"mode": "soft", "wait_ticks": 5}),
+        ):
+            start = time.perf_counter()
+            for _ in range(resets):
+                events = env.reset(options=options)
+                assert events[-1][1]["inventory"] == options.get("inventory", {})
+            results[name] = (time.perf_counter() - start) / resets
+    finally:
+        env.close()
+    return results
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ["--serve"]:
+        serve(int(sys.argv[2]), float(sys.argv[3]), float(sys.argv[4]))
+        sys.exit()
+    resets = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    startup = float(sys.argv[2]) if len(sys.argv) > 2 else 1.0
+    login = float(sys.argv[3]) if len(sys.argv) > 3 else 1.5
+    print(f"resets: {resets}, assumed node startup: {startup:.1f} s, assumed login: {login:.1f} s")
+    with tempfile.TemporaryDirectory() as log_path:
+        restart = run(resets, False, startup, login, log_path)
+        warm = run(resets, True, startup, login, log_path)
+    for name in ("hard", "soft"):
+        print(f"{name} reset: restart {restart[name] * 1e3:7.0f} ms, warm {warm[name] * 1e3:7.0f} ms "
+              f"({restart[name] / warm[name]:.1f}x)")
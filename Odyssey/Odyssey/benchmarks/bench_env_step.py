@@ -0,0 +1,125 @@
+"""
+Per-step overhead benchmark for VoyagerEnv.step.
+
+Runs VoyagerEnv against a local mock of the mineflayer HTTP server that
+keeps the server's pause toggle and waits `waitTicks` game ticks (50 ms each)
+where index.js does: after a /pause, before and after the step code, and
+before answering a togglePause step. The step code itself takes no time, so
+each figure is pure protocol overhead. Three configurations:
+    separate, no keep-alive   unpause, step, pause; a new connection per request (as before)
+    separate, keep-alive      the same three requests over the env's session
+    fused                     one /step with togglePause over the session
+The mock also checks that every step ran unpaused and left the server paused.
+
+Run from the Odyssey directory (the per-step Timer logs are printed as well):
+    python benchmarks/bench_env_step.py [steps] [wait_ticks]
+"""
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from odyssey.env.bridge import VoyagerEnv
+
+TICK = 0.05
+
+
+class MockMineflayer(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    wait_ticks = 5
+    keep_alive = True
+    paused = True
+    steps_run_paused = 0
+    steps_left_unpaused = 0
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        cls = type(self)
+        wait = cls.wait_ticks * TICK
+        headers = {}
+        if self.path == "/pause":
+            cls.paused = not cls.paused
+            time.sleep(wait)
+            response = {"message": "Success"}
+        elif self.path == "/step":
+            toggle = body.get("togglePause")
+            if toggle:
+                cls.paused = not cls.paused
+            time.sleep(wait)
+            cls.steps_run_paused += cls.paused
+            time.sleep(wait)
+            if toggle:
+                cls.paused = not cls.paused
+                time.sleep(wait)
+                headers["X-Paused"] = "1"
+            response = json.dumps([["observe", {"status": {}}]])
+        elif self.path == "/start":
+            response = json.dumps([["observe", {"status": {}}]])
+        else:
+            response = {}
+        data = json.dumps(response).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        if not cls.keep_alive:
+            self.send_header("Connection", "close")
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class RunningMineflayer:
+    """Stands in for the node process, which the mock server replaces."""
+    is_running = True
+
+    def stop(self):
+        pass
+
+
+def run(steps, fused, keep_alive, log_path):
+    MockMineflayer.keep_alive = keep_alive
+    MockMineflayer.paused = True
+    MockMineflayer.steps_run_paused = 0
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MockMineflayer)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    env = VoyagerEnv(mc_port=25565, server_port=server.server_address[1], log_path=log_path, fused_step=fused)
+    env.logger.setLevel("WARNING")
+    env.mineflayer = RunningMineflayer()
+    env.has_reset = True
+    env.server_paused = True
+    start = time.perf_counter()
+    for _ in range(steps):
+        env.step("await bot.chat('hi');")
+        MockMineflayer.steps_left_unpaused += not MockMineflayer.paused
+    elapsed = (time.perf_counter() - start) / steps
+    server.shutdown()
+    return elapsed
+
+
+if __name__ == '__main__':
+    steps = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    MockMineflayer.wait_ticks = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    step_ticks = 2 * MockMineflayer.wait_ticks * TICK
+    print(f"steps: {steps}, waitTicks: {MockMineflayer.wait_ticks} "
+          f"({step_ticks * 1e3:.0f} ms of the step is its own waitTicks)")
+    with tempfile.TemporaryDirectory() as log_path:
+        for name, fused, keep_alive in (
+            ("separate, no keep-alive", False, False),
+            ("separate, keep-alive", False, True),
+            ("fused", True, True),
+        ):
+            MockMineflayer.steps_left_unpaused = 0
+            per_step = run(steps, fused, keep_alive, log_path)
+            print(f"{name:24s}: {per_step * 1e3:7.1f} ms/step, {(per_step - step_ticks) * 1e3:7.1f} ms overhead"
+                  f" (ran paused: {MockMineflayer.steps_run_paused}, left unpaused: {MockMineflayer.steps_left_unpaused})")
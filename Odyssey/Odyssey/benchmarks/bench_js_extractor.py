@@ -0,0 +1,62 @@
+"""
+Micro-benchmark for the JavaScript function extractor.
+
+Times `extract_functions` against the Babel round-trip it replaces on every
+skill in ./skill_library and checks that both agree on the name, type and
+params of each top-level function. The Babel side needs @babel/core and
+@babel/generator installed for the javascript bridge; without them only the
+Python extractor is timed.
+
+Run from the Odyssey directory:
+    python benchmarks/bench_js_extractor.py [iterations]
+"""
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import odyssey.utils as U
+from odyssey.utils.js_utils import extract_functions, babel_extract_functions
+
+
+def signature(functions):
+    return [(f["name"], f["type"], f["params"]) for f in functions]
+
+
+def time_per_source(fn, sources, iterations):
+    timings = []
+    for source in sources:
+        start = time.perf_counter()
+        for _ in range(iterations):
+            fn(source)
+        timings.append((time.perf_counter() - start) / iterations)
+    return timings
+
+
+if __name__ == '__main__':
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    skills = U.load_json("skill_library/skill/skills.json")
+    sources = [entry['code'] for entry in skills.values()]
+
+    results = {"python": time_per_source(extract_functions, sources, iterations)}
+    try:
+        babel_extract_functions(sources[0])
+    except Exception as e:
+        print(f"babel unavailable, timing the python extractor only ({e.__class__.__name__})")
+    else:
+        mismatches = [
+            i for i, source in enumerate(sources)
+            if signature(extract_functions(source)) != signature(babel_extract_functions(source))
+        ]
+        print(f"parity: {len(sources) - len(mismatches)}/{len(sources)} sources match")
+        results["babel"] = time_per_source(babel_extract_functions, sources, max(1, iterations // 10))
+
+    print(f"sources: {len(sources)}, iterations: {iterations}")
+    for name, timings in results.items():
+        print(f"{name:8s}: median {statistics.median(timings) * 1e3:8.3f} ms, "
+              f"max {max(timings) * 1e3:8.3f} ms, total {sum(timings) * 1e3:8.1f} ms")
+    if "babel" in results:
+        speedup = statistics.median(results["babel"]) / statistics.median(results["python"])
+        print(f"{'speedup':8s}: {speedup:8.1f}x")
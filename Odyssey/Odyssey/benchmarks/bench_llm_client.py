@@ -0,0 +1,76 @@
+"""
+Throughput benchmark for the LLM client in odyssey/agents/llama.py.
+
+Starts a local mock of the Gemini generateContent endpoint that answers
+after a fixed delay, points the client at it through GEMINI_BASE_URL and
+measures requests per second with 1, 8 and 32 requests in flight through
+acall_with_messages. 1 in flight is what the blocking call_with_messages
+gave every bot before.
+
+Run from the Odyssey directory:
+    python benchmarks/bench_llm_client.py [requests] [latency_ms]
+"""
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class MockGemini(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    latency = 0.2
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        time.sleep(self.latency)
+        body = json.dumps({
+            "candidates": [{"content": {"role": "model", "parts": [{"text": "{\"success\": true}"}]}, "finishReason": "STOP"}]
+        }).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_mock_server(latency):
+    MockGemini.latency = latency
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MockGemini)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+if __name__ == '__main__':
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    latency = float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0.2
+    os.environ["GEMINI_BASE_URL"] = start_mock_server(latency)
+    os.environ.setdefault("GEMINI_API_KEY", "mock")
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+    from langchain.schema import HumanMessage, SystemMessage
+    from odyssey.agents.llama import acall_with_messages, call_with_messages
+
+    messages = [SystemMessage(content="You are a critic."), HumanMessage(content="Did the bot succeed?")]
+    call_with_messages(messages)  # open the connection pool
+
+    async def run(in_flight):
+        semaphore = asyncio.Semaphore(in_flight)
+
+        async def one():
+            async with semaphore:
+                return await acall_with_messages(messages)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(requests)))
+        return requests / (time.perf_counter() - start)
+
+    print(f"requests: {requests}, mock latency: {latency * 1e3:.0f} ms")
+    for in_flight in (1, 8, 32):
+        print(f"{in_flight:3d} in flight: {asyncio.run(run(in_flight)):8.1f} req/s")
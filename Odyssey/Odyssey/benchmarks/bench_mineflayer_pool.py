@@ -0,0 +1,111 @@
+"""
+Benchmark of leasing mineflayer processes from a MineflayerPool.
+
+Uses the mock mineflayer process of bench_env_reset.py, which takes
+`startup` seconds before it listens (node loading mineflayer and its
+plugins) and `login` seconds in /start. Measures, with and without a pool of
+pre-started processes:
+    new bot     VoyagerEnv() and its first reset
+    crash       the process is killed, the next step brings up another one
+    restart     a full reset (warm_reset=False)
+The pool is given time to refill between rounds, as between the episodes of
+a run. The startup and login times are assumptions, the rest is measured.
+
+Run from the Odyssey directory (the Timer logs are printed as well):
+    python benchmarks/bench_mineflayer_pool.py [rounds] [startup_s] [login_s]
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import odyssey.utils as U
+from odyssey.env import MineflayerPool, VoyagerEnv
+from odyssey.env.process_monitor import SubprocessMonitor
+
+MOCK = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_env_reset.py")
+OPTIONS = {"mode": "hard", "wait_ticks": 5}
+
+
+def mock_commands(port, startup, login):
+    return [sys.executable, MOCK, "--serve", str(port), str(startup), str(login)]
+
+
+class MockPool(MineflayerPool):
+    startup = 1.0
+    login = 1.5
+
+    def get_mineflayer_process(self, port):
+        process = SubprocessMonitor(
+            commands=mock_commands(port, self.startup, self.login),
+            name=f"mineflayer-{port}",
+            ready_match=r"Server started on port (\d+)",
+            log_path=U.f_join(self.log_path, "mineflayer"),
+        )
+        process.port = port
+        return process
+
+
+class MockEnv(VoyagerEnv):
+    startup = 1.0
+    login = 1.5
+
+    def get_mineflayer_process(self, server_port):
+        U.f_mkdir(self.log_path, "mineflayer")
+        return SubprocessMonitor(
+            commands=mock_commands(server_port, self.startup, self.login),
+            name="mineflayer",
+            ready_match=r"Server started on port (\d+)",
+            log_path=U.f_join(self.log_path, "mineflayer"),
+        )
+
+
+def wait_full(pool):
+    while pool is not None and pool.stats()["idle"] < pool.size:
+        time.sleep(0.05)
+
+
+def run(rounds, pool, log_path):
+    times = {"new bot": 0.0, "crash": 0.0, "restart": 0.0}
+    for _ in range(rounds):
+        wait_full(pool)
+        start = time.perf_counter()
+        env = MockEnv(mc_port=25565, server_port=3027, log_path=log_path, warm_reset=False, mineflayer_pool=pool)
+        env.reset(options=OPTIONS)
+        times["new bot"] += time.perf_counter() - start
+        try:
+            wait_full(pool)
+            env.mineflayer.process.kill()
+            env.mineflayer.process.wait()
+            start = time.perf_counter()
+            env.step("")
+            times["crash"] += time.perf_counter() - start
+
+            wait_full(pool)
+            start = time.perf_counter()
+            env.reset(options=OPTIONS)
+            times["restart"] += time.perf_counter() - start
+        finally:
+            env.close()
+    return {name: total / rounds for name, total in times.items()}
+
+
+if __name__ == '__main__':
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    MockEnv.startup = MockPool.startup = float(sys.argv[2]) if len(sys.argv) > 2 else 1.0
+    MockEnv.login = MockPool.login = float(sys.argv[3]) if len(sys.argv) > 3 else 1.5
+    print(f"rounds: {rounds}, assumed node startup: {MockEnv.startup:.1f} s, assumed login: {MockEnv.login:.1f} s")
+    with tempfile.TemporaryDirectory() as log_path:
+        without = run(rounds, None, log_path)
+        pool = MockPool(size=2, ports=range(3100, 3110), log_path=log_path)
+        try:
+            pooled = run(rounds, pool, log_path)
+            stats = pool.stats()
+        finally:
+            pool.close()
+    for name in without:
+        print(f"{name:8s}: own process {without[name] * 1e3:7.0f} ms, pool {pooled[name] * 1e3:7.0f} ms "
+              f"({without[name] / pooled[name]:.1f}x)")
+    print(f"pool: {stats}")
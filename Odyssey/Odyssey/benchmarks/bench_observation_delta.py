@@ -0,0 +1,179 @@
+"""
+Delta observation benchmark.
+
+Encodes a run of consecutive steps with mineflayer/observationDelta.js (run
+through node, which must be on the PATH) the way /step does with
+observationDelta, each step against the last event of the one before, and
+compares on the client:
+    full     the events JSON, decoded and deep-copied into last_events (as before)
+    delta    the patches JSON, decoded and materialised by VoyagerEnv
+Every materialised step is checked against the original events, key order
+included. Like mineflayer, every event carries the whole observation
+(status, inventory, voxels, blockRecords, nearbyChests) next to its own
+field. The steps are synthetic: a bot walking, mining and crafting, with
+chat and save events in between.
+
+Run from the Odyssey directory:
+    python benchmarks/bench_observation_delta.py [steps] [events_per_step]
+"""
+import copy
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from odyssey.env.bridge import VoyagerEnv
+
+DELTA_JS = os.path.join(os.path.dirname(__file__), '..', 'odyssey', 'env', 'mineflayer', 'observationDelta.js')
+ENCODE_SCRIPT = """
+const { encodeEvents } = require(process.argv[1]);
+const steps = JSON.parse(require("fs").readFileSync(0, "utf8"));
+let base = {};
+const encoded = steps.map((events) => {
+    const patches = encodeEvents(base, events);
+    if (events.length) base = events[events.length - 1][1];
+    return JSON.stringify(patches);
+});
+process.stdout.write(JSON.stringify(encoded));
+"""
+
+BLOCKS = ["stone", "dirt", "grass_block", "oak_log", "oak_leaves", "coal_ore", "iron_ore", "water", "sand", "gravel"]
+ITEMS = ["oak_log", "oak_planks", "stick", "cobblestone", "coal", "raw_iron", "crafting_table", "wooden_pickaxe",
+         "stone_pickaxe", "furnace", "torch", "dirt"]
+MOBS = ["zombie", "cow", "sheep", "creeper", "pig", "skeleton", "chicken"]
+
+
+class World:
+    """The bot's state, drifting a little with every event."""
+
+    def __init__(self, seed):
+        self.rng = random.Random(seed)
+        self.position = {"x": 112.5, "y": 64.0, "z": -231.5}
+        self.inventory = {item: self.rng.randint(1, 16) for item in ITEMS[:5]}
+        self.entities = {mob: round(self.rng.uniform(4, 32), 2) for mob in self.rng.sample(MOBS, 4)}
+        self.voxels = self.rng.sample(BLOCKS, 6)
+        self.block_records = [self.rng.choice(BLOCKS) for _ in range(40)]
+        self.chests = {f"({self.rng.randint(-200, 200)}, 64, {self.rng.randint(-200, 200)})": {
+            item: self.rng.randint(1, 64) for item in self.rng.sample(ITEMS, 4)} for _ in range(6)}
+        self.elapsed = 0
+        self.food = 20
+
+    def advance(self):
+        rng = self.rng
+        self.position = {key: round(value + rng.uniform(-1.5, 1.5), 3) if key != "y" else value
+                         for key, value in self.position.items()}
+        self.elapsed += rng.randint(10, 60)
+        self.entities = {mob: round(distance + rng.uniform(-1, 1), 2) for mob, distance in self.entities.items()}
+        if rng.random() < 0.3:
+            item = rng.choice(ITEMS)
+            self.inventory[item] = self.inventory.get(item, 0) + rng.randint(1, 4)
+        if rng.random() < 0.1 and len(self.inventory) > 3:
+            del self.inventory[rng.choice(list(self.inventory))]
+        if rng.random() < 0.2:
+            self.voxels[rng.randrange(len(self.voxels))] = rng.choice(BLOCKS)
+        if rng.random() < 0.3:
+            self.block_records = self.block_records[1:] + [rng.choice(BLOCKS)]
+        if rng.random() < 0.05:
+            self.food = max(0, self.food - 1)
+
+    def observation(self):
+        return {
+            "voxels": list(self.voxels),
+            "status": {
+                "health": 20.0,
+                "food": self.food,
+                "saturation": 3.6,
+                "oxygen": 20,
+                "position": dict(self.position),
+                "velocity": {"x": 0.0, "y": -0.0784000015258789, "z": 0.0},
+                "yaw": round(self.rng.uniform(-3.14, 3.14), 3),
+                "pitch": 0.0,
+                "onGround": True,
+                "equipment": ["iron_helmet", None, None, None, "wooden_pickaxe", "shield"],
+                "name": "bot",
+                "timeSinceOnGround": 0,
+                "isInWater": False,
+                "isInLava": False,
+                "isCollidedHorizontally": False,
+                "isCollidedVertically": True,
+                "biome": "plains",
+                "entities": dict(self.entities),
+                "timeOfDay": "day",
+                "inventoryUsed": len(self.inventory),
+                "elapsedTime": self.elapsed,
+            },
+            "inventory": dict(self.inventory),
+            "nearbyChests": copy.deepcopy(self.chests),
+            "blockRecords": list(self.block_records),
+        }
+
+    def step(self, events_per_step):
+        events = []
+        for _ in range(events_per_step - 1):
+            self.advance()
+            event_type = self.rng.choice(["onChat", "onChat", "onSave"])
+            message = f"Collected {self.rng.randint(1, 8)} {self.rng.choice(BLOCKS)}" if event_type == "onChat" \
+                else f"{self.rng.choice(BLOCKS)}_placed"
+            events.append([event_type, {event_type: message, **self.observation()}])
+        events.append(["observe", self.observation()])
+        return events
+
+
+def key_order(value):
+    # numbers are compared by value, JavaScript writes 20.0 as 20
+    if isinstance(value, dict):
+        return [(key, key_order(item)) for key, item in value.items()]
+    if isinstance(value, list):
+        return [key_order(item) for item in value]
+    return None
+
+
+def encode(steps):
+    result = subprocess.run(["node", "-e", ENCODE_SCRIPT, os.path.abspath(DELTA_JS)],
+                            input=json.dumps(steps), capture_output=True, text=True, check=True)
+    return json.loads(result.stdout)
+
+
+def main(n_steps, events_per_step):
+    world = World(0)
+    steps = [world.step(events_per_step) for _ in range(n_steps)]
+    full = [json.dumps(events, separators=(",", ":")).encode("utf-8") for events in steps]
+    deltas = encode(steps)
+    frames = [
+        json.dumps(
+            {"session": "bench", "seq": seq, "base": seq - 1 if seq > 1 else None, "events": json.loads(patches)},
+            separators=(",", ":"),
+        ).encode("utf-8")
+        for seq, patches in enumerate(deltas, 1)
+    ]
+    env = VoyagerEnv(mc_port=25565, log_path=os.path.join("logs", "bench_observation_delta"))
+
+    start = time.perf_counter()
+    for content in full:
+        copy.deepcopy(json.loads(content))
+    full_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    materialised = [env.materialize_observation(json.loads(content)) for content in frames]
+    delta_time = time.perf_counter() - start
+
+    for events, rebuilt in zip(steps, materialised):
+        assert rebuilt == events and key_order(rebuilt) == key_order(events), "materialised events differ"
+    full_size = sum(map(len, full)) / n_steps
+    delta_size = sum(map(len, frames)) / n_steps
+    print(f"{n_steps} steps of {events_per_step} events, both decoded with the json module")
+    print(f"{'':<8}{'bytes/step':>12}{'client ms/step':>16}")
+    print(f"{'full':<8}{full_size:>12.0f}{full_time / n_steps * 1e3:>16.3f}")
+    print(f"{'delta':<8}{delta_size:>12.0f}{delta_time / n_steps * 1e3:>16.3f}")
+    print(f"size {full_size / delta_size:.1f}x smaller, client {full_time / delta_time:.1f}x faster, all steps identical")
+
+
+if __name__ == '__main__':
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 200,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 8,
+    )
@@ -0,0 +1,142 @@
+"""
+Wire format benchmark for the observations mineflayer returns from /step.
+
+Encodes one step's events the way each server mode sends them and decodes
+them with bridge.decode_observation, as VoyagerEnv.step does:
+    legacy    res.json(bot.observe()), the events JSON wrapped in a JSON string
+    json      the events JSON as is (Accept: application/json)
+    msgpack   the events as MessagePack (Accept: application/msgpack)
+JSON responses are decoded with orjson when it is installed and with the json
+module otherwise; both are reported, relative to legacy with json as
+VoyagerEnv decoded it before. Every decode is checked against the
+original events. The events come from a directory of saved events (the
+ckpt/events of a run, one JSON file per step) or, without one, from a
+synthetic step with chat lines, an error and a full observe event.
+
+Run from the Odyssey directory:
+    python benchmarks/bench_observation_wire.py [events_dir] [repeats]
+"""
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import odyssey.utils as U
+from odyssey.env import bridge
+
+
+class Response:
+    """The parts of a requests.Response that decode_observation reads."""
+
+    def __init__(self, content, content_type):
+        self.content = content
+        self.headers = {"Content-Type": content_type}
+
+
+def synthetic_events(seed=0):
+    rng = random.Random(seed)
+    blocks = ["stone", "dirt", "grass_block", "oak_log", "oak_leaves", "coal_ore", "iron_ore", "water", "sand"]
+    items = ["oak_log", "oak_planks", "stick", "cobblestone", "coal", "raw_iron", "crafting_table", "wooden_pickaxe"]
+    events = [["onChat", {"onChat": f"Collected {rng.randint(1, 8)} {rng.choice(blocks)}"}] for _ in range(12)]
+    events.append(["onError", {"onError": "Error: No path to the target! Context: mineBlock(bot, 'iron_ore', 3)"}])
+    events.append(["observe", {
+        "voxels": rng.sample(blocks, 6),
+        "blockRecords": [rng.choice(blocks) for _ in range(40)],
+        "status": {
+            "health": 20.0,
+            "food": 17,
+            "saturation": 3.6,
+            "oxygen": 20,
+            "position": {"x": 112.5, "y": 64.0, "z": -231.5},
+            "velocity": {"x": 0.0, "y": -0.0784000015258789, "z": 0.0},
+            "yaw": 3.14,
+            "pitch": 0.0,
+            "onGround": True,
+            "equipment": ["iron_helmet", None, None, None, "wooden_pickaxe", "shield"],
+            "name": "bot",
+            "timeSinceOnGround": 0,
+            "isInWater": False,
+            "isInLava": False,
+            "isCollidedHorizontally": False,
+            "isCollidedVertically": True,
+            "biome": "plains",
+            "entities": {rng.choice(["zombie", "cow", "sheep", "creeper", "pig"]) + str(i): round(rng.uniform(2, 32), 2)
+                         for i in range(10)},
+            "timeOfDay": "day",
+            "inventoryUsed": len(items),
+            "elapsedTime": 1240,
+        },
+        "inventory": {item: rng.randint(1, 64) for item in items},
+        "nearbyChests": {f"({rng.randint(-200, 200)}, 64, {rng.randint(-200, 200)})": {
+            item: rng.randint(1, 64) for item in rng.sample(items, 4)} for _ in range(6)},
+    }])
+    return events
+
+
+def load_events(events_dir):
+    steps = []
+    for name in sorted(os.listdir(events_dir)):
+        path = os.path.join(events_dir, name)
+        if os.path.isfile(path):
+            steps.append(U.load_json(path))
+    return steps
+
+
+def encodings(events):
+    events_json = json.dumps(events, separators=(",", ":"))
+    formats = {
+        "legacy": (json.dumps(events_json).encode("utf-8"), "application/json; charset=utf-8"),
+        "json": (events_json.encode("utf-8"), "application/json; charset=utf-8"),
+    }
+    if bridge.msgpack is not None:
+        formats["msgpack"] = (bridge.msgpack.packb(events), "application/msgpack")
+    return formats
+
+
+def measure(steps, repeats):
+    decoders = [("orjson", bridge.orjson), ("json", None)] if bridge.orjson is not None else [("json", None)]
+    results = {}
+    for decoder, module in decoders:
+        bridge.orjson = module
+        for name in ("legacy", "json", "msgpack"):
+            if name == "msgpack" and decoder != decoders[0][0]:
+                continue  # JSON decoder does not matter for MessagePack
+            size = 0
+            elapsed = 0.0
+            for events in steps:
+                formats = encodings(events)
+                if name not in formats:
+                    break
+                content, content_type = formats[name]
+                response = Response(content, content_type)
+                assert bridge.decode_observation(response) == events, f"{name} decode differs"
+                start = time.perf_counter()
+                for _ in range(repeats):
+                    bridge.decode_observation(response)
+                elapsed += time.perf_counter() - start
+                size += len(content)
+            else:
+                label = name if name == "msgpack" else f"{name} ({decoder})"
+                results[label] = (size / len(steps), elapsed / repeats / len(steps) * 1e6)
+    bridge.orjson = decoders[0][1]
+    return results
+
+
+if __name__ == '__main__':
+    events_dir = sys.argv[1] if len(sys.argv) > 1 else None
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    steps = load_events(events_dir) if events_dir else [synthetic_events(seed) for seed in range(8)]
+    if not steps:
+        sys.exit(f"no events in {events_dir}")
+    print(f"{len(steps)} steps from {events_dir or 'synthetic events'}, {repeats} decodes each")
+    if bridge.msgpack is None:
+        print("msgpack is not installed, skipping it")
+    results = measure(steps, repeats)
+    # VoyagerEnv decoded the legacy responses with the json module before
+    base_size, base_time = results["legacy (json)"]
+    print(f"{'format':<18}{'bytes/step':>12}{'decode us':>12}{'vs legacy':>12}")
+    for label, (size, decode_us) in results.items():
+        print(f"{label:<18}{size:>12.0f}{decode_us:>12.1f}{base_time / decode_us:>11.2f}x")
@@ -0,0 +1,80 @@
+"""
+Micro-benchmark for SkillManager.programs.
+
+Compares the per-step cost of the original `+=` assembly with the memoized
+bundle on the skill library in ./skill_library (183 skills). The per-step
+figures include the content hash VoyagerEnv computes before /step, which the
+memoized bundle lets the env skip.
+
+Run from the Odyssey directory:
+    python benchmarks/bench_skill_programs.py [iterations]
+"""
+import hashlib
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import odyssey.utils as U
+from odyssey.agents.skill import SkillManager
+from odyssey.utils.logger import get_logger
+
+
+def legacy_programs(manager):
+    programs = ""
+    for skill_name, entry in manager.skills.items():
+        programs += f"{entry['code']}\n\n"
+    for primitives in manager.control_primitives:
+        programs += f"{primitives}\n\n"
+    for skill_primitive in manager.skill_primitives:
+        programs += f"{skill_primitive}\n\n"
+    return programs
+
+
+class ProgramsHasher:
+    """Same identity shortcut as VoyagerEnv.register_programs."""
+    def __init__(self):
+        self.last_programs = None
+        self.last_hash = None
+
+    def __call__(self, programs):
+        if programs is not self.last_programs:
+            self.last_programs = programs
+            self.last_hash = hashlib.sha256(programs.encode("utf-8")).hexdigest()
+        return self.last_hash
+
+
+def timeit(fn, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations
+
+
+if __name__ == '__main__':
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    # only the program bundle is needed, skip the vectordb setup in __init__
+    manager = SkillManager.__new__(SkillManager)
+    manager.logger = get_logger("SkillManager")
+    manager.skill_lib = "old"
+    manager.primitive_check_interval = 1.0
+    manager.skills = U.load_json("skill_library/skill/skills.json")
+    manager.load_programs()
+    assert manager.programs == legacy_programs(manager)
+
+    legacy_hasher, hasher = ProgramsHasher(), ProgramsHasher()
+    results = {
+        "legacy assembly": timeit(lambda: legacy_programs(manager), iterations),
+        "legacy step (assembly + hash)": timeit(lambda: legacy_hasher(legacy_programs(manager)), iterations),
+        "memoized cold (cache cleared)": timeit(lambda: manager._programs_cache.clear() or manager.programs, iterations),
+        "memoized warm": timeit(lambda: manager.programs, iterations),
+        "memoized step (warm + hash)": timeit(lambda: hasher(manager.programs), iterations),
+        "primitive mtime sweep": timeit(manager.get_primitive_mtimes, iterations),
+    }
+
+    print(f"skills: {len(manager.skills)}, bundle size: {len(manager.programs) / 1024:.1f} KB, iterations: {iterations}")
+    for name, seconds in results.items():
+        print(f"{name:32s}: {seconds * 1e6:10.1f} us")
+    speedup = results["legacy step (assembly + hash)"] / results["memoized step (warm + hash)"]
+    print(f"{'per-step speedup':32s}: {speedup:10.1f}x")
@@ -0,0 +1,71 @@
+"""
+Retrieval benchmark for SkillManager.retrieve_skills.
+
+Compares the pure embedding search (lexical_weight=0, no exact-match
+shortcut) with the hybrid lexical + vector retrieval on two query sets built
+from ./skill_library:
+    task queries         "How to craft iron pickaxe in Minecraft?" for craftIronPickaxe
+    description queries  the first sentence of each description, skill name removed
+and reports top-k hit rate (the source skill is among the k retrieved) and
+mean latency per query. Needs the sentence model configured as
+SENTENT_EMBEDDING_DIR (or given on the command line); the first run publishes
+the library index if it is missing.
+
+Run from the Odyssey directory:
+    python benchmarks/bench_skill_retrieval.py [model_path] [lexical_weight]
+"""
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import odyssey.utils as U
+from odyssey.agents.skill import SkillManager
+
+
+def task_query(name):
+    words = re.findall(r"[A-Z]?[a-z]+|[A-Z]+(?![a-z])|\d+", name)
+    return f"How to {' '.join(word.lower() for word in words)} in Minecraft?"
+
+
+def description_query(name, description):
+    description = description.split("Description:", 1)[-1]
+    sentence = re.split(r"(?<=\.)\s", description.strip(), maxsplit=1)[0]
+    return sentence.replace(name, "it")
+
+
+def evaluate(manager, queries):
+    hits = 0
+    start = time.perf_counter()
+    for name, query in queries:
+        code, _ = manager.retrieve_skills(query)
+        hits += any(manager.skills[name]["code"] == c for c in code)
+    return hits / len(queries), (time.perf_counter() - start) / len(queries)
+
+
+if __name__ == '__main__':
+    model_path = sys.argv[1] if len(sys.argv) > 1 else U.config.get('SENTENT_EMBEDDING_DIR')
+    lexical_weight = float(sys.argv[2]) if len(sys.argv) > 2 else 0.3
+    manager = SkillManager(ckpt_dir="skill_library", resume=True, embedding_model=model_path)
+    manager.logger.setLevel("WARNING")
+    query_sets = {
+        "task": [(name, task_query(name)) for name in manager.skills],
+        "description": [
+            (name, description_query(name, entry["description"])) for name, entry in manager.skills.items()
+        ],
+    }
+    manager.retrieve_skills(query_sets["task"][0][1])  # warm up the model
+
+    configs = {
+        "vector": (0.0, False),
+        f"hybrid (w={lexical_weight})": (lexical_weight, True),
+    }
+    print(f"skills: {len(manager.skills)}, top-k: {manager.retrieval_top_k}")
+    for config_name, (weight, exact_match_first) in configs.items():
+        manager.lexical_weight = weight
+        manager.exact_match_first = exact_match_first
+        for set_name, queries in query_sets.items():
+            hit_rate, latency = evaluate(manager, queries)
+            print(f"{config_name:18s} {set_name:12s}: hit rate {hit_rate * 100:5.1f}%, {latency * 1e3:7.2f} ms/query")
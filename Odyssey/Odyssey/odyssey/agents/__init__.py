@@ -3,4 +3,4 @@ from .critic import CriticAgent
 from .comment import CommentAgent
 from .planner import PlannerAgent
 from .skill import SkillManager
-from .llama import call_with_messages
\ No newline at end of file
+from .llama import call_with_messages, acall_with_messages
\ No newline at end of file
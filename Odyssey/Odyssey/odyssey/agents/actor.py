@@ -3,7 +3,7 @@ import time
 
 import odyssey.utils as U
 from odyssey.utils.json_utils import fix_and_parse_json
-from javascript import require
+from odyssey.utils.js_utils import extract_program
 from langchain.schema import AIMessage, HumanMessage, SystemMessage
 
 from odyssey.prompts import load_prompt
@@ -141,9 +141,6 @@ class ActionAgent:
         error = None
         while retry > 0:
             try:
-                babel = require("@babel/core")
-                babel_generator = require("@babel/generator").default
-
                 code_pattern = re.compile(r"{(.*?)}", re.DOTALL)
                 code_name = "".join(code_pattern.findall(message.content)[0])
                 action = "{" + code_name + "}"
@@ -155,43 +152,14 @@ class ActionAgent:
                 code = [c for c in skills if code_name in c]
                 if len(code) == 0:
                     code = [skills[0]]
-                parsed = babel.parse(code[0])
-                functions = []
-                assert len(list(parsed.program.body)) > 0, "No functions found"
-                for i, node in enumerate(parsed.program.body):
-                    if node.type != "FunctionDeclaration":
-                        continue
-                    node_type = (
-                        "AsyncFunctionDeclaration"
-                        if node["async"]
-                        else "FunctionDeclaration"
-                    )
-                    functions.append(
-                        {
-                            "name": node.id.name,
-                            "type": node_type,
-                            "body": babel_generator(node).code,
-                            "params": list(node["params"]),
-                        }
-                    )
-                # find the last async function
-                main_function = None
-                for function in reversed(functions):
-                    if function["type"] == "AsyncFunctionDeclaration":
-                        main_function = function
-                        break
-                assert (
-                    main_function is not None
-                ), "No async function found. Your main function must be async."
+                program = extract_program(code[0])
                 assert (
-                    len(main_function["params"]) == 1
-                    and main_function["params"][0].name == "bot"
-                ), f"Main function {main_function['name']} must take a single argument named 'bot'"
-                program_code = "\n\n".join(function["body"] for function in functions)
-                exec_code = f"await {main_function['name']}(bot);"
+                    program["params"] == ("bot",)
+                ), f"Main function {program['program_name']} must take a single argument named 'bot'"
+                exec_code = f"await {program['program_name']}(bot);"
                 return {
-                    "program_code": program_code,
-                    "program_name": main_function["name"],
+                    "program_code": program["program_code"],
+                    "program_name": program["program_name"],
                     "exec_code": exec_code,
                 }
             except Exception as e:
@@ -69,7 +69,7 @@ class CommentAgent:
             return "", ""
 
         # modify
-        critic = call_with_messages(messages, self.model_name).content
+        critic = call_with_messages(messages, self.model_name, agent="comment").content
         self.logger.debug(f"****Comment Agent ai message****\n{critic}")
         code_pattern = re.compile(r"{(.*?)}", re.DOTALL)
         code_name = "".join(code_pattern.findall(critic))
@@ -2,7 +2,7 @@ import re
 from odyssey.prompts import load_prompt
 from odyssey.utils.json_utils import fix_and_parse_json
 from langchain.schema import HumanMessage, SystemMessage
-from odyssey.agents.llama import call_with_messages, ModelType
+from odyssey.agents.llama import call_with_messages, evict_cached, ModelType
 from odyssey.utils.logger import get_logger, Timer
 class CriticAgent:
     def __init__(
@@ -107,7 +107,7 @@ class CriticAgent:
 
         # critic = self.llm(messages).content
         # modify
-        critic = call_with_messages(messages, self.model_name).content
+        critic = call_with_messages(messages, self.model_name, agent="critic").content
         code_pattern = re.compile(r"{(.*?)}", re.DOTALL)
         code_name = "".join(code_pattern.findall(critic))
         critic = "{" + code_name + "}"
@@ -119,6 +119,7 @@ class CriticAgent:
             return response["success"], response["critique"]
         except Exception as e:
             self.logger.warning(f"Error parsing critic response: {e} Trying again!")
+            evict_cached(messages, self.model_name, agent="critic")
             return self.ai_check_task_success(
                 messages=messages,
                 max_retries=max_retries - 1,
@@ -183,7 +184,7 @@ class CriticAgent:
 
         # critic = self.llm(messages).content
         # modify
-        critic = call_with_messages(messages).content
+        critic = call_with_messages(messages, agent="critic").content
         self.logger.debug(f"****Goal Agent ai message****\n{critic}")
         code_pattern = re.compile(r"{(.*?)}", re.DOTALL)
         code_name = "".join(code_pattern.findall(critic))
@@ -196,6 +197,7 @@ class CriticAgent:
             return response["reasoning"], response["success"]
         except Exception as e:
             self.logger.warning(f"Error parsing goal response: {e} Trying again!")
+            evict_cached(messages, agent="critic")
             return self.ai_check_task_success(
                 messages=messages,
                 max_retries=max_retries - 1,
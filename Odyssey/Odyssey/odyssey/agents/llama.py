@@ -1,10 +1,18 @@
+import asyncio
+import collections
+import functools
 import os
+import threading
+import time
 from pathlib import Path
 from dotenv import load_dotenv
 from google import genai
 from google.genai import types
 from langchain.schema import AIMessage, HumanMessage, SystemMessage
 
+from odyssey.utils.llm_cache import LLMCache, prompt_key
+from odyssey.utils.single_flight import SingleFlight
+
 load_dotenv(Path(__file__).parents[3] / 'LLM-Backend' / '.env')
 
 class ModelType:
@@ -18,13 +26,39 @@ class ModelType:
 
 GEMINI_MODEL = 'gemini-2.5-flash'
 
-_client = genai.Client(api_key=os.environ['GEMINI_API_KEY'])
+# one client for the process: its async HTTP pool is shared by every agent. GEMINI_BASE_URL
+# points it at another endpoint, e.g. a local mock server for benchmarks
+_client = genai.Client(
+    api_key=os.environ['GEMINI_API_KEY'],
+    http_options=types.HttpOptions(base_url=os.environ['GEMINI_BASE_URL']) if os.environ.get('GEMINI_BASE_URL') else None,
+)
+# response cache, see configure_cache
+_cache = None
+_cache_agents = {}
+# identical prompts in flight at the same time share one request, see configure_single_flight
+_flight = SingleFlight()
+# hedged requests, see configure_hedging
+_hedge_agents = {}
+_hedge_min_samples = 20
+_hedge_min_delay = 1.0
+# all requests run on this loop, so the async connection pool is never shared across loops
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def _get_loop():
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="llm-client", daemon=True).start()
+    return _loop
 
-def call_with_messages(msgs, model_name: ModelType = ModelType.LLAMA3_8B_V3):
-    """Send [SystemMessage, HumanMessage] to Gemini and return an AIMessage."""
+
+async def _generate(msgs):
     system_prompt = msgs[0].content
     user_prompt   = msgs[1].content
-    response = _client.models.generate_content(
+    response = await _client.aio.models.generate_content(
         model=GEMINI_MODEL,
         contents=user_prompt,
         config=types.GenerateContentConfig(
@@ -32,3 +66,179 @@ def call_with_messages(msgs, model_name: ModelType = ModelType.LLAMA3_8B_V3):
         ),
     )
     return AIMessage(content=response.text)
+
+
+class _AgentLatency:
+    """Recent response latencies of one agent and how often it was hedged."""
+    def __init__(self, window=200):
+        self.latencies = collections.deque(maxlen=window)
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def percentile(self, q):
+        if not self.latencies:
+            return None
+        latencies = sorted(self.latencies)
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+    def hedge_delay(self, slo):
+        if slo is not None:
+            return slo
+        if len(self.latencies) < _hedge_min_samples:
+            return None
+        return max(self.percentile(0.95), _hedge_min_delay)
+
+    def stats(self):
+        return {
+            "requests": self.requests,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "p50": self.percentile(0.5),
+            "p95": self.percentile(0.95),
+            "p99": self.percentile(0.99),
+        }
+
+
+_latency = collections.defaultdict(_AgentLatency)
+
+
+async def _generate_hedged(msgs, agent):
+    """
+    `_generate`, plus a second identical request when the first has not answered
+    within the agent's deadline; whichever answers first wins and the other is cancelled.
+    """
+    latency = _latency[agent]
+    delay = latency.hedge_delay(_hedge_agents[agent]) if agent in _hedge_agents else None
+    start = time.perf_counter()
+    first = asyncio.ensure_future(_generate(msgs))
+    pending = {first}
+    if delay is not None:
+        done, _ = await asyncio.wait(pending, timeout=delay)
+        if not done:
+            latency.hedges += 1
+            pending.add(asyncio.ensure_future(_generate(msgs)))
+    error = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    # the latency of the first request, censored at its cancellation when the
+                    # hedge won: the deadline must follow unhedged latencies, not hedged ones
+                    latency.latencies.append(time.perf_counter() - start)
+                    latency.requests += 1
+                    latency.hedge_wins += task is not first
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+def configure_hedging(agents, min_samples=20, min_delay=1.0):
+    """
+    Hedge the requests of `agents` ({agent name: deadline in seconds, or None for
+    the agent's observed p95 latency}). The p95 deadline only applies once
+    `min_samples` latencies were recorded and is never shorter than `min_delay`.
+    An empty `agents` turns hedging off.
+    """
+    global _hedge_agents, _hedge_min_samples, _hedge_min_delay
+    _hedge_agents = dict(agents)
+    _hedge_min_samples = min_samples
+    _hedge_min_delay = min_delay
+
+
+def latency_stats():
+    """Request count, hedge count, hedges that won and p50/p95/p99 latency per agent."""
+    # the loop thread adds agents while this runs on the caller's thread
+    return {agent: latency.stats() for agent, latency in list(_latency.items())}
+
+
+def configure_cache(cache_dir, agents, max_bytes=512 * 2 ** 20):
+    """
+    Cache the responses of `agents` ({agent name: TTL in seconds, None for no
+    expiry}) in `cache_dir`. Calls from other agents, or without an agent, are
+    never cached. An empty `agents` turns the cache off. Callers that parse the
+    response should `evict_cached` it when parsing fails.
+    """
+    global _cache, _cache_agents
+    _cache_agents = dict(agents)
+    if not _cache_agents:
+        _cache = None
+    elif _cache is None or _cache.path != os.path.join(cache_dir, "responses.sqlite"):
+        _cache = LLMCache(cache_dir, max_bytes=max_bytes)
+    else:
+        _cache.max_bytes = max_bytes
+
+
+def configure_single_flight(lock_dir=None):
+    """Coalesce identical in-flight prompts across every process using `lock_dir`, not just this one."""
+    global _flight
+    _flight = SingleFlight(lock_dir)
+
+
+def single_flight_stats():
+    return _flight.stats()
+
+
+def cache_stats():
+    """Hit / miss / expired counts and hit rate per agent."""
+    return _cache.stats() if _cache is not None else {}
+
+
+def _prompt_key(msgs, model_name):
+    return prompt_key(GEMINI_MODEL, model_name, msgs[0].content, msgs[1].content)
+
+
+def evict_cached(msgs, model_name: ModelType = ModelType.LLAMA3_8B_V3, agent=None):
+    """
+    Drop the cached response to `msgs`, for callers whose response did not parse:
+    their retry then asks the model again instead of getting the same answer.
+    """
+    if _cache is not None and agent in _cache_agents:
+        _cache.delete(_prompt_key(msgs, model_name))
+
+
+async def acall_with_messages(msgs, model_name: ModelType = ModelType.LLAMA3_8B_V3, agent=None):
+    """Coroutine version of `call_with_messages`, usable from any event loop."""
+    loop = _get_loop()
+    if asyncio.get_running_loop() is not loop:
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(acall_with_messages(msgs, model_name, agent), loop))
+    key = _prompt_key(msgs, model_name)
+    cache = _cache if agent in _cache_agents else None
+    if cache is not None:
+        # sqlite may wait on other bots' writes, keep that off the loop every agent's requests run on
+        content = await loop.run_in_executor(
+            None, functools.partial(cache.get, key, agent=agent, ttl=_cache_agents[agent])
+        )
+        if content is not None:
+            return AIMessage(content=content)
+
+    async def generate_content():
+        return (await _generate_hedged(msgs, agent)).content
+
+    content = await _flight.ado(key, generate_content)
+    if cache is not None and content is not None:
+        await loop.run_in_executor(None, functools.partial(cache.put, key, content, agent=agent))
+    return AIMessage(content=content)
+
+
+def submit_call(msgs, model_name: ModelType = ModelType.LLAMA3_8B_V3, agent=None):
+    """Start a call in the background and return a concurrent.futures.Future of the AIMessage."""
+    return asyncio.run_coroutine_threadsafe(acall_with_messages(msgs, model_name, agent), _get_loop())
+
+
+def call_concurrently(requests, agent=None):
+    """Run independent [(msgs, model_name), ...] calls at the same time, results in order."""
+    futures = [submit_call(msgs, model_name, agent) for msgs, model_name in requests]
+    return [future.result() for future in futures]
+
+
+def call_with_messages(msgs, model_name: ModelType = ModelType.LLAMA3_8B_V3, agent=None):
+    """
+    Send [SystemMessage, HumanMessage] to Gemini and return an AIMessage.
+    `agent` names the caller for the response cache.
+    """
+    return submit_call(msgs, model_name, agent).result()
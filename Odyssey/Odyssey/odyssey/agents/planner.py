@@ -10,14 +10,14 @@ from odyssey.utils.json_utils import fix_and_parse_list, fix_and_parse_json
 # from langchain.schema import HumanMessage, SystemMessage
 # from langchain.vectorstores import Chroma
 
-from langchain_community.embeddings.huggingface import HuggingFaceEmbeddings
 from langchain.schema import HumanMessage, SystemMessage
 from langchain_community.vectorstores import Chroma
 
 from odyssey.utils.logger import get_logger
+from odyssey.utils.embeddings import get_embeddings
 
 # llama
-from odyssey.agents.llama import call_with_messages, ModelType
+from odyssey.agents.llama import call_with_messages, call_concurrently, evict_cached, ModelType
 
 env_prompt = {
     'combat': 'combat_sys_prompt',
@@ -62,7 +62,7 @@ class PlannerAgent:
         # vectordb for qa cache
         self.qa_cache_questions_vectordb = Chroma(
             collection_name="qa_cache_questions_vectordb",
-            embedding_function=HuggingFaceEmbeddings(model_name=embedding_model),
+            embedding_function=get_embeddings(embedding_model),
             persist_directory=f"{ckpt_dir}/curriculum/vectordb",
         )
         assert self.qa_cache_questions_vectordb._collection.count() == len(
@@ -286,7 +286,7 @@ class PlannerAgent:
     def propose_next_ai_task(self, *, messages, max_retries=5):
         if max_retries == 0:
             raise RuntimeError("Max retries reached, failed to propose ai task.")
-        curriculum = call_with_messages(messages, self.model_name).content
+        curriculum = call_with_messages(messages, self.model_name, agent="planner").content
         self.logger.info(f"****Curriculum Agent ai message****\n{curriculum}")
         code_pattern = re.compile(r"{(.*?)}", re.DOTALL)
         code_name = "".join(code_pattern.findall(curriculum))
@@ -371,8 +371,12 @@ class PlannerAgent:
             HumanMessage(content=f"Equipment obtained in last round: {last_tasklist};\n Health after last combat:{health};\n Critique: {critique};\n Monster: {monster}.\n"),
         ]
         # print(f"\033[31m****Curriculum Agent task decomposition****\nFinal task: {task}\033[0m")
-        response = call_with_messages(messages, self.qa_model_name).content
-        return fix_and_parse_list(response)
+        response = call_with_messages(messages, self.qa_model_name, agent="decompose").content
+        try:
+            return fix_and_parse_list(response)
+        except Exception:
+            evict_cached(messages, self.qa_model_name, agent="decompose")
+            raise
     
     def rerank_monster(self, task):
         messages = [
@@ -387,11 +391,12 @@ class PlannerAgent:
         retry = 3
         while retry > 0:
             try:
-                response = call_with_messages(messages, self.qa_model_name).content
+                response = call_with_messages(messages, self.qa_model_name, agent="rerank").content
                 self.logger.debug(f"****Curriculum Agent monster rerank****\n{response}")
                 monster_order = fix_and_parse_list(response)
                 break
             except Exception as e:
+                evict_cached(messages, self.qa_model_name, agent="rerank")
                 retry -= 1
         
         for item in monster_order:
@@ -413,11 +418,18 @@ class PlannerAgent:
         )
         questions = []
         answers = []
-        for question in questions_new:
-            if self.qa_cache_questions_vectordb._collection.count() > 0:
+        new_questions = []
+        # embed every question in one forward pass instead of one per similarity search
+        question_embeddings = (
+            self.qa_cache_questions_vectordb.embeddings.embed_documents(questions_new)
+            if self.qa_cache_questions_vectordb._collection.count() > 0
+            else [None] * len(questions_new)
+        )
+        for question, question_embedding in zip(questions_new, question_embeddings):
+            if question_embedding is not None:
                 docs_and_scores = (
-                    self.qa_cache_questions_vectordb.similarity_search_with_score(
-                        question, k=1
+                    self.qa_cache_questions_vectordb.similarity_search_by_vector_with_relevance_scores(
+                        question_embedding, k=1
                     )
                 )
                 if docs_and_scores and docs_and_scores[0][1] < 0.05:
@@ -427,16 +439,30 @@ class PlannerAgent:
                     questions.append(question_cached)
                     answers.append(answer_cached)
                     continue
-            answer = self.run_qa_step2_answer_questions(question=question)
-            assert question not in self.qa_cache
-            self.qa_cache[question] = answer
+            if question not in self.qa_cache and question not in new_questions:
+                new_questions.append(question)
+            questions.append(question)
+            answers.append(None)
+        # the uncached questions are independent, answer them all at once
+        new_answers = call_concurrently(
+            [
+                (self.render_messages_qa_step2_answer_questions(question), self.qa_model_name)
+                for question in new_questions
+            ],
+            agent="planner_qa",
+        )
+        for question, answer in zip(new_questions, new_answers):
+            self.qa_cache[question] = answer.content
+        answers = [
+            answer if answer is not None else self.qa_cache[question]
+            for question, answer in zip(questions, answers)
+        ]
+        if new_questions:
             self.qa_cache_questions_vectordb.add_texts(
-                texts=[question],
+                texts=new_questions,
             )
             U.dump_json(self.qa_cache, f"{self.ckpt_dir}/curriculum/qa_cache.json")
             self.qa_cache_questions_vectordb.persist()
-            questions.append(question)
-            answers.append(answer)
         assert len(questions_new) == len(questions) == len(answers)
         return questions, answers
 
@@ -512,14 +538,17 @@ class PlannerAgent:
         content = f"Question: {question}"
         return HumanMessage(content=content)
 
-    def run_qa_step2_answer_questions(self, question):
-        messages = [
+    def render_messages_qa_step2_answer_questions(self, question):
+        return [
             self.render_system_message_qa_step2_answer_questions(),
             self.render_human_message_qa_step2_answer_questions(question=question),
         ]
+
+    def run_qa_step2_answer_questions(self, question):
+        messages = self.render_messages_qa_step2_answer_questions(question)
         # self.logger.debug(f"Curriculum Agent Question: {question}")
         # qa_answer = self.qa_llm(messages).content
         # ï¿????æ¹è°ï¿????
-        qa_answer = call_with_messages(messages, model_name=self.qa_model_name).content
+        qa_answer = call_with_messages(messages, model_name=self.qa_model_name, agent="planner_qa").content
         # self.logger.debug(f"Curriculum Agent Answer: {qa_answer}")
         return qa_answer
@@ -1,14 +1,25 @@
+import heapq
 import os
+import re
+import threading
+import time
+import pkg_resources
 
 import odyssey.utils as U
-from langchain_community.embeddings.huggingface import HuggingFaceEmbeddings
 from langchain.schema import HumanMessage, SystemMessage
-from langchain_community.vectorstores import Chroma
 
 from odyssey.agents.llama import call_with_messages
 from odyssey.prompts import load_prompt
 from odyssey.control_primitives import load_control_primitives
 from odyssey.utils.logger import get_logger
+from odyssey.utils.js_utils import JSSyntaxError, check_syntax, parse_functions
+from odyssey.utils.lexical_index import LexicalIndex, load_item_synonyms
+from odyssey.utils.vector_index import (
+    VectorIndex, current_version, index_lock, load_version, publish_version,
+)
+
+JS_IDENTIFIER = re.compile(r"[A-Za-z_$][\w$]*")
+JS_FUNCTION_NAME = re.compile(r"function\s*\*?\s*([A-Za-z_$][\w$]*)")
 
 class SkillManager:
     def __init__(
@@ -19,104 +30,295 @@ class SkillManager:
         resume=False,
         reload=False,
         embedding_model="",
+        primitive_check_interval=1.0,
+        overlay_dir=None,
+        merge_interval=60,
+        lexical_weight=0.3,
+        exact_match_first=True,
     ):
         U.f_mkdir(f"{ckpt_dir}/skill/compositional")
         U.f_mkdir(f"{ckpt_dir}/skill/description")
-        U.f_mkdir(f"{ckpt_dir}/skill/vectordb")
-        if reload:
-            U.f_remove(f"{ckpt_dir}/skill/vectordb")
         # programs for env execution
-        self.control_primitives = load_control_primitives()
-        self.skill_primitives = self.load_skill_primitives()
-        self.mc_skill_primitives = self.load_mc_skill_primitives()
         self.skill_lib = "old"
         self.logger = get_logger("SkillManager")
-        if resume:
-            self.skills = U.load_json(f"{ckpt_dir}/skill/skills.json")
-            self.logger.info(f"Loading {len(self.skills)} skills from {ckpt_dir}/skill")
-        else:
-            self.skills = {}
+        self.primitive_check_interval = primitive_check_interval
+        self.load_programs()
+        self.resume = resume
         self.retrieval_top_k = retrieval_top_k
         self.ckpt_dir = ckpt_dir
-        self.vectordb = Chroma(
-            collection_name="skill_vectordb",
-            embedding_function=HuggingFaceEmbeddings(model_name=embedding_model),
-            persist_directory=f"{ckpt_dir}/skill/vectordb",
-        )
-        if reload:
-            for key, value in self.skills.items():
-                self.vectordb.add_texts(
-                    texts=[value['description']],
-                    ids=[key],
-                    metadatas=[{"name": key}],
-                )
-            
-            self.vectordb.persist()
-        
-        assert self.vectordb._collection.count() == len(self.skills), (
-            f"Skill Manager's vectordb is not synced with skills.json.\n"
-            f"There are {self.vectordb._collection.count()} skills in vectordb but {len(self.skills)} skills in skills.json.\n"
-            f"Did you set resume=False when initializing the manager?\n"
-            f"You may need to manually delete the vectordb directory for running from scratch."
+        self.embedding_model = embedding_model
+        self._lock = threading.RLock()
+        # hybrid retrieval: 0 is pure embedding similarity, 1 pure BM25 over names and descriptions
+        self.lexical_weight = lexical_weight
+        self.exact_match_first = exact_match_first
+        self.item_synonyms = load_item_synonyms()
+        self._lexical_index = None
+        # the library index is published as immutable versions that every bot on the
+        # library memory-maps read-only, so `reload` no longer needs to rebuild anything
+        self.index_root = f"{ckpt_dir}/skill/index"
+        self.index_version = None
+        self.library_skills = {}
+        self.overlay_skills = {}
+        self.skills = {}
+        self.load_library()
+        self.logger.info(f"Loading {len(self.library_skills)} skills from {ckpt_dir}/skill")
+
+        # skills this bot learns go to a private overlay, merged into the library in the background
+        self.overlay_dir = overlay_dir
+        self.merge_interval = merge_interval
+        if overlay_dir:
+            U.f_mkdir(f"{overlay_dir}/skill")
+            self.overlay_path = f"{overlay_dir}/skill/overlay_skills.json"
+            if os.path.exists(self.overlay_path):
+                self.overlay_skills = U.load_json(self.overlay_path)
+            self.overlay_index = VectorIndex(
+                f"{overlay_dir}/skill", "overlay_index", embedding_model=embedding_model
+            )
+            self.overlay_index.sync(
+                {key: value['description'] for key, value in self.overlay_skills.items()}
+            )
+            self.update_skills()
+            threading.Thread(target=self.merge_loop, name="SkillMerge", daemon=True).start()
+
+    def load_programs(self):
+        """(Re)load primitives from disk and drop every assembled program bundle."""
+        self.control_primitives = load_control_primitives()
+        self.skill_primitives = self.load_skill_primitives()
+        self.mc_skill_primitives = self.load_mc_skill_primitives()
+        self._primitive_mtimes = self.get_primitive_mtimes()
+        self._primitive_checked_at = time.monotonic()
+        self._programs_cache = {}
+        self._call_graph = None
+
+    def get_primitive_mtimes(self):
+        current_dir = os.getcwd()
+        primitive_dirs = [
+            f"{pkg_resources.resource_filename('odyssey', '')}/control_primitives",
+            f"{current_dir}/skill_library/skill/primitive",
+            f"{current_dir}/../MC-Comprehensive-Skill-Library/skill",
+        ]
+        return tuple(
+            (entry.path, entry.stat().st_mtime_ns)
+            for primitive_dir in primitive_dirs
+            for entry in os.scandir(primitive_dir)
+            if entry.name.endswith(".js")
         )
 
+    def check_primitives(self):
+        if time.monotonic() - self._primitive_checked_at < self.primitive_check_interval:
+            return
+        self._primitive_checked_at = time.monotonic()
+        if self.get_primitive_mtimes() != self._primitive_mtimes:
+            self.logger.info("Skill primitives changed on disk, reloading programs")
+            self.load_programs()
+
     @property
     def programs(self):
-        programs = ""
-        if (self.skill_lib == "old"):
-            for skill_name, entry in self.skills.items():
-                programs += f"{entry['code']}\n\n"
-            for primitives in self.control_primitives:
-                programs += f"{primitives}\n\n"
-            for skill_primitive in self.skill_primitives:
-                programs += f"{skill_primitive}\n\n"
-        elif (self.skill_lib == "new"):
-            for mc_skill_primitive in self.mc_skill_primitives:
-                programs += f"{mc_skill_primitive}\n\n"
+        # assembled once per skill_lib variant, rebuilt after add_new_skill or a primitive edit
+        self.check_primitives()
+        programs = self._programs_cache.get(self.skill_lib)
+        if programs is None:
+            sources = []
+            if (self.skill_lib == "old"):
+                sources += [entry['code'] for entry in self.skills.values()]
+                sources += self.control_primitives
+                sources += self.skill_primitives
+            elif (self.skill_lib == "new"):
+                sources += self.mc_skill_primitives
+            programs = "".join(f"{source}\n\n" for source in sources)
+            # the merge thread may clear the cache at any point, return the local
+            self._programs_cache[self.skill_lib] = programs
         return programs
     
     @programs.setter
     def programs(self, value):
         self.skill_lib = value
 
+    def build_call_graph(self):
+        """Index the top-level functions of the "old" library and the library functions each one references."""
+        sources = [entry['code'] for entry in self.skills.values()]
+        sources += self.control_primitives
+        sources += self.skill_primitives
+        functions = {}
+        for source in sources:
+            for function in parse_functions(source):
+                # later declarations win, same as when the bundle is eval'd
+                functions.pop(function["name"], None)
+                functions[function["name"]] = source[function["start"]:function["end"]]
+        calls = {
+            name: set(JS_IDENTIFIER.findall(body)) & functions.keys() - {name}
+            for name, body in functions.items()
+        }
+        self._call_graph = (functions, calls)
+        self.logger.info(f"Built call graph over {len(functions)} library functions")
+        return self._call_graph
+
+    def get_program_closure(self, code):
+        """Program bundle holding only the library functions `code` transitively references."""
+        if self.skill_lib != "old":
+            return self.programs
+        self.check_primitives()
+        functions, calls = self._call_graph or self.build_call_graph()
+        # functions the step code declares itself shadow the library versions
+        defined = set(JS_FUNCTION_NAME.findall(code))
+        pending = set(JS_IDENTIFIER.findall(code)) & functions.keys() - defined
+        closure = set()
+        while pending:
+            name = pending.pop()
+            closure.add(name)
+            pending |= calls[name] - closure - defined
+        key = ("closure", frozenset(closure))
+        programs = self._programs_cache.get(key)
+        if programs is None:
+            programs = "".join(f"{body}\n\n" for name, body in functions.items() if name in closure)
+            self._programs_cache[key] = programs
+        return programs
+
+    def update_skills(self):
+        with self._lock:
+            self.skills = {**self.library_skills, **self.overlay_skills}
+            self._programs_cache.clear()
+            self._call_graph = None
+            self._lexical_index = None
+
+    @property
+    def lexical_index(self):
+        # rebuilt once per change of the skill set
+        with self._lock:
+            if self._lexical_index is None:
+                self._lexical_index = LexicalIndex(
+                    {key: value['description'] for key, value in self.skills.items()},
+                    synonyms=self.item_synonyms,
+                )
+            return self._lexical_index
+
+    def load_library(self):
+        """Load skills.json with the index version built from it, publishing one if the index is stale."""
+        with index_lock(self.index_root):
+            if self.resume:
+                library_skills = U.load_json(f"{self.ckpt_dir}/skill/skills.json")
+            else:
+                library_skills = self.library_skills
+            texts = {key: value['description'] for key, value in library_skills.items()}
+            index = load_version(self.index_root, "skill_index", self.embedding_model)
+            if index is None or not index.matches(texts):
+                # only a bot resuming from skills.json speaks for the shared library, and an
+                # empty skills.json must not wipe out a library other bots have published
+                if self.resume and (texts or index is None or not len(index)):
+                    version, index = publish_version(
+                        self.index_root, "skill_index", texts, self.embedding_model
+                    )
+                    self.logger.info(f"Published skill index {version} with {len(index)} skills")
+                else:
+                    index = VectorIndex(f"{self.ckpt_dir}/skill", "private_index", self.embedding_model)
+                    index.sync(texts)
+            version = current_version(self.index_root)
+        with self._lock:
+            self.library_skills = library_skills
+            self.index = index
+            self.index_version = version
+        self.update_skills()
+
+    def check_library(self):
+        # another bot merged its skills into the library
+        if current_version(self.index_root) != self.index_version:
+            self.load_library()
+
+    def publish_skills(self, new_skills):
+        """Add `new_skills` to the library on disk and publish the matching index version."""
+        with index_lock(self.index_root):
+            if self.resume and os.path.exists(f"{self.ckpt_dir}/skill/skills.json"):
+                library_skills = U.load_json(f"{self.ckpt_dir}/skill/skills.json")
+            else:
+                library_skills = dict(self.library_skills)
+            for program_name, entry in new_skills.items():
+                if program_name in library_skills:
+                    i = 2
+                    while f"{program_name}V{i}.js" in os.listdir(f"{self.ckpt_dir}/skill/compositional"):
+                        i += 1
+                    dumped_program_name = f"{program_name}V{i}"
+                else:
+                    dumped_program_name = program_name
+                U.dump_text(
+                    entry["code"], f"{self.ckpt_dir}/skill/compositional/{dumped_program_name}.js"
+                )
+                U.dump_text(
+                    entry["description"],
+                    f"{self.ckpt_dir}/skill/description/{dumped_program_name}.txt",
+                )
+                library_skills[program_name] = entry
+            # readers load skills.json without the lock, never let them see it half written
+            U.dump_json(library_skills, f"{self.ckpt_dir}/skill/skills.json.{os.getpid()}.tmp")
+            os.replace(
+                f"{self.ckpt_dir}/skill/skills.json.{os.getpid()}.tmp",
+                f"{self.ckpt_dir}/skill/skills.json",
+            )
+            version, index = publish_version(
+                self.index_root,
+                "skill_index",
+                {key: value['description'] for key, value in library_skills.items()},
+                self.embedding_model,
+            )
+        with self._lock:
+            self.library_skills = library_skills
+            self.index = index
+            self.index_version = version
+        self.update_skills()
+        self.logger.info(f"Published skill index {version} with {len(index)} skills")
+
+    def merge_overlay(self):
+        with self._lock:
+            pending = dict(self.overlay_skills)
+        if not pending:
+            return
+        self.publish_skills(pending)
+        with self._lock:
+            for program_name, entry in pending.items():
+                # keep skills rewritten while the merge was running for the next round
+                if self.overlay_skills.get(program_name) is entry:
+                    del self.overlay_skills[program_name]
+                    self.overlay_index.delete(program_name)
+            U.dump_json(self.overlay_skills, self.overlay_path)
+        self.update_skills()
+        self.logger.info(f"Merged {len(pending)} skills into {self.ckpt_dir}/skill")
+
+    def merge_loop(self):
+        while True:
+            time.sleep(self.merge_interval)
+            try:
+                self.merge_overlay()
+                self.check_library()
+            except Exception as e:
+                self.logger.warning(f"Skill library merge failed: {e}")
+
     def add_new_skill(self, info):
         if info["task"].startswith("Deposit useless items into the chest at"):
             # No need to reuse the deposit skill
             return
         program_name = info["program_name"]
         program_code = info["program_code"]
+        # the program was only scanned for its functions, never let a skill that does not parse into the library
+        try:
+            check_syntax(program_code)
+        except JSSyntaxError as e:
+            self.logger.warning(f"Not adding skill {program_name}: {e}")
+            return
         skill_description = self.generate_skill_description(program_name, program_code)
         self.logger.info(f"Skill Manager generated description for {program_name}:\n{skill_description}")
         if program_name in self.skills:
             self.logger.warning(f"Skill {program_name} already exists. Rewriting!")
-            self.vectordb._collection.delete(ids=[program_name])
-            i = 2
-            while f"{program_name}V{i}.js" in os.listdir(f"{self.ckpt_dir}/skill/compositional"):
-                i += 1
-            dumped_program_name = f"{program_name}V{i}"
-        else:
-            dumped_program_name = program_name
-        self.vectordb.add_texts(
-            texts=[skill_description],
-            ids=[program_name],
-            metadatas=[{"name": program_name}],
-        )
-        self.skills[program_name] = {
+        entry = {
             "code": program_code,
             "description": skill_description,
         }
-        assert self.vectordb._collection.count() == len(
-            self.skills
-        ), "vectordb is not synced with skills.json"
-        U.dump_text(
-            program_code, f"{self.ckpt_dir}/skill/compositional/{dumped_program_name}.js"
-        )
-        U.dump_text(
-            skill_description,
-            f"{self.ckpt_dir}/skill/description/{dumped_program_name}.txt",
-        )
-        U.dump_json(self.skills, f"{self.ckpt_dir}/skill/skills.json")
-        self.vectordb.persist()
+        if not self.overlay_dir:
+            self.publish_skills({program_name: entry})
+            return
+        with self._lock:
+            self.overlay_skills[program_name] = entry
+            self.overlay_index.add(program_name, skill_description)
+            U.dump_json(self.overlay_skills, self.overlay_path)
+        self.update_skills()
 
     def generate_skill_description(self, program_name, program_code):
         messages = [
@@ -127,34 +329,66 @@ class SkillManager:
                 + f"The main function is `{program_name}`."
             ),
         ]
-        skill_description = f"    // { call_with_messages(messages).content}"
+        skill_description = f"    // { call_with_messages(messages, agent='skill_description').content}"
         return f"async function {program_name}(bot) {{\n{skill_description}\n}}"
 
     def retrieve_skills(self, query):
-        k = min(self.vectordb._collection.count(), self.retrieval_top_k)
+        self.check_library()
+        with self._lock:
+            index = self.index
+            overlay_index = self.overlay_index if self.overlay_skills else None
+            skills = self.skills
+        k = min(len(skills), self.retrieval_top_k)
         if k == 0:
             return []
         self.logger.info(f"Skill Manager retrieving for {k} skills")
-        docs_and_scores = self.vectordb.similarity_search_with_score(query, k=k)
+        lexical_index = self.lexical_index
+        # skills named verbatim in the query ("craft iron pickaxe" -> craftIronPickaxe) go first
+        exact = lexical_index.exact_matches(query)[:k] if self.exact_match_first else []
+        if len(exact) == k:
+            names_and_scores = [(name, 1.0) for name in exact]
+        else:
+            names_and_scores = self.rank_skills(query, index, overlay_index, lexical_index, k)
+            names_and_scores = [(name, 1.0) for name in exact] + [
+                (name, score) for name, score in names_and_scores if name not in exact
+            ][:k - len(exact)]
         self.logger.debug(
             f"Skill Manager retrieved skills: "
-            f"{', '.join([doc.metadata['name'] for doc, _ in docs_and_scores])}"
+            f"{', '.join([name for name, _ in names_and_scores])}"
         )
         self.logger.debug(
             f"Skill Manager retrieved skills Scores: "
-            f"{[score for _, score in docs_and_scores]}"
+            f"{[score for _, score in names_and_scores]}"
         )
 
         code = []
         description = []
-        for doc, _ in docs_and_scores:
-            code.append(self.skills[doc.metadata["name"]]["code"])
-            description.append(self.skills[doc.metadata["name"]]["description"])
+        for name, _ in names_and_scores:
+            code.append(skills[name]["code"])
+            description.append(skills[name]["description"])
         
         skills = [code, description]
         # print(skills)
         return skills
 
+    def rank_skills(self, query, index, overlay_index, lexical_index, k):
+        """Top `k` by a blend of embedding similarity and BM25 normalised to the best lexical hit."""
+        scores = {}
+        if self.lexical_weight < 1:
+            query_vector = index.embed_query(query)
+            vector_weight = 1 - self.lexical_weight
+            if len(index):
+                scores.update(zip(index.names, (vector_weight * (index.vectors @ query_vector)).tolist()))
+            if overlay_index is not None:
+                # overlay entries shadow library skills of the same name
+                scores.update(zip(overlay_index.names, (vector_weight * (overlay_index.vectors @ query_vector)).tolist()))
+        if self.lexical_weight > 0:
+            lexical_scores = lexical_index.search(query)
+            top_lexical = max(lexical_scores.values(), default=0) or 1
+            for name, score in lexical_scores.items():
+                scores[name] = scores.get(name, 0) + self.lexical_weight * score / top_lexical
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
     def load_skill_primitives(self, primitive_names=None):
         current_dir = os.getcwd()
         # print(f"current dir: {current_dir}")
@@ -1,3 +1,4 @@
+import hashlib
 import os.path
 import time
 import warnings
@@ -7,6 +8,15 @@ from odyssey.utils.run_utils import retry
 import requests
 import json
 
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 import gymnasium as gym
 from gymnasium.core import ObsType
 
@@ -16,6 +26,37 @@ from .minecraft_launcher import MinecraftInstance
 from .process_monitor import SubprocessMonitor
 from odyssey.utils.logger import get_logger, Timer
 
+# Accept header per observation format; mineflayer sends the events encoded once in it
+OBSERVATION_TYPES = {
+    "json": "application/json",
+    "msgpack": "application/msgpack",
+}
+
+
+def decode_observation(res):
+    """Decode the events of a /start or /step response in any of the wire formats."""
+    if res.headers.get("Content-Type", "").startswith("application/msgpack"):
+        return msgpack.unpackb(res.content)
+    events = orjson.loads(res.content) if orjson is not None else json.loads(res.content)
+    if isinstance(events, str):
+        # a mineflayer server without the formats wraps the JSON string of the events
+        events = json.loads(events)
+    return events
+
+
+def apply_patch(base, patch):
+    """Rebuild an event payload from the one before it and its patch (see mineflayer/observationDelta.js)."""
+    result = dict(base)
+    for key in patch.get("del", ()):
+        del result[key]
+    result.update(patch.get("set", ()))
+    for key, sub_patch in patch.get("merge", {}).items():
+        result[key] = apply_patch(result[key], sub_patch)
+    if "order" in patch:
+        result = {key: result[key] for key in patch["order"]}
+    return result
+
+
 class VoyagerEnv(gym.Env):
     def __init__(
         self,
@@ -26,9 +67,16 @@ class VoyagerEnv(gym.Env):
         server_port=3000,
         request_timeout=600000,
         log_path="./logs",
+        fused_step=True,
+        observation_format="json",
+        delta_observations=True,
+        warm_reset=True,
+        mineflayer_pool=None,
     ):
         if not mc_port and not azure_login:
             raise ValueError("Either mc_port or azure_login must be specified")
+        if mineflayer_pool is not None and azure_login:
+            raise ValueError("mineflayer_pool cannot be used with azure_login")
         if mc_port and azure_login:
             warnings.warn(
                 "Both mc_port and mc_login are specified, mc_port will be ignored"
@@ -37,11 +85,32 @@ class VoyagerEnv(gym.Env):
         self.mc_host = mc_host
         self.mc_port = mc_port
         self.azure_login = azure_login
+        self.server_host = server_host
         self.server = f"{server_host}:{server_port}"
         self.server_port = server_port
         self.request_timeout = request_timeout
         self.log_path = log_path
-        self.mineflayer = self.get_mineflayer_process(server_port)
+        # one keep-alive connection to mineflayer instead of a new one per request
+        self.session = requests.Session()
+        # let /step unpause and re-pause the server itself instead of two extra /pause requests
+        self.fused_step = fused_step
+        if observation_format not in OBSERVATION_TYPES:
+            raise ValueError(f"observation_format must be one of {', '.join(OBSERVATION_TYPES)}")
+        if observation_format == "msgpack" and msgpack is None:
+            self.logger.warning("msgpack is not installed, observations are received as JSON")
+            observation_format = "json"
+        self.observation_format = observation_format
+        self.session.headers["Accept"] = OBSERVATION_TYPES[observation_format]
+        # have mineflayer send each event as a patch against the one before, see materialize_observation
+        self.delta_observations = delta_observations
+        self.observation_session = None
+        self.observation_seq = None
+        self._observation_payload = None
+        # reset the connected bot in the running mineflayer process, restart it only when that fails
+        self.warm_reset = warm_reset
+        # lease pre-started mineflayer processes (on the pool's ports) instead of starting one on server_port
+        self.mineflayer_pool = mineflayer_pool
+        self.mineflayer = self.get_mineflayer_process(server_port) if mineflayer_pool is None else None
         if azure_login:
             self.mc_instance = self.get_mc_instance()
         else:
@@ -50,6 +119,28 @@ class VoyagerEnv(gym.Env):
         self.reset_options = None
         self.connected = False
         self.server_paused = False
+        # hashes of program bundles the current mineflayer process already holds
+        self.registered_programs = set()
+        self._last_programs = None
+        self._last_programs_hash = None
+        # whether the bot of the current mineflayer process was created through /start
+        self.bot_started = False
+        if mineflayer_pool is not None:
+            self.lease_mineflayer()
+
+    def lease_mineflayer(self):
+        self.mineflayer = self.mineflayer_pool.lease()
+        self.server_port = self.mineflayer.port
+        self.server = f"{self.server_host}:{self.server_port}"
+        self.registered_programs.clear()
+        self.bot_started = False
+        self.logger.info(f"Leased mineflayer process on port {self.server_port}")
+
+    def stop_mineflayer(self):
+        if self.mineflayer_pool is not None:
+            self.mineflayer_pool.release(self.mineflayer)
+        else:
+            self.mineflayer.stop()
 
     def get_mineflayer_process(self, server_port):
         U.f_mkdir(self.log_path, "mineflayer")
@@ -85,10 +176,17 @@ class VoyagerEnv(gym.Env):
             self.reset_options["port"] = self.mc_instance.port
             self.logger.info(f"Server started on port {self.reset_options['port']}")
 
-        if not self.mineflayer.is_running:
+        if not self.mineflayer.is_running and self.mineflayer_pool is not None:
+            self.logger.info('Mineflayer process is not running, leasing another one')
+            self.stop_mineflayer()
+            with Timer('check process lease mineflayer'):
+                self.lease_mineflayer()
+        elif not self.mineflayer.is_running:
+            self.bot_started = False
             retry = 3
             while retry > 0:
                 self.logger.info('Start Mineflayer process')
+                self.registered_programs.clear()
                 with Timer('check process run mineflayer'):
                     self.mineflayer.run()
                 if not self.mineflayer.is_running:
@@ -103,21 +201,22 @@ class VoyagerEnv(gym.Env):
                     if self.mineflayer.ready_line is None:
                         self.logger.critical('mineflayer read line is None.')
                     break
-            
+
+        if not self.bot_started:
             retry = 3
             while retry > 0:
                 try:
-                    res = requests.post(
+                    res = self.session.post(
                         f"{self.server}/start",
                         json=self.reset_options,
                         timeout=self.request_timeout,
                     )
                     if res.status_code == 200:
-                        # self.logger.debug(f'start response:{res.json()}')
-                        return res.json()
+                        self.bot_started = True
+                        return self.materialize_observation(decode_observation(res))
                     else:
                         if retry == 0:
-                            self.mineflayer.stop()
+                            self.stop_mineflayer()
                             raise RuntimeError("Reset Minecraft server failed!")
                         else:
                             self.logger.warning(f'Reset Minecraft server {res.status_code}')
@@ -125,7 +224,7 @@ class VoyagerEnv(gym.Env):
                         retry -= 1
                 except requests.exceptions.Timeout:
                     if retry == 0:
-                        self.mineflayer.stop()
+                        self.stop_mineflayer()
                         raise RuntimeError("Reset Minecraft server timeout!")
                     else:
                         self.logger.warning(f"Reset Minecraft server timeout, retrying")
@@ -136,6 +235,26 @@ class VoyagerEnv(gym.Env):
             return None
 
 
+    def register_programs(self, programs: str) -> str:
+        """Upload a program bundle once per mineflayer session and return its hash."""
+        # SkillManager hands back the same memoized string until it changes, skip rehashing it
+        if programs is not self._last_programs:
+            self._last_programs = programs
+            self._last_programs_hash = hashlib.sha256(programs.encode("utf-8")).hexdigest()
+        programs_hash = self._last_programs_hash
+        if programs_hash in self.registered_programs:
+            return programs_hash
+        with Timer('post programs'):
+            res = self.session.post(
+                f"{self.server}/programs",
+                json={"programsHash": programs_hash, "programs": programs},
+                timeout=self.request_timeout,
+            )
+        if res.status_code != 200:
+            raise RuntimeError(f"Register programs failed with code {res.status_code}")
+        self.registered_programs.add(programs_hash)
+        return programs_hash
+
     def step(
         self,
         code: str,
@@ -145,20 +264,40 @@ class VoyagerEnv(gym.Env):
         if not self.has_reset:
             raise RuntimeError("Environment has not been reset yet")
         self.check_process()
-        self.unpause()
         data = {
             "code": code,
-            "programs": programs,
+            "programsHash": self.register_programs(programs) if programs else None,
         }
         while retry > 0:
+            fused = self.fused_step and self.server_paused
+            if not fused:
+                self.unpause()
+            data["togglePause"] = fused
+            if self.delta_observations:
+                data["observationDelta"] = True
+                data["observationSession"] = self.observation_session
+                data["observationSeq"] = self.observation_seq
             try:
                 with Timer('post step'):
-                    res = requests.post(
+                    res = self.session.post(
                         f"{self.server}/step", json=data, timeout=self.request_timeout
                     )
+                    # set when the step toggled the pause, 1 if it paused the server again
+                    paused = res.headers.get("X-Paused")
+                    if paused is not None:
+                        self.server_paused = paused == "1"
                     if res.status_code == 200:
-                        self.logger.debug(f'response:{res.json()}')
+                        events = self.materialize_observation(decode_observation(res))
+                        self.logger.debug('response: %s', events)
                         break
+                    elif res.status_code == 409:
+                        # mineflayer lost the bundle (restart or eviction), upload it again
+                        retry -= 1
+                        self.logger.warning(f"Programs {data['programsHash']} unknown to mineflayer, re-registering")
+                        self.registered_programs.discard(data["programsHash"])
+                        self.register_programs(programs)
+                        if retry == 0:
+                            raise RuntimeError("Step Minecraft server failed!")
                     else:
                         retry -= 1
                         self.logger.warning(f"Step Minecraft server failed, retrying")
@@ -169,7 +308,10 @@ class VoyagerEnv(gym.Env):
                 self.logger.warning(f"Step Minecraft server timeout, retrying")
                 if retry == 0:
                     raise RuntimeError("Step Minecraft server timeout!")
-                res = requests.post(
+                if fused:
+                    # the step unpaused the server, and will not pause it again once /start replaces the bot
+                    self.server_paused = False
+                res = self.session.post(
                     f"{self.server}/start",
                     json=self.reset_options,
                     timeout=self.request_timeout,
@@ -178,9 +320,44 @@ class VoyagerEnv(gym.Env):
         
         # if res.status_code != 200:
         #     raise RuntimeError("Failed to step Minecraft server")
-        returned_data = res.json()
         self.pause()
-        return json.loads(returned_data)
+        return events
+
+    def materialize_observation(self, observation):
+        """
+        Turn a /start or /step response into the full [type, payload] events.
+
+        With delta observations the first event is patched against the last payload
+        of observation `base` (or {} when base is null), which this env keeps between
+        steps. Unchanged values are shared between the events and with that kept
+        payload, so the events must be treated as read only below the payload dicts.
+        """
+        if isinstance(observation, list):
+            # a mineflayer server without delta observations
+            return observation
+        if not isinstance(observation, dict) or not {"session", "seq", "base", "events"} <= observation.keys():
+            raise RuntimeError(f"Malformed observation from the mineflayer server: {str(observation)[:200]}")
+        if observation["base"] is None:
+            payload = {}
+        elif (observation["session"], observation["base"]) == (self.observation_session, self.observation_seq):
+            payload = self._observation_payload
+        else:
+            # not the observation this env holds, ask for this one in full
+            self.logger.warning(f"Observation {observation['seq']} is based on {observation['base']}, "
+                                f"holding {self.observation_seq}; fetching it in full")
+            res = self.session.get(f"{self.server}/observation/{observation['seq']}", timeout=self.request_timeout)
+            res.raise_for_status()
+            observation = decode_observation(res)
+            payload = {}
+        events = []
+        for event_type, patch in observation["events"]:
+            payload = apply_patch(payload, patch)
+            events.append([event_type, payload])
+        self.observation_session = observation["session"]
+        self.observation_seq = observation["seq"]
+        # a copy, callers may replace keys of the last payload
+        self._observation_payload = dict(payload)
+        return events
 
     def render(self):
         raise NotImplementedError("render is not implemented")
@@ -207,15 +384,33 @@ class VoyagerEnv(gym.Env):
             "spread": options.get("spread", False),
             "waitTicks": options.get("wait_ticks", 5),
             "position": options.get("position", None),
-            "username": options.get('username', 'bot')
+            "username": options.get('username', 'bot'),
+            "observationDelta": self.delta_observations,
         }
         with Timer('reset unpause mc server'):
             self.unpause()
-        with Timer('reset stop mc_server'):
-            self.mineflayer.stop()
-        time.sleep(1)  # wait for mineflayer to exit
-        with Timer('reset check_process'):
-            returned_data = self.check_process()
+        returned_data = None
+        if self.warm_reset and self.connected and self.mineflayer.is_running:
+            with Timer('reset warm'):
+                returned_data = self.reset_bot()
+        if returned_data is None and not self.bot_started and self.mineflayer.is_running:
+            # mineflayer answered /reset with 409, it is fine but has no bot to reset
+            with Timer('reset check_process'):
+                returned_data = self.check_process()
+        if returned_data is None and self.mineflayer_pool is not None:
+            if self.bot_started:
+                # a fresh process from the pool, on another port, no need to wait for this one to exit
+                with Timer('reset lease mineflayer'):
+                    self.stop_mineflayer()
+                    self.lease_mineflayer()
+            with Timer('reset check_process'):
+                returned_data = self.check_process()
+        elif returned_data is None:
+            with Timer('reset stop mc_server'):
+                self.mineflayer.stop()
+            time.sleep(1)  # wait for mineflayer to exit
+            with Timer('reset check_process'):
+                returned_data = self.check_process()
         self.has_reset = True
         self.connected = True
         # All the reset in step will be soft
@@ -225,23 +420,50 @@ class VoyagerEnv(gym.Env):
         if returned_data is None:
             self.logger.warning('reset return None')
             return None        
-        return json.loads(returned_data)
+        return returned_data
+
+    def reset_bot(self):
+        """
+        Reset the bot in place through /reset. None if it cannot: with bot_started cleared
+        when mineflayer only needs a /start, otherwise mineflayer has to be restarted.
+        """
+        if self.mc_instance and not self.mc_instance.is_running:
+            return None
+        try:
+            res = self.session.post(
+                f"{self.server}/reset",
+                json=self.reset_options,
+                timeout=self.request_timeout,
+            )
+        except requests.exceptions.RequestException as e:
+            self.logger.warning(f"Warm reset failed, restarting mineflayer: {e}")
+            return None
+        if res.status_code == 409:
+            # no bot for these options, or /start replaced it during the reset
+            self.logger.info("No bot to reset, starting one through /start")
+            self.bot_started = False
+            return None
+        if res.status_code != 200:
+            self.logger.warning(f"Warm reset failed ({res.status_code}), restarting mineflayer")
+            return None
+        return self.materialize_observation(decode_observation(res))
 
     def close(self):
         self.unpause()
         if self.connected:
-            res = requests.post(f"{self.server}/stop")
+            res = self.session.post(f"{self.server}/stop")
             if res.status_code == 200:
                 self.connected = False
         if self.mc_instance:
             self.mc_instance.stop()
-        self.mineflayer.stop()
+        self.stop_mineflayer()
+        self.session.close()
         return not self.connected
 
     @retry(retry_count=3)
     def pause(self):
         if self.mineflayer.is_running and not self.server_paused:
-            res = requests.post(f"{self.server}/pause")
+            res = self.session.post(f"{self.server}/pause")
             if res.status_code == 200:
                 self.server_paused = True
             else:
@@ -252,7 +474,7 @@ class VoyagerEnv(gym.Env):
     @retry(retry_count=3)
     def unpause(self):
         if self.mineflayer.is_running and self.server_paused:
-            res = requests.post(f"{self.server}/pause")
+            res = self.session.post(f"{self.server}/pause")
             if res.status_code == 200:
                 self.server_paused = False
             else:
@@ -1,5 +1,6 @@
 const fs = require("fs");
 const path = require("path");
+const crypto = require("crypto");
 const express = require("express");
 const bodyParser = require("body-parser");
 const mineflayer = require("mineflayer");
@@ -30,10 +31,82 @@ const Inventory = require("./lib/observation/inventory");
 const OnSave = require("./lib/observation/onSave");
 const Chests = require("./lib/observation/chests");
 const { plugin: tool } = require("mineflayer-tool");
+const { encodeEvents } = require("./observationDelta");
 
 let bot = null;
 let _stepAbort = null;  // set to a resolve fn while a /step is in progress
 
+// Program bundles uploaded through /programs, keyed by the sha256 of their source.
+// Steps reference a bundle by hash so the library is only sent once per session.
+const MAX_REGISTERED_PROGRAMS = 64;
+const registeredPrograms = new Map();
+
+// Observation wire formats. bot.observe() returns the events as a JSON string, which
+// older bridges expect wrapped in JSON once more. A client sending
+// "Accept: application/json" gets the events array itself, and
+// "Accept: application/msgpack" gets it as MessagePack when @msgpack/msgpack is installed.
+let msgpack = null;
+try {
+    msgpack = require("@msgpack/msgpack");
+} catch (e) {
+    console.log("@msgpack/msgpack not installed, observations are sent as JSON");
+}
+
+// Delta observations. A client sending `observationDelta` gets
+// {session, seq, base, events} instead of the events, each event a patch against the
+// one before (see observationDelta.js). The first event is patched against the last
+// event of observation `base`, which the client names in observationSession and
+// observationSeq; if it does not hold the last observation sent (after /start, a
+// restart of this server or a response it never got) base is null and the first
+// event is patched against {}, a full snapshot. GET /observation/:seq sends the last
+// observation again in full.
+const OBSERVATION_SESSION = crypto.randomBytes(8).toString("hex");
+let observationSeq = 0;
+// {seq, events, payload} of the last observation sent, payload being its last event's
+let lastObservation = null;
+
+function frameObservation(seq, base, events) {
+    return JSON.stringify({
+        session: OBSERVATION_SESSION,
+        seq,
+        base: base ? base.seq : null,
+        events: encodeEvents(base ? base.payload : {}, events),
+    });
+}
+
+function encodeObservation(req, observation) {
+    if (!req.body.observationDelta) return observation;
+    const events = JSON.parse(observation);
+    const base =
+        lastObservation &&
+        req.body.observationSession === OBSERVATION_SESSION &&
+        req.body.observationSeq === lastObservation.seq
+            ? lastObservation
+            : null;
+    observationSeq += 1;
+    const framed = frameObservation(observationSeq, base, events);
+    // an observation without events leaves the base of the next one as it was
+    const payload = events.length ? events[events.length - 1][1] : base ? base.payload : {};
+    lastObservation = { seq: observationSeq, events, payload };
+    return framed;
+}
+
+function sendObservation(req, res, observation) {
+    writeObservation(req, res, encodeObservation(req, observation));
+}
+
+function writeObservation(req, res, observation) {
+    const accept = req.get("Accept") || "";
+    if (msgpack && accept.includes("application/msgpack")) {
+        const encoded = msgpack.encode(JSON.parse(observation));
+        res.type("application/msgpack").send(Buffer.from(encoded.buffer, encoded.byteOffset, encoded.byteLength));
+    } else if (accept.includes("application/json")) {
+        res.type("application/json").send(observation);
+    } else {
+        res.json(observation);
+    }
+}
+
 const app = express();
 
 app.use(bodyParser.json({ limit: "50mb" }));
@@ -43,6 +116,7 @@ app.post("/start", (req, res) => {
     log("START", { host: req.body.host, port: req.body.port, username: req.body.username, reset: req.body.reset });
     if (bot) onDisconnect("Restarting bot");
     bot = null;
+    lastObservation = null;
     console.log(req.body);
     bot = mineflayer.createBot({
         host: req.body.host, // minecraft server ip
@@ -54,11 +128,7 @@ app.post("/start", (req, res) => {
     bot.once("error", onConnectionFailed);
 
     // Event subscriptions
-    bot.waitTicks = req.body.waitTicks;
-    bot.globalTickCounter = 0;
-    bot.stuckTickCounter = 0;
-    bot.stuckPosList = [];
-    bot.iron_pickaxe = false;
+    bot.connection = connectionKey(req.body);
 
     bot.on("kicked", onDisconnect);
 
@@ -69,49 +139,7 @@ app.post("/start", (req, res) => {
 
     bot.once("spawn", async () => {
         bot.removeListener("error", onConnectionFailed);
-        let itemTicks = 1;
-        if (req.body.reset === "hard") {
-            bot.chat("/clear @s");
-            bot.chat("/kill @s");
-            const inventory = req.body.inventory ? req.body.inventory : {};
-            const equipment = req.body.equipment
-                ? req.body.equipment
-                : [null, null, null, null, null, null];
-            for (let key in inventory) {
-                bot.chat(`/give @s minecraft:${key} ${inventory[key]}`);
-                itemTicks += 1;
-            }
-            const equipmentNames = [
-                "armor.head",
-                "armor.chest",
-                "armor.legs",
-                "armor.feet",
-                "weapon.mainhand",
-                "weapon.offhand",
-            ];
-            for (let i = 0; i < 6; i++) {
-                if (i === 4) continue;
-                if (equipment[i]) {
-                    bot.chat(
-                        `/item replace entity @s ${equipmentNames[i]} with minecraft:${equipment[i]}`
-                    );
-                    itemTicks += 1;
-                }
-            }
-        }
-
-        if (req.body.position) {
-            bot.chat(
-                `/tp @s ${req.body.position.x} ${req.body.position.y} ${req.body.position.z}`
-            );
-        }
-
-        // if iron_pickaxe is in bot's inventory
-        if (
-            bot.inventory.items().find((item) => item.name === "iron_pickaxe")
-        ) {
-            bot.iron_pickaxe = true;
-        }
+        const itemTicks = resetBotState(bot, req.body);
 
         const { pathfinder } = require("mineflayer-pathfinder");
         const tool = require("mineflayer-tool").plugin;
@@ -145,7 +173,7 @@ app.post("/start", (req, res) => {
         }
 
         await bot.waitForTicks(bot.waitTicks * itemTicks);
-        res.json(bot.observe());
+        sendObservation(req, res, bot.observe());
 
         initCounter(bot);
         bot.chat("/gamerule keepInventory true");
@@ -167,19 +195,180 @@ app.post("/start", (req, res) => {
     }
 });
 
+// The server and username a bot was created for; /reset only reuses a bot for the same one.
+function connectionKey(body) {
+    return `${body.host}:${body.port}:${body.username}`;
+}
+
+// Resets the per-episode state of a spawned bot as /start asks for: with reset "hard"
+// the inventory is cleared (and the bot killed) and the given items and equipment are
+// handed out, and with a position the bot is teleported there. Returns how many
+// waitTicks the server needs to apply the commands.
+function resetBotState(bot, body) {
+    resetObservations(bot);
+    bot.waitTicks = body.waitTicks;
+    bot.globalTickCounter = 0;
+    bot.stuckTickCounter = 0;
+    bot.stuckPosList = [];
+    bot.iron_pickaxe = false;
+    let itemTicks = 1;
+    if (body.reset === "hard") {
+        bot.chat("/clear @s");
+        bot.chat("/kill @s");
+        const inventory = body.inventory ? body.inventory : {};
+        const equipment = body.equipment
+            ? body.equipment
+            : [null, null, null, null, null, null];
+        for (let key in inventory) {
+            bot.chat(`/give @s minecraft:${key} ${inventory[key]}`);
+            itemTicks += 1;
+        }
+        const equipmentNames = [
+            "armor.head",
+            "armor.chest",
+            "armor.legs",
+            "armor.feet",
+            "weapon.mainhand",
+            "weapon.offhand",
+        ];
+        for (let i = 0; i < 6; i++) {
+            if (i === 4) continue;
+            if (equipment[i]) {
+                bot.chat(
+                    `/item replace entity @s ${equipmentNames[i]} with minecraft:${equipment[i]}`
+                );
+                itemTicks += 1;
+            }
+        }
+    }
+
+    if (body.position) {
+        bot.chat(
+            `/tp @s ${body.position.x} ${body.position.y} ${body.position.z}`
+        );
+    }
+
+    // if iron_pickaxe is in bot's inventory
+    if (
+        bot.inventory.items().find((item) => item.name === "iron_pickaxe")
+    ) {
+        bot.iron_pickaxe = true;
+    }
+    return itemTicks;
+}
+
+// Drops what the observation modules remember of the episode (known chests, block
+// records, undelivered events), so a warm reset starts from what obs.inject gives a
+// new bot. A bot that has not been injected yet (/start) has nothing to drop.
+function resetObservations(bot) {
+    if (!bot.obsList) return;
+    bot.cumulativeObs = [];
+    bot.eventMemory = {};
+    bot.obsList.forEach((observation) => {
+        observation.reset();
+        // Chests has no reset of its own
+        if (observation.chestsItems) observation.chestsItems = {};
+    });
+}
+
+// Stops whatever the plugins of the bot are still doing from an aborted step.
+function stopBotActivity() {
+    if (!bot) return;
+    try { if (bot.pathfinder) bot.pathfinder.setGoal(null); } catch(e) {}
+    try { if (bot.pvp)        bot.pvp.stop();               } catch(e) {}
+    try { if (bot.collectBlock) bot.collectBlock.cancelTask(); } catch(e) {}
+}
+
+// Warm reset: the same as /start, but keeps the connected bot, its plugins and this
+// process instead of logging in again. Answers 409 when there is no spawned bot for
+// the requested server and username, or /start replaced it meanwhile; the client then
+// logs in through /start on this process.
+app.post("/reset", async (req, res) => {
+    log("RESET", { username: req.body.username, reset: req.body.reset });
+    if (!bot || !bot.entity || bot.connection !== connectionKey(req.body)) {
+        res.status(409).json({ error: "No bot to reset, use /start" });
+        return;
+    }
+    if (_stepAbort) { _stepAbort(); _stepAbort = null; }
+    stopBotActivity();
+    const resetBot = bot;
+    lastObservation = null;
+    const itemTicks = resetBotState(resetBot, req.body);
+    if (req.body.spread) {
+        resetBot.chat(`/spreadplayers ~ ~ 0 300 under 80 false @s`);
+        await resetBot.waitForTicks(resetBot.waitTicks);
+    }
+    await resetBot.waitForTicks(resetBot.waitTicks * itemTicks);
+    if (bot !== resetBot) {
+        // a /start during the wait ended the bot stopped above and made its own; the client
+        // logs in through /start again (see VoyagerEnv.reset_bot)
+        res.status(409).json({ error: "Bot was replaced during the reset" });
+        return;
+    }
+    // initCounter ran once at /start for this bot, the time of day cycle carries over like the bot
+    sendObservation(req, res, resetBot.observe());
+});
+
+app.get("/observation/:seq", (req, res) => {
+    const seq = Number(req.params.seq);
+    if (!lastObservation || lastObservation.seq !== seq) {
+        res.status(404).json({ error: "Observation not available", seq: lastObservation && lastObservation.seq });
+        return;
+    }
+    writeObservation(req, res, frameObservation(seq, null, lastObservation.events));
+});
+
 app.post("/abort", (req, res) => {
     log("ABORT", "aborting current step");
-    if (bot) {
-        try { if (bot.pathfinder) bot.pathfinder.setGoal(null); } catch(e) {}
-        try { if (bot.pvp)        bot.pvp.stop();               } catch(e) {}
-        try { if (bot.collectBlock) bot.collectBlock.cancelTask(); } catch(e) {}
-    }
+    stopBotActivity();
     if (_stepAbort) { _stepAbort(); _stepAbort = null; }
     res.json({ status: 'aborted' });
 });
 
+app.post("/programs", (req, res) => {
+    const programs = req.body.programs || "";
+    const programsHash = crypto
+        .createHash("sha256")
+        .update(programs, "utf8")
+        .digest("hex");
+    if (req.body.programsHash && req.body.programsHash !== programsHash) {
+        res.status(400).json({ error: "Programs hash mismatch", programsHash });
+        return;
+    }
+    // re-insert so the most recently used bundles are evicted last
+    registeredPrograms.delete(programsHash);
+    registeredPrograms.set(programsHash, programs);
+    while (registeredPrograms.size > MAX_REGISTERED_PROGRAMS) {
+        registeredPrograms.delete(registeredPrograms.keys().next().value);
+    }
+    log("PROGRAMS", { programsHash, length: programs.length });
+    res.json({ programsHash });
+});
+
 app.post("/step", async (req, res) => {
-    log("STEP", { code: req.body.code });
+    log("STEP", { code: req.body.code, programsHash: req.body.programsHash, togglePause: req.body.togglePause });
+    let programs = req.body.programs || "";
+    if (req.body.programsHash) {
+        if (!registeredPrograms.has(req.body.programsHash)) {
+            res.status(409).json({
+                error: "Unknown programs hash",
+                programsHash: req.body.programsHash,
+            });
+            return;
+        }
+        programs = registeredPrograms.get(req.body.programsHash);
+        registeredPrograms.delete(req.body.programsHash);
+        registeredPrograms.set(req.body.programsHash, programs);
+    }
+    // With togglePause the client leaves the server paused: the step unpauses it here and
+    // pauses it again before answering, saving the two /pause round trips. The unpause takes
+    // effect during the waitTicks before the code runs. X-Paused tells the client the state.
+    const togglePause = Boolean(req.body.togglePause) && Boolean(bot);
+    const stepBot = bot;
+    if (togglePause) {
+        bot.chat("/pause");
+        res.set("X-Paused", "0");
+    }
     // import useful package
     let response_sent = false;
 
@@ -188,9 +377,10 @@ app.post("/step", async (req, res) => {
         response_sent = true;
         try {
             if (status !== 200) {
-                res.status(status).json({ error: "Internal mineflayer error" });
+                repauseThen(() => res.status(status).json({ error: "Internal mineflayer error" }));
             } else if (bot) {
-                res.json(bot.observe());
+                const observation = bot.observe();
+                repauseThen(() => sendObservation(req, res, observation));
             } else {
                 res.status(500).json({ error: "Bot is not available" });
             }
@@ -199,6 +389,19 @@ app.post("/step", async (req, res) => {
         }
     }
 
+    // pause again for a togglePause step, unless /start replaced the bot in the meantime
+    function repauseThen(send) {
+        if (!togglePause || bot !== stepBot) {
+            send();
+            return;
+        }
+        bot.chat("/pause");
+        bot.waitForTicks(bot.waitTicks).then(() => {
+            res.set("X-Paused", "1");
+            send();
+        }, send);
+    }
+
     function otherError(err) {
         // Remove ourselves immediately to prevent recursive calls
         process.off("uncaughtException", otherError);
@@ -283,7 +486,6 @@ app.post("/step", async (req, res) => {
 
     // Retrieve array form post bod
     const code = req.body.code;
-    const programs = req.body.programs;
     bot.cumulativeObs = [];
     await bot.waitForTicks(bot.waitTicks);
     const abortPromise = new Promise(resolve => { _stepAbort = resolve; });
@@ -485,6 +687,10 @@ app.post("/pause", (req, res) => {
 
 const DEFAULT_PORT = 3000;
 const PORT = process.argv[2] || DEFAULT_PORT;
-app.listen(PORT, () => {
+const server = app.listen(PORT, () => {
     console.log(`Server started on port ${PORT}`);
 });
+// the bridge keeps one connection open between steps, which are often minutes apart
+// while the LLM thinks; node closes idle connections after 5 seconds by default
+server.keepAliveTimeout = 30 * 60 * 1000;
+server.headersTimeout = server.keepAliveTimeout + 1000;
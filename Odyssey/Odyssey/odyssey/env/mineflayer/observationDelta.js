@@ -0,0 +1,73 @@
+// Delta encoding of observations.
+//
+// Every event of bot.observe() carries the whole observation (status, inventory,
+// voxels, blockRecords, nearbyChests) next to its own field, and little of it changes
+// from one event to the next. Each event is sent as a patch against the event before it:
+//     set    keys whose value is new or changed, with the new value
+//     merge  keys holding objects on both sides, patched key by key (DELTA_DEPTH levels)
+//     del    keys that are gone
+//     order  the key order, only when applying the patch would not reproduce it
+// An empty patch means the event payload equals the previous one. Arrays and values
+// below DELTA_DEPTH are sent whole when they differ.
+
+const DELTA_DEPTH = 2;
+
+function isPlainObject(value) {
+    return value !== null && typeof value === "object" && !Array.isArray(value);
+}
+
+function diffObservation(prev, next, depth = DELTA_DEPTH) {
+    const set = {};
+    const merge = {};
+    const del = [];
+    let changed = false;
+    for (const key of Object.keys(prev)) {
+        if (!(key in next)) {
+            del.push(key);
+            changed = true;
+        }
+    }
+    for (const [key, value] of Object.entries(next)) {
+        if (!(key in prev)) {
+            set[key] = value;
+            changed = true;
+            continue;
+        }
+        const old = prev[key];
+        if (depth > 0 && isPlainObject(old) && isPlainObject(value)) {
+            const sub = diffObservation(old, value, depth - 1);
+            if (Object.keys(sub).length) {
+                merge[key] = sub;
+                changed = true;
+            }
+        } else if (old !== value && JSON.stringify(old) !== JSON.stringify(value)) {
+            set[key] = value;
+            changed = true;
+        }
+    }
+    const patch = {};
+    if (!changed) return patch;
+    if (Object.keys(set).length) patch.set = set;
+    if (Object.keys(merge).length) patch.merge = merge;
+    if (del.length) patch.del = del;
+    // the client keeps the previous order and appends new keys
+    const order = Object.keys(next);
+    const expected = Object.keys(prev).filter((key) => key in next);
+    for (const key of order) {
+        if (!(key in prev)) expected.push(key);
+    }
+    if (expected.some((key, i) => key !== order[i])) patch.order = order;
+    return patch;
+}
+
+// Patches for a list of [type, payload] events, the first one against `base`.
+function encodeEvents(base, events) {
+    let prev = base;
+    return events.map(([type, payload]) => {
+        const patch = diffObservation(prev, payload);
+        prev = payload;
+        return [type, patch];
+    });
+}
+
+module.exports = { DELTA_DEPTH, diffObservation, encodeEvents };
@@ -0,0 +1,173 @@
+"""
+Pool of pre-started mineflayer processes.
+
+`node index.js` loads mineflayer and all its plugins before the server
+listens, which takes seconds every time a VoyagerEnv starts one: when a bot
+is created, on a full reset and after a crash. MineflayerPool keeps `size`
+idle processes started on free ports from `ports`. VoyagerEnv leases one
+instead of starting its own and a background thread starts the replacement.
+A process serves a single lease: release() stops it and frees its port, so
+no bot inherits another one's state. One pool can be shared by all the envs
+of a Python process.
+"""
+import os
+import socket
+import threading
+import time
+
+import odyssey.utils as U
+from odyssey.utils.logger import get_logger
+
+from .process_monitor import SubprocessMonitor
+
+__all__ = ["MineflayerPool"]
+
+
+def port_free(port, host="127.0.0.1"):
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        # as node does, so ports of stopped processes with connections in TIME_WAIT count as free
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            sock.bind((host, port))
+        except OSError:
+            return False
+    return True
+
+
+class MineflayerPool:
+    def __init__(self, size=2, ports=range(3100, 3200), log_path="./logs", retry_delay=5):
+        self.size = size
+        self.ports = list(ports)
+        self.log_path = log_path
+        self.retry_delay = retry_delay
+        self.logger = get_logger("MineflayerPool")
+        U.f_mkdir(log_path, "mineflayer")
+        self.leases = 0
+        self.warm_leases = 0
+        self.started = 0
+        self.failed = 0
+        self._idle = []
+        self._reserved = set()
+        self._starting = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._refill = threading.Thread(target=self._run, name="MineflayerPool", daemon=True)
+        self._refill.start()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "size": self.size,
+                "idle": len(self._idle),
+                "starting": self._starting,
+                "leases": self.leases,
+                "warm_leases": self.warm_leases,
+                "started": self.started,
+                "failed": self.failed,
+            }
+
+    def lease(self):
+        """A running mineflayer process, its port in `.port`. Starts one here if none is idle."""
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Mineflayer pool is closed")
+            self.leases += 1
+            while self._idle:
+                process = self._idle.pop(0)
+                if process.is_running:
+                    self.warm_leases += 1
+                    self._cond.notify_all()
+                    return process
+                self._reserved.discard(process.port)
+            port = self._reserve_port()
+            self._cond.notify_all()
+        process = self._start(port)
+        if process is None:
+            raise RuntimeError("Mineflayer process failed to start")
+        return process
+
+    def release(self, process):
+        """Stop a leased process and free its port."""
+        self._stop(process)
+        with self._cond:
+            self._reserved.discard(process.port)
+            self._cond.notify_all()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._cond.notify_all()
+        for process in idle:
+            self.release(process)
+
+    def _reserve_port(self):
+        for port in self.ports:
+            if port not in self._reserved and port_free(port):
+                self._reserved.add(port)
+                return port
+        raise RuntimeError(f"No free port for mineflayer in {self.ports[0]}-{self.ports[-1]}")
+
+    def get_mineflayer_process(self, port):
+        file_path = os.path.abspath(os.path.dirname(__file__))
+        process = SubprocessMonitor(
+            commands=[
+                "node",
+                U.f_join(file_path, "mineflayer/index.js"),
+                str(port),
+            ],
+            name=f"mineflayer-{port}",
+            ready_match=r"Server started on port (\d+)",
+            log_path=U.f_join(self.log_path, "mineflayer"),
+        )
+        process.port = port
+        return process
+
+    @staticmethod
+    def _stop(process):
+        process.stop()
+        # ports are reused, do not let the loggers of old processes pile up file handlers
+        for handler in process.logger.handlers[:]:
+            process.logger.removeHandler(handler)
+            handler.close()
+
+    def _start(self, port):
+        """Start a process on a reserved port; None (and the port freed) if it does not come up."""
+        process = self.get_mineflayer_process(port)
+        process.run()
+        if process.is_running and process.ready_line is not None:
+            with self._cond:
+                self.started += 1
+            return process
+        self.logger.warning(f"Mineflayer process on port {port} failed to start")
+        self._stop(process)
+        with self._cond:
+            self.failed += 1
+            self._reserved.discard(port)
+        return None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._closed and len(self._idle) + self._starting >= self.size:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                try:
+                    port = self._reserve_port()
+                except RuntimeError as e:
+                    self.logger.warning(f"{e}, retrying in {self.retry_delay} seconds")
+                    self._cond.wait(self.retry_delay)
+                    continue
+                self._starting += 1
+            process = self._start(port)
+            with self._cond:
+                self._starting -= 1
+                closed = self._closed
+                if process is not None and not closed:
+                    self._idle.append(process)
+                    self._cond.notify_all()
+            if process is None:
+                time.sleep(self.retry_delay)
+            elif closed:
+                self.release(process)
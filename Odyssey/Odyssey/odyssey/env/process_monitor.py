@@ -44,7 +44,8 @@ class SubprocessMonitor:
 
     def _start(self):
         self.logger.info(f"Starting subprocess with commands: {self.commands}")
-        if self.process is not None:
+        # a crashed process may already be gone, terminating it would kill this thread before ready_event is set
+        if self.process is not None and self.process.is_running():
             self.process.terminate()
             self.process.wait()
         self.process = psutil.Popen(
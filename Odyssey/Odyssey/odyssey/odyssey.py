@@ -1,13 +1,11 @@
-import copy
 import json
 import os
 import time
 import threading
 from typing import Dict
 
-from javascript import require
 import odyssey.utils as U
-from .env import VoyagerEnv
+from .env import VoyagerEnv, MineflayerPool
 
 from .agents import ActionAgent
 from .agents import CommentAgent
@@ -16,8 +14,12 @@ from .agents import PlannerAgent
 from .agents import SkillManager
 
 # add llama
-from .agents.llama import call_with_messages, ModelType
+from .agents.llama import (
+    call_with_messages, ModelType, configure_cache as configure_llm_cache, configure_single_flight,
+    configure_hedging, cache_stats, single_flight_stats, latency_stats,
+)
 from .utils.logger import get_logger, Timer
+from .utils.js_utils import extract_program_file, program_cache_info
 
 # TODO: remove event memory
 class Odyssey:
@@ -30,6 +32,10 @@ class Odyssey:
         environment: str = None,
         env_wait_ticks: int = 20,
         env_request_timeout: int = 600,
+        env_observation_format: str = "json",
+        env_delta_observations: bool = True,
+        env_warm_reset: bool = True,
+        env_mineflayer_pool: MineflayerPool = None,
         max_iterations: int = 160,
         reset_placed_if_failed: bool = False,
         action_agent_model_name: str = ModelType.LLAMA3_8B_V3,
@@ -55,7 +61,14 @@ class Odyssey:
         resume: bool = False,
         reload = False,
         embedding_dir = "",
-        username = 'bot'
+        username = 'bot',
+        llm_cache_dir: str = "./llm_cache",
+        llm_cache_agents: Dict[str, int] = None,
+        llm_cache_max_mb: int = 512,
+        llm_single_flight_dir: str = None,
+        llm_hedge_agents: Dict[str, float] = None,
+        llm_hedge_min_samples: int = 20,
+        llm_hedge_min_delay: float = 1.0,
     ):
         """
         The main class for Odyssey.
@@ -71,6 +84,12 @@ class Odyssey:
         you should increase this value
         :param env_request_timeout: how many seconds to wait for each step, if the code execution exceeds this time,
         python side will terminate the connection and need to be resumed
+        :param env_observation_format: how mineflayer sends observations, "json" or "msgpack" (needs msgpack
+        installed on both sides)
+        :param env_delta_observations: whether mineflayer sends each observation as a patch against the previous one
+        :param env_warm_reset: whether resets reuse the running mineflayer process and its connected bot
+        :param env_mineflayer_pool: a MineflayerPool to lease pre-started mineflayer processes from, server_port is
+        then unused; one pool can be shared by several Odyssey instances
         :param reset_placed_if_failed: whether to reset placed blocks if failed, useful for building task
         :param action_agent_model_name: action agent model name
         :param action_agent_temperature: action agent temperature
@@ -107,6 +126,18 @@ class Odyssey:
         :param ckpt_dir: checkpoint dir
         :param skill_library_dir: skill library dir
         :param resume: whether to resume from checkpoint
+        :param llm_cache_dir: directory of the LLM response cache, shared by every bot pointing at it
+        :param llm_cache_agents: agents whose responses are cached, mapped to a TTL in seconds (None never
+        expires), e.g. {"critic": 86400, "skill_description": None}. Off by default: a cached response is
+        returned for every later identical prompt, so sampling at a non-zero temperature stops varying
+        :param llm_cache_max_mb: size bound of the cache, least recently used responses are evicted
+        :param llm_single_flight_dir: identical prompts in flight at the same time always share one request
+        within the process; with a directory, bots using the same one share them across processes too
+        :param llm_hedge_agents: agents whose slow requests are hedged, mapped to a deadline in seconds after
+        which a second identical request is sent (None uses the agent's p95 latency), e.g. {"critic": None}.
+        Off by default: a hedged request that is sent is paid for, whichever one wins
+        :param llm_hedge_min_samples: latencies an agent needs before its p95 is used as deadline
+        :param llm_hedge_min_delay: lower bound of p95 deadlines, in seconds
         """
         # init env
         self.username = username
@@ -117,6 +148,10 @@ class Odyssey:
             azure_login=azure_login,
             server_port=server_port,
             request_timeout=env_request_timeout,
+            observation_format=env_observation_format,
+            delta_observations=env_delta_observations,
+            warm_reset=env_warm_reset,
+            mineflayer_pool=env_mineflayer_pool,
         )
         self.env_wait_ticks = env_wait_ticks
         self.reset_placed_if_failed = reset_placed_if_failed
@@ -129,6 +164,13 @@ class Odyssey:
         self.planner_agent_qa_model_name = planner_agent_qa_model_name
         self.critic_agent_model_name = critic_agent_model_name
         self.comment_agent_model_name = comment_agent_model_name
+        if llm_cache_agents is None:
+            llm_cache_agents = {}
+        configure_llm_cache(llm_cache_dir, llm_cache_agents, max_bytes=llm_cache_max_mb * 2 ** 20)
+        configure_single_flight(llm_single_flight_dir)
+        if llm_hedge_agents is None:
+            llm_hedge_agents = {}
+        configure_hedging(llm_hedge_agents, min_samples=llm_hedge_min_samples, min_delay=llm_hedge_min_delay)
 
         # set openai api key
         # os.environ["OPENAI_API_KEY"] = openai_api_key
@@ -174,6 +216,8 @@ class Odyssey:
             resume=True if resume or skill_library_dir else False,
             reload=reload,
             embedding_model=embedding_dir,
+            # bots sharing a skill library keep what they learn in their own ckpt until it is merged
+            overlay_dir=ckpt_dir if skill_library_dir and os.path.abspath(skill_library_dir) != os.path.abspath(ckpt_dir) else None,
         )
         self.environment = environment
         self.skills = [[], []]
@@ -229,6 +273,14 @@ class Odyssey:
         self.conversations = []
         return self.messages
 
+    def llm_stats(self):
+        """Response cache, request coalescing and per-agent latency / hedging counters of the LLM client."""
+        return {
+            "cache": cache_stats(),
+            "single_flight": single_flight_stats(),
+            "latency": latency_stats(),
+        }
+
     def request_stop(self):
         """Signal the learn() loop to exit after the current step."""
         self._stop_flag.set()
@@ -243,7 +295,7 @@ class Odyssey:
         # modify
         with Timer('step: Select Skill'):
             self.logger.debug(f'human mesasges: {self.messages[1].content}')
-            ai_message = call_with_messages(self.messages, self.action_agent_model_name)
+            ai_message = call_with_messages(self.messages, self.action_agent_model_name, agent="action")
             self.logger.debug(f"response: {ai_message.content}")
         turn = (self.messages[0].content, self.messages[1].content, ai_message.content)
         self.conversations.append(turn)
@@ -260,7 +312,7 @@ class Odyssey:
             with Timer('env step'):
                 events = self.env.step(
                     code,
-                    programs=self.skill_manager.programs,
+                    programs=self.skill_manager.get_program_closure(code),
                 )
             self.totoal_time, self.total_iter = self.recorder.record(events, self.task)
             self.action_agent.update_chest_memory(events[-1][1]["nearbyChests"])
@@ -295,9 +347,10 @@ class Odyssey:
                         position = event["status"]["position"]
                         blocks.append(block)
                         positions.append(position)
+                give_back_code = f"await givePlacedItemBack(bot, {U.json_dumps(blocks)}, {U.json_dumps(positions)})"
                 new_events = self.env.step(
-                    f"await givePlacedItemBack(bot, {U.json_dumps(blocks)}, {U.json_dumps(positions)})",
-                    programs=self.skill_manager.programs,
+                    give_back_code,
+                    programs=self.skill_manager.get_program_closure(give_back_code),
                 )
                 events[-1][1]["inventory"] = new_events[-1][1]["inventory"]
                 events[-1][1]["voxels"] = new_events[-1][1]["voxels"]
@@ -314,7 +367,7 @@ class Odyssey:
                 critique=critique,
                 skills=self.skills[1]
             )
-            self.last_events = copy.deepcopy(events)
+            self.last_events = events
             self.messages = [system_message, human_message]
         else:
             assert isinstance(parsed_result, str)
@@ -352,6 +405,7 @@ class Odyssey:
             messages, reward, done, info = self.step()
             if done:
                 break
+        self.logger.debug(f"LLM latency per agent: {latency_stats()}")
         return messages, reward, done, info
 
     def learn(self, goals=None, reset_env=True):
@@ -622,45 +676,11 @@ class Odyssey:
         retry = 3
         while retry > 0:
             try:
-                babel = require("@babel/core")
-                babel_generator = require("@babel/generator").default
-
-                with open(f"{skill_path}", 'r') as file:
-                    code = file.read()
-
-                parsed = babel.parse(code)
-                functions = []
-                assert len(list(parsed.program.body)) > 0, "No functions found"
-                for i, node in enumerate(parsed.program.body):
-                    if node.type != "FunctionDeclaration":
-                        continue
-                    node_type = (
-                        "AsyncFunctionDeclaration"
-                        if node["async"]
-                        else "FunctionDeclaration"
-                    )
-                    functions.append(
-                        {
-                            "name": node.id.name,
-                            "type": node_type,
-                            "body": babel_generator(node).code,
-                            "params": list(node["params"]),
-                        }
-                    )
-                # find the last async function
-                main_function = None
-                for function in reversed(functions):
-                    if function["type"] == "AsyncFunctionDeclaration":
-                        main_function = function
-                        break
-                assert (
-                    main_function is not None
-                ), "No async function found. Your main function must be async."
+                program = extract_program_file(skill_path)
                 assert (
-                    main_function["params"][0].name == "bot"
-                ), f"Main function {main_function['name']} must take a single argument named 'bot'"
-                
-                program_code = "\n\n".join(function["body"] for function in functions)
+                    program["params"][:1] == ("bot",)
+                ), f"Main function {program['program_name']} must take a single argument named 'bot'"
+
                 para_list = "(bot"
                 for i in range(len(parameters)):
                     if isinstance(parameters[i], str):
@@ -668,16 +688,17 @@ class Odyssey:
                     else:
                         para_list += ", " + str(parameters[i])
                 para_list += ");"
-                exec_code = f"await {main_function['name']}{para_list}"
+                exec_code = f"await {program['program_name']}{para_list}"
                 parsed_result = {
-                    "program_code": program_code,
-                    "program_name": main_function["name"],
+                    "program_code": program["program_code"],
+                    "program_name": program["program_name"],
                     "exec_code": exec_code,
                 }
                 break
             except Exception as e:
                 retry -= 1
                 parsed_result = f"Error parsing action response (before program execution): {e}"
+        self.logger.debug(f"Skill parse cache: {program_cache_info()}")
 
         result = ''
         if isinstance(parsed_result, dict):
@@ -685,13 +706,13 @@ class Odyssey:
             self.skill_manager.programs = skill_lib # use old or new skill library
             events = self.env.step(
                 code,
-                programs=self.skill_manager.programs,
+                programs=self.skill_manager.get_program_closure(code),
             )
             for event in reversed(events):
                 if event[0] == 'onChat':
                     result = event[1]['onChat']
                     break
-            self.last_events = copy.deepcopy(events)
+            self.last_events = events
         else:
             self.logger.warning(f"{parsed_result} Code executes error!")
         
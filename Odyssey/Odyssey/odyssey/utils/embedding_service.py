@@ -0,0 +1,247 @@
+"""
+Local embedding service.
+
+Holds one copy of each sentence model and serves embedding requests over a
+Unix socket, so every bot process on the machine shares the same weights
+instead of loading its own. Opt in by starting the service
+
+    python -m odyssey.utils.embedding_service [--model PATH] [--socket PATH]
+
+and setting EMBEDDING_SOCKET in conf/config.json to the same socket path;
+`get_embeddings` then returns an `EmbeddingClient` instead of loading the
+model. Requests from different bots are coalesced into shared forward passes.
+
+    python -m odyssey.utils.embedding_service --stats [--socket PATH]
+
+prints the service's RSS, the memory held by the models, an estimate of what
+the clients would have used on their own, and per-request latency.
+
+Messages are JSON objects prefixed with their 4-byte big-endian length:
+    {"op": "embed", "model": ..., "texts": [...], "pid": ...} -> {"vectors": [...]}
+    {"op": "stats"} -> {"rss_bytes": ..., "latency_ms": {...}, ...}
+"""
+import argparse
+import collections
+import json
+import os
+import socket
+import socketserver
+import statistics
+import struct
+import threading
+import time
+
+import psutil
+
+from .embeddings import BatchedEmbeddings
+from .logger import get_logger
+
+__all__ = ["EmbeddingClient", "EmbeddingService"]
+
+DEFAULT_SOCKET = "/tmp/odyssey-embeddings.sock"
+_HEADER = struct.Struct(">I")
+
+
+def _send(sock, obj):
+    data = json.dumps(obj).encode("utf-8")
+    sock.sendall(_HEADER.pack(len(data)) + data)
+
+
+def _recv_exact(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            raise ConnectionError("Embedding service connection closed")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def _recv(sock):
+    (size,) = _HEADER.unpack(_recv_exact(sock, _HEADER.size))
+    return json.loads(_recv_exact(sock, size))
+
+
+class EmbeddingClient:
+    """
+    Embeddings object (embed_documents / embed_query) backed by the service.
+    If the service cannot be reached, e.g. a socket file left behind by a service
+    that died, it switches to the model `fallback()` loads in process, if given.
+    """
+    def __init__(self, socket_path, model_name, timeout=120, fallback=None):
+        self.socket_path = socket_path
+        self.model_name = model_name
+        self.timeout = timeout
+        self.fallback = fallback
+        self.logger = get_logger("EmbeddingClient")
+        self._local = threading.local()
+        self._fallback_embeddings = None
+        self._fallback_lock = threading.Lock()
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.settimeout(self.timeout)
+            sock.connect(self.socket_path)
+        except OSError:
+            sock.close()
+            raise
+        return sock
+
+    def _drop(self, sock):
+        if sock is not None:
+            sock.close()
+        self._local.sock = None
+
+    def request(self, payload):
+        # one connection per thread; reconnect once if the service was restarted
+        for attempt in range(2):
+            sock = getattr(self._local, "sock", None)
+            try:
+                if sock is None:
+                    sock = self._local.sock = self._connect()
+                _send(sock, payload)
+                response = _recv(sock)
+                break
+            except (ConnectionError, BrokenPipeError):
+                self._drop(sock)
+                if attempt:
+                    raise
+            except (OSError, ValueError):
+                # a timeout or garbled reply leaves the response unread on the socket,
+                # reusing it would hand this request's vectors to the next one
+                self._drop(sock)
+                raise
+        if "error" in response:
+            raise RuntimeError(f"Embedding service error: {response['error']}")
+        return response
+
+    def _fall_back(self, error):
+        with self._fallback_lock:
+            if self._fallback_embeddings is None:
+                self.logger.warning(
+                    f"Embedding service at {self.socket_path} is unreachable ({error}), "
+                    f"loading {self.model_name} in process"
+                )
+                self._fallback_embeddings = self.fallback()
+            return self._fallback_embeddings
+
+    def embed_documents(self, texts):
+        if self._fallback_embeddings is not None:
+            return self._fallback_embeddings.embed_documents(texts)
+        try:
+            return self.request(
+                {"op": "embed", "model": self.model_name, "texts": list(texts), "pid": os.getpid()}
+            )["vectors"]
+        except (ConnectionRefusedError, FileNotFoundError) as e:
+            # only connecting raises these, the service is not there
+            if self.fallback is None:
+                raise RuntimeError(f"Embedding service at {self.socket_path} is unreachable: {e}") from e
+            return self._fall_back(e).embed_documents(texts)
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    def stats(self):
+        return self.request({"op": "stats"})
+
+
+class EmbeddingService(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path=DEFAULT_SOCKET):
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        super().__init__(socket_path, _Handler)
+        self.logger = get_logger("EmbeddingService")
+        self.models = {}
+        self.model_rss = {}
+        self.clients = set()
+        self.requests = 0
+        self.latencies = collections.deque(maxlen=10000)
+        self._models_lock = threading.Lock()
+
+    def get_model(self, model_name):
+        with self._models_lock:
+            if model_name not in self.models:
+                from langchain_community.embeddings.huggingface import HuggingFaceEmbeddings
+
+                rss = psutil.Process().memory_info().rss
+                self.models[model_name] = BatchedEmbeddings(HuggingFaceEmbeddings(model_name=model_name))
+                self.model_rss[model_name] = psutil.Process().memory_info().rss - rss
+                self.logger.info(
+                    f"Loaded {model_name} ({self.model_rss[model_name] / 2 ** 20:.0f} MiB)"
+                )
+            return self.models[model_name]
+
+    def stats(self):
+        latencies = sorted(self.latencies)
+        model_rss = sum(self.model_rss.values())
+        return {
+            "rss_bytes": psutil.Process().memory_info().rss,
+            "model_rss_bytes": model_rss,
+            "clients": len(self.clients),
+            # each client process used to load every model twice (planner and skill manager)
+            "estimated_saved_bytes": max(0, 2 * len(self.clients) - 1) * model_rss,
+            "requests": self.requests,
+            "latency_ms": {
+                "p50": statistics.median(latencies) * 1e3 if latencies else None,
+                "p95": latencies[int(0.95 * (len(latencies) - 1))] * 1e3 if latencies else None,
+                "max": latencies[-1] * 1e3 if latencies else None,
+            },
+        }
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        server = self.server
+        while True:
+            try:
+                payload = _recv(self.request)
+            except (ConnectionError, OSError):
+                return
+            except ValueError as e:
+                # the frame was read whole, so the connection is still in step
+                _send(self.request, {"error": f"Malformed request: {e}"})
+                continue
+            start = time.perf_counter()
+            try:
+                if payload["op"] == "embed":
+                    server.clients.add(payload.get("pid"))
+                    vectors = server.get_model(payload["model"]).embed_documents(payload["texts"])
+                    response = {"vectors": [list(map(float, vector)) for vector in vectors]}
+                elif payload["op"] == "stats":
+                    response = server.stats()
+                else:
+                    response = {"error": f"Unknown op {payload['op']}"}
+            except Exception as e:
+                server.logger.warning(f"Embedding request failed: {e}")
+                response = {"error": str(e)}
+            if payload.get("op") == "embed":
+                server.requests += 1
+                server.latencies.append(time.perf_counter() - start)
+            _send(self.request, response)
+
+
+if __name__ == '__main__':
+    from . import config
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--socket', default=config.get('EMBEDDING_SOCKET') or DEFAULT_SOCKET)
+    parser.add_argument('--model', default=config.get('SENTENT_EMBEDDING_DIR'),
+                        help='model to load at startup, others are loaded on first request')
+    parser.add_argument('--stats', action='store_true', help='print the stats of a running service')
+    args = parser.parse_args()
+
+    if args.stats:
+        print(json.dumps(EmbeddingClient(args.socket, args.model).stats(), indent=4))
+    else:
+        service = EmbeddingService(args.socket)
+        if args.model:
+            service.get_model(args.model)
+        service.logger.info(f"Serving embeddings on {args.socket}")
+        try:
+            service.serve_forever()
+        finally:
+            os.remove(args.socket)
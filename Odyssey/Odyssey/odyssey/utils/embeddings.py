@@ -0,0 +1,119 @@
+"""
+Embedding helpers.
+
+`BatchedEmbeddings` wraps a langchain-style embeddings object (anything with
+`embed_documents`) and funnels every call through one worker thread, which
+gathers the texts of concurrent callers for up to `max_wait` seconds or
+`max_batch_size` texts and runs them through the model in a single forward
+pass.
+
+`get_embeddings` hands out one shared instance per model and process, backed
+by the embedding service (see embedding_service.py) when EMBEDDING_SOCKET is
+set in the config, else by a local HuggingFace model.
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from .logger import get_logger
+
+__all__ = ["BatchedEmbeddings", "get_embeddings"]
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+class BatchedEmbeddings:
+    def __init__(self, embeddings, max_batch_size=64, max_wait=0.005):
+        self.embeddings = embeddings
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.batches = 0
+        self.embedded = 0
+        self._queue = queue.Queue()
+        self._worker = None
+        self._worker_lock = threading.Lock()
+
+    def embed_documents(self, texts):
+        texts = list(texts)
+        if not texts:
+            return []
+        future = Future()
+        self._ensure_worker()
+        self._queue.put((texts, future))
+        return future.result()
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    def _ensure_worker(self):
+        with self._worker_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="BatchedEmbeddings", daemon=True)
+                self._worker.start()
+
+    def _collect(self):
+        requests = [self._queue.get()]
+        size = len(requests[0][0])
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            requests.append(request)
+            size += len(request[0])
+        return requests
+
+    def _run(self):
+        while True:
+            requests = self._collect()
+            # identical texts from different callers are embedded once
+            texts = list(dict.fromkeys(text for request_texts, _ in requests for text in request_texts))
+            try:
+                vectors = []
+                for i in range(0, len(texts), self.max_batch_size):
+                    vectors += self.embeddings.embed_documents(texts[i:i + self.max_batch_size])
+                    self.batches += 1
+            except Exception as e:
+                for _, future in requests:
+                    future.set_exception(e)
+                continue
+            self.embedded += len(texts)
+            vectors = dict(zip(texts, vectors))
+            for request_texts, future in requests:
+                future.set_result([vectors[text] for text in request_texts])
+
+
+def _load_embeddings(model_name):
+    from langchain_community.embeddings.huggingface import HuggingFaceEmbeddings
+
+    return HuggingFaceEmbeddings(model_name=model_name)
+
+
+def get_embeddings(model_name):
+    with _registry_lock:
+        if model_name not in _registry:
+            from . import config
+
+            socket_path = config.get("EMBEDDING_SOCKET")
+            if socket_path and os.path.exists(socket_path):
+                from .embedding_service import EmbeddingClient
+
+                get_logger("Embeddings").info(f"Using embedding service at {socket_path} for {model_name}")
+                embeddings = EmbeddingClient(
+                    socket_path, model_name, fallback=lambda: _load_embeddings(model_name)
+                )
+            else:
+                if socket_path:
+                    get_logger("Embeddings").warning(
+                        f"No embedding service at {socket_path}, loading {model_name} in process"
+                    )
+                embeddings = _load_embeddings(model_name)
+            _registry[model_name] = BatchedEmbeddings(embeddings)
+        return _registry[model_name]
@@ -0,0 +1,372 @@
+"""
+JavaScript source utils.
+
+A small scanner that finds the top-level function declarations of a skill
+without a round-trip through Babel over the javascript bridge. It only
+understands as much of the grammar as it needs to skip strings, template
+literals, comments and regex literals and to balance brackets; anything it
+cannot follow raises JSSyntaxError and `parse_functions` falls back to Babel.
+The scanner does not validate the code inside function bodies: `check_syntax`
+does, through Babel, for skills before they are saved to the library.
+"""
+import functools
+import os
+import re
+
+__all__ = [
+    "JSSyntaxError", "extract_functions", "babel_extract_functions", "parse_functions", "check_syntax",
+    "extract_program", "extract_program_file", "program_cache_info",
+]
+
+
+class JSSyntaxError(ValueError):
+    pass
+
+
+_IDENT = re.compile(r"[A-Za-z_$\u00a0-\uffff][\w$\u00a0-\uffff]*")
+_NUMBER = re.compile(r"\.?\d[\w.]*")
+_REGEX_FLAGS = re.compile(r"[A-Za-z]*")
+
+# a `/` after one of these starts a regex literal, anywhere else it is a division
+_REGEX_PREFIX_PUNCT = set("(,=:[!&|?{};+-*%<>~^")
+_REGEX_PREFIX_KEYWORDS = {
+    "return", "typeof", "instanceof", "in", "of", "new", "delete", "void",
+    "throw", "case", "do", "else", "yield", "await",
+}
+# a newline after one of these does not end a statement
+_CONTINUATION_PUNCT = set("=(,:[?!&|+-*/%<>^~.")
+
+
+class _Token:
+    __slots__ = ("kind", "value", "start", "end")
+
+    def __init__(self, kind, value, start, end):
+        self.kind = kind
+        self.value = value
+        self.start = start
+        self.end = end
+
+
+def _scan_template(code, i):
+    """Scan template characters from `i`. Returns (end, entered_interpolation)."""
+    n = len(code)
+    while i < n:
+        c = code[i]
+        if c == "\\":
+            i += 2
+        elif c == "`":
+            return i + 1, False
+        elif c == "$" and code.startswith("{", i + 1):
+            return i + 2, True
+        else:
+            i += 1
+    raise JSSyntaxError("Unterminated template literal")
+
+
+def _regex_allowed(prev):
+    if prev is None:
+        return True
+    if prev.kind == "punct":
+        return prev.value in _REGEX_PREFIX_PUNCT
+    return prev.kind == "ident" and prev.value in _REGEX_PREFIX_KEYWORDS
+
+
+def _tokenize(code):
+    tokens = []
+    # one entry per open `{` / `${`, True for template interpolations
+    brace_stack = []
+    prev = None
+    i, n = 0, len(code)
+    while i < n:
+        c = code[i]
+        start = i
+        if c.isspace():
+            i += 1
+            continue
+        if code.startswith("//", i):
+            end = code.find("\n", i)
+            i = n if end == -1 else end
+            continue
+        if code.startswith("/*", i):
+            end = code.find("*/", i + 2)
+            if end == -1:
+                raise JSSyntaxError("Unterminated comment")
+            i = end + 2
+            continue
+        if c in "'\"":
+            i += 1
+            while i < n and code[i] != c:
+                if code[i] == "\\":
+                    i += 1
+                elif code[i] == "\n":
+                    raise JSSyntaxError(f"Unterminated string at {start}")
+                i += 1
+            if i >= n:
+                raise JSSyntaxError(f"Unterminated string at {start}")
+            i += 1
+            token = _Token("str", None, start, i)
+        elif c == "`":
+            i, interpolation = _scan_template(code, i + 1)
+            if interpolation:
+                brace_stack.append(True)
+            token = _Token("template", None, start, i)
+        elif c == "{":
+            brace_stack.append(False)
+            i += 1
+            token = _Token("punct", c, start, i)
+        elif c == "}":
+            if not brace_stack:
+                raise JSSyntaxError(f"Unexpected '}}' at {start}")
+            if brace_stack.pop():
+                i, interpolation = _scan_template(code, i + 1)
+                if interpolation:
+                    brace_stack.append(True)
+                token = _Token("template", None, start, i)
+            else:
+                i += 1
+                token = _Token("punct", c, start, i)
+        elif c == "/" and _regex_allowed(prev):
+            i += 1
+            in_class = False
+            while i < n and (in_class or code[i] != "/"):
+                if code[i] == "\\":
+                    i += 1
+                elif code[i] == "[":
+                    in_class = True
+                elif code[i] == "]":
+                    in_class = False
+                elif code[i] == "\n":
+                    raise JSSyntaxError(f"Unterminated regex at {start}")
+                i += 1
+            if i >= n:
+                raise JSSyntaxError(f"Unterminated regex at {start}")
+            i = _REGEX_FLAGS.match(code, i + 1).end()
+            token = _Token("regex", None, start, i)
+        elif c.isdigit() or (c == "." and code[i + 1:i + 2].isdigit()):
+            i = _NUMBER.match(code, i).end()
+            token = _Token("num", None, start, i)
+        else:
+            match = _IDENT.match(code, i)
+            if match:
+                i = match.end()
+                token = _Token("ident", match.group(), start, i)
+            else:
+                # ++ and -- end an operand, so they must not read as a regex prefix
+                i += 2 if code.startswith(("++", "--"), i) else 1
+                token = _Token("punct" if i - start == 1 else "op", code[start:i], start, i)
+        tokens.append(token)
+        prev = token
+    if brace_stack:
+        raise JSSyntaxError("Unbalanced braces")
+    return tokens
+
+
+def _match_close(tokens, i):
+    """Index of the bracket token closing the one at `i`."""
+    pairs = {"(": ")", "[": "]", "{": "}"}
+    stack = []
+    for j in range(i, len(tokens)):
+        token = tokens[j]
+        if token.kind != "punct":
+            continue
+        if token.value in pairs:
+            stack.append(pairs[token.value])
+        elif token.value in ")]}":
+            if not stack or stack.pop() != token.value:
+                raise JSSyntaxError(f"Unbalanced '{token.value}' at {token.start}")
+            if not stack:
+                return j
+    raise JSSyntaxError(f"Unclosed '{tokens[i].value}' at {tokens[i].start}")
+
+
+def _param_names(tokens):
+    names = []
+    param = []
+    depth = 0
+    for token in tokens + [None]:
+        if token is None or (depth == 0 and token.kind == "punct" and token.value == ","):
+            # rest parameters are tokenized as three '.' puncts before the name
+            while param and param[0].value == ".":
+                param.pop(0)
+            if param:
+                names.append(param[0].value if param[0].kind == "ident" else None)
+            param = []
+            continue
+        if token.kind == "punct" and token.value in "([{":
+            depth += 1
+        elif token.kind == "punct" and token.value in ")]}":
+            depth -= 1
+        param.append(token)
+    return names
+
+
+def _is_statement_start(code, prev, token):
+    if prev is None or (prev.kind == "punct" and prev.value in ";}"):
+        return True
+    if prev.kind in ("punct", "op") and prev.value in _CONTINUATION_PUNCT:
+        return False
+    if prev.kind == "ident" and prev.value in _REGEX_PREFIX_KEYWORDS:
+        return False
+    # automatic semicolon insertion
+    return "\n" in code[prev.end:token.start]
+
+
+def extract_functions(code):
+    """
+    Top-level function declarations of `code`, in source order.
+
+    Returns dicts with the same keys the Babel path produces:
+    name, type ("AsyncFunctionDeclaration" / "FunctionDeclaration"),
+    body (the declaration's source), params (names, None for patterns),
+    plus the start/end source span.
+    """
+    tokens = _tokenize(code)
+    functions = []
+    depth = 0
+    prev = None
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        if depth == 0 and token.kind == "ident" and _is_statement_start(code, prev, token):
+            is_async = (
+                token.value == "async"
+                and i + 1 < len(tokens)
+                and tokens[i + 1].value == "function"
+                and "\n" not in code[token.end:tokens[i + 1].start]
+            )
+            if token.value == "function" or is_async:
+                j = i + 2 if is_async else i + 1
+                if j < len(tokens) and tokens[j].value == "*":
+                    j += 1
+                if j + 1 >= len(tokens) or tokens[j].kind != "ident" or tokens[j + 1].value != "(":
+                    raise JSSyntaxError(f"Malformed function declaration at {token.start}")
+                name = tokens[j].value
+                params_close = _match_close(tokens, j + 1)
+                if params_close + 1 >= len(tokens) or tokens[params_close + 1].value != "{":
+                    raise JSSyntaxError(f"Missing body for function {name}")
+                body_close = _match_close(tokens, params_close + 1)
+                start, end = token.start, tokens[body_close].end
+                functions.append(
+                    {
+                        "name": name,
+                        "type": "AsyncFunctionDeclaration" if is_async else "FunctionDeclaration",
+                        "body": code[start:end],
+                        "params": _param_names(tokens[j + 2:params_close]),
+                        "start": start,
+                        "end": end,
+                    }
+                )
+                prev = tokens[body_close]
+                i = body_close + 1
+                continue
+        if token.kind == "punct":
+            if token.value in "([{":
+                depth += 1
+            elif token.value in ")]}":
+                depth -= 1
+                if depth < 0:
+                    raise JSSyntaxError(f"Unbalanced '{token.value}' at {token.start}")
+        if depth == 0:
+            prev = token
+        i += 1
+    if depth != 0:
+        raise JSSyntaxError("Unbalanced brackets")
+    return functions
+
+
+def babel_extract_functions(code):
+    """Same result as `extract_functions`, parsed by Babel over the javascript bridge."""
+    from javascript import require
+
+    babel = require("@babel/core")
+    babel_generator = require("@babel/generator").default
+    parsed = babel.parse(code)
+    functions = []
+    for node in parsed.program.body:
+        if node.type != "FunctionDeclaration":
+            continue
+        functions.append(
+            {
+                "name": node.id.name,
+                "type": "AsyncFunctionDeclaration" if node["async"] else "FunctionDeclaration",
+                "body": babel_generator(node).code,
+                "params": [param.name for param in node["params"]],
+                "start": node.start,
+                "end": node.end,
+            }
+        )
+    return functions
+
+
+def check_syntax(code):
+    """Raise JSSyntaxError if Babel cannot parse `code`."""
+    from javascript import require
+
+    babel = require("@babel/core")
+    try:
+        babel.parse(code)
+    except Exception as e:
+        raise JSSyntaxError(f"Invalid JavaScript: {e}") from e
+
+
+def parse_functions(code):
+    try:
+        return extract_functions(code)
+    except JSSyntaxError:
+        return babel_extract_functions(code)
+
+
+@functools.lru_cache(maxsize=256)
+def _extract_program(code):
+    functions = parse_functions(code)
+    assert len(functions) > 0, "No functions found"
+    # find the last async function
+    main_function = None
+    for function in reversed(functions):
+        if function["type"] == "AsyncFunctionDeclaration":
+            main_function = function
+            break
+    assert (
+        main_function is not None
+    ), "No async function found. Your main function must be async."
+    return {
+        "program_code": "\n\n".join(function["body"] for function in functions),
+        "program_name": main_function["name"],
+        "params": tuple(main_function["params"]),
+    }
+
+
+def extract_program(code):
+    """
+    Program code, main function name and main function params of a skill.
+    Results are cached by source, so a skill is only parsed once per process.
+    """
+    return dict(_extract_program(code))
+
+
+@functools.lru_cache(maxsize=64)
+def _read_program_file(path, mtime_ns):
+    with open(path, 'r') as file:
+        return file.read()
+
+
+def extract_program_file(path):
+    """Same as `extract_program` for a skill file, re-read only when its mtime changes."""
+    return extract_program(_read_program_file(path, os.stat(path).st_mtime_ns))
+
+
+def program_cache_info():
+    return {
+        "parse": _extract_program.cache_info(),
+        "file": _read_program_file.cache_info(),
+    }
+
+
+if __name__ == '__main__':
+    print(extract_functions(
+        "async function mineWood(bot, count = 3) {\n"
+        "    const re = /log}/g; // }\n"
+        "    bot.chat(`mined ${count} {logs}`);\n"
+        "}\n"
+        "function helper({ a }, ...rest) { return a / 2; }\n"
+    ))
@@ -0,0 +1,125 @@
+"""
+Lexical skill index.
+
+An inverted index over skill names and descriptions. Names are split on
+camelCase (`craftIronPickaxe` -> craft, iron, pickaxe) and Minecraft item
+names from MC-Comprehensive-Skill-Library/json/map_name.json are folded into
+one token per item, so "iron ore" in a query also hits skills that talk
+about raw iron. Documents are scored with BM25, with name tokens counting
+more than description tokens.
+"""
+import math
+import os
+import re
+from collections import Counter, defaultdict
+
+from .json_utils import json_load
+
+__all__ = ["LexicalIndex", "tokenize", "load_item_synonyms"]
+
+_WORD = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+")
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "bot", "by", "can", "description", "do",
+    "for", "from", "function", "has", "how", "i", "if", "in", "into", "is", "it", "its",
+    "minecraft", "name", "of", "on", "or", "the", "then", "this", "to", "use", "using",
+    "what", "with", "you", "your",
+}
+MAP_NAME_PATH = os.path.join(
+    os.path.dirname(__file__), "..", "..", "..", "MC-Comprehensive-Skill-Library", "json", "map_name.json"
+)
+
+
+def _stem(token):
+    # plurals only, enough for "logs" / "pickaxes" / "seeds"
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def _words(text):
+    return [_stem(word.lower()) for word in _WORD.findall(text)]
+
+
+def load_item_synonyms(path=MAP_NAME_PATH):
+    """{word tuple: item token} for every item and block name in map_name.json."""
+    if not os.path.exists(path):
+        return {}
+    synonyms = {}
+    for item, sources in json_load(path).items():
+        for name in [item] + sources:
+            synonyms[tuple(_words(name))] = f"item:{item}"
+    return synonyms
+
+
+def tokenize(text, synonyms=None):
+    words = _words(text)
+    tokens = [word for word in words if word not in STOPWORDS]
+    if synonyms:
+        # every item phrase in the text adds its item token
+        lengths = {len(phrase) for phrase in synonyms}
+        for n in lengths:
+            for i in range(len(words) - n + 1):
+                item = synonyms.get(tuple(words[i:i + n]))
+                if item:
+                    tokens.append(item)
+    return tokens
+
+
+class LexicalIndex:
+    def __init__(self, skills, synonyms=None, name_weight=3.0, k1=1.2, b=0.75):
+        """`skills` is {name: description}."""
+        self.synonyms = synonyms or {}
+        self.k1 = k1
+        self.b = b
+        self.names = list(skills)
+        # name word sequences, for exact matches of a skill name inside a query
+        self.name_words = {name: tuple(_words(name)) for name in self.names}
+        self.postings = defaultdict(dict)
+        lengths = {}
+        for name, description in skills.items():
+            tf = Counter()
+            for token in tokenize(name, self.synonyms):
+                tf[token] += name_weight
+            for token in tokenize(description, self.synonyms):
+                tf[token] += 1
+            lengths[name] = sum(tf.values())
+            for token, count in tf.items():
+                self.postings[token][name] = count
+        self.lengths = lengths
+        self.avg_length = sum(lengths.values()) / max(len(lengths), 1)
+        self.idf = {
+            token: math.log(1 + (len(self.names) - len(docs) + 0.5) / (len(docs) + 0.5))
+            for token, docs in self.postings.items()
+        }
+
+    def __len__(self):
+        return len(self.names)
+
+    def exact_matches(self, query):
+        """
+        Skills whose whole camelCase name (two words or more) appears as a phrase
+        in `query`, in order of first appearance, longer names first on ties.
+        """
+        words = tuple(_words(query))
+        matches = []
+        for name, name_words in self.name_words.items():
+            n = len(name_words)
+            if n < 2:
+                continue
+            position = next((i for i in range(len(words) - n + 1) if words[i:i + n] == name_words), None)
+            if position is not None:
+                matches.append((position, -n, name))
+        return [name for _, _, name in sorted(matches)]
+
+    def search(self, query):
+        """{name: BM25 score} for every skill sharing a token with `query`."""
+        scores = defaultdict(float)
+        for token in set(tokenize(query, self.synonyms)):
+            docs = self.postings.get(token)
+            if not docs:
+                continue
+            idf = self.idf[token]
+            for name, tf in docs.items():
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[name] / self.avg_length)
+                scores[name] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return dict(scores)
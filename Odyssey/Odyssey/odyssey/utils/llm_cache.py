@@ -0,0 +1,103 @@
+"""
+Persistent LLM response cache.
+
+Responses are stored in a sqlite file keyed by a hash of the model and the
+prompt messages, so identical prompts are answered from disk across
+rollouts and across bots sharing the cache directory. The file is kept under
+`max_bytes` by evicting the least recently used entries, entries can expire
+per agent through a TTL, and hits / misses are counted per agent.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+
+__all__ = ["LLMCache", "prompt_key"]
+
+
+def prompt_key(*parts):
+    return hashlib.sha256(json.dumps(parts, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    def __init__(self, cache_dir, max_bytes=512 * 2 ** 20):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.path = os.path.join(cache_dir, "responses.sqlite")
+        self.max_bytes = max_bytes
+        self.counters = defaultdict(lambda: {"hits": 0, "misses": 0, "expired": 0})
+        self._lock = threading.Lock()
+        # several bot processes may share the file, wait for their writes instead of failing
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, agent TEXT, response TEXT, size INTEGER, created REAL, accessed REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+        self._conn.commit()
+
+    def get(self, key, agent=None, ttl=None):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.counters[agent]["misses"] += 1
+                return None
+            response, created = row
+            if ttl is not None and now - created > ttl:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                self.counters[agent]["expired"] += 1
+                self.counters[agent]["misses"] += 1
+                return None
+            self._conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.counters[agent]["hits"] += 1
+            return response
+
+    def put(self, key, response, agent=None):
+        now = time.time()
+        size = len(response.encode("utf-8"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                (key, agent, response, size, now, now),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def delete(self, key):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def _evict(self):
+        (total,) = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()
+        if total <= self.max_bytes:
+            return
+        # drop least recently used entries until a tenth below the bound, so eviction is not per insert
+        excess = total - int(self.max_bytes * 0.9)
+        freed = 0
+        keys = []
+        for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY accessed"):
+            keys.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", keys)
+
+    def stats(self):
+        stats = {}
+        for agent, counter in self.counters.items():
+            lookups = counter["hits"] + counter["misses"]
+            stats[agent] = dict(counter, hit_rate=counter["hits"] / lookups if lookups else 0.0)
+        return stats
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
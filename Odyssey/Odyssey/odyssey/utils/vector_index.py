@@ -0,0 +1,220 @@
+"""
+Persisted dense vector index.
+
+Embeddings are stored L2-normalised in `<name>.npy` with the entry names and
+a hash of each embedded text in `<name>.json`, so a process can memory-map
+the index at startup and only re-embed the texts that changed since it was
+written.
+
+Indexes shared between processes are published as immutable versions:
+`<index_root>/<version>/` holds one complete index and `<index_root>/CURRENT`
+names the live version. Readers memory-map whatever CURRENT points at and
+writers only ever create new versions, under `index_lock`.
+"""
+import contextlib
+import fcntl
+import hashlib
+import os
+import shutil
+import time
+
+import numpy as np
+
+from .embeddings import get_embeddings
+from .file_utils import f_join
+from .json_utils import json_load, json_dump
+
+__all__ = [
+    "VectorIndex", "text_hash", "index_lock", "current_version", "load_version", "publish_version",
+]
+
+
+def text_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class VectorIndex:
+    def __init__(self, index_dir, name, embedding_model=""):
+        self.vectors_path = f_join(index_dir, f"{name}.npy")
+        self.meta_path = f_join(index_dir, f"{name}.json")
+        self.embedding_model = embedding_model
+        self._embeddings = None
+        self.names = []
+        self.hashes = []
+        self.vectors = None
+        self.load()
+
+    @property
+    def embeddings(self):
+        # the sentence-transformers model is only loaded once something needs embedding
+        if self._embeddings is None:
+            self._embeddings = get_embeddings(self.embedding_model)
+        return self._embeddings
+
+    def __len__(self):
+        return len(self.names)
+
+    def load(self):
+        if not (os.path.exists(self.vectors_path) and os.path.exists(self.meta_path)):
+            return
+        meta = json_load(self.meta_path)
+        if meta.get("embedding_model") != self.embedding_model:
+            # vectors from another model are not comparable, rebuild on the next sync
+            return
+        vectors = np.load(self.vectors_path, mmap_mode="r")
+        if len(vectors) != len(meta["names"]):
+            return
+        self.names = meta["names"]
+        self.hashes = meta["hashes"]
+        self.vectors = vectors
+
+    def save(self):
+        # write next to the live files and swap, so readers never see a partial index
+        # (bots sharing a skill library may save concurrently, hence the per-process suffix)
+        vectors = self.vectors if self.vectors is not None else np.zeros((0, 0), dtype=np.float32)
+        suffix = f".{os.getpid()}.tmp"
+        os.makedirs(os.path.dirname(self.vectors_path), exist_ok=True)
+        with open(f"{self.vectors_path}{suffix}", "wb") as fp:
+            np.save(fp, np.ascontiguousarray(vectors, dtype=np.float32))
+        json_dump(
+            {"embedding_model": self.embedding_model, "names": self.names, "hashes": self.hashes},
+            f"{self.meta_path}{suffix}",
+        )
+        os.replace(f"{self.vectors_path}{suffix}", self.vectors_path)
+        os.replace(f"{self.meta_path}{suffix}", self.meta_path)
+        self.vectors = np.load(self.vectors_path, mmap_mode="r")
+
+    def embed(self, texts):
+        vectors = np.asarray(self.embeddings.embed_documents(list(texts)), dtype=np.float32)
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+    def matches(self, texts):
+        return self.names == list(texts) and self.hashes == [text_hash(text) for text in texts.values()]
+
+    def sync(self, texts):
+        """
+        Make the index hold exactly `texts` ({name: text}), re-embedding only
+        the entries whose text hash changed. Returns the number of texts embedded.
+        """
+        hashes = {name: text_hash(text) for name, text in texts.items()}
+        if self.names == list(hashes) and self.hashes == list(hashes.values()):
+            return 0
+        rows = {
+            name: row for row, (name, h) in enumerate(zip(self.names, self.hashes))
+            if hashes.get(name) == h
+        }
+        stale = [name for name in hashes if name not in rows]
+        fresh = self.embed([texts[name] for name in stale]) if stale else None
+        fresh_rows = {name: i for i, name in enumerate(stale)}
+        if hashes:
+            self.vectors = np.stack(
+                [
+                    self.vectors[rows[name]] if name in rows else fresh[fresh_rows[name]]
+                    for name in hashes
+                ]
+            )
+        else:
+            self.vectors = None
+        self.names = list(hashes)
+        self.hashes = list(hashes.values())
+        self.save()
+        return len(stale)
+
+    def add(self, name, text):
+        """Add or replace a single entry."""
+        self.delete(name, save=False)
+        vector = self.embed([text])
+        if self.names:
+            vector = np.concatenate([self.vectors, vector])
+        self.vectors = vector
+        self.names = self.names + [name]
+        self.hashes = self.hashes + [text_hash(text)]
+        self.save()
+
+    def delete(self, name, save=True):
+        if name not in self.names:
+            return
+        row = self.names.index(name)
+        self.vectors = np.delete(self.vectors, row, axis=0)
+        self.names = self.names[:row] + self.names[row + 1:]
+        self.hashes = self.hashes[:row] + self.hashes[row + 1:]
+        if save:
+            self.save()
+
+    def embed_query(self, query):
+        query_vector = np.asarray(self.embeddings.embed_query(query), dtype=np.float32)
+        return query_vector / max(np.linalg.norm(query_vector), 1e-12)
+
+    def search(self, query, k):
+        """Top `k` (name, cosine similarity) pairs for `query`, best first."""
+        if not self.names:
+            return []
+        return self.search_by_vector(self.embed_query(query), k)
+
+    def search_by_vector(self, query_vector, k):
+        k = min(k, len(self.names))
+        if k == 0:
+            return []
+        scores = self.vectors @ query_vector
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.names[i], float(scores[i])) for i in top]
+
+
+@contextlib.contextmanager
+def index_lock(index_root):
+    os.makedirs(index_root, exist_ok=True)
+    with open(f_join(index_root, ".lock"), "a") as fp:
+        fcntl.flock(fp, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fp, fcntl.LOCK_UN)
+
+
+def current_version(index_root):
+    path = f_join(index_root, "CURRENT")
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as fp:
+        return fp.read().strip() or None
+
+
+def load_version(index_root, name, embedding_model="", version=None):
+    """The index of `version` (default: CURRENT), or None if nothing was published yet."""
+    version = version or current_version(index_root)
+    if version is None:
+        return None
+    return VectorIndex(f_join(index_root, version), name, embedding_model=embedding_model)
+
+
+def publish_version(index_root, name, texts, embedding_model="", keep=3):
+    """
+    Write `texts` ({name: text}) as a new version under `index_root` and point
+    CURRENT at it, reusing the vectors of the current version for unchanged
+    texts. Call under `index_lock`. Only the newest `keep` versions are kept;
+    readers still mapping a removed one keep their pages until they reload.
+    """
+    base = load_version(index_root, name, embedding_model)
+    digest = hashlib.sha256(
+        "".join(f"{key}\0{text_hash(text)}\0" for key, text in texts.items()).encode("utf-8")
+    ).hexdigest()
+    version = f"{int(time.time() * 1000)}-{digest[:8]}"
+    index = VectorIndex(f_join(index_root, version), name, embedding_model=embedding_model)
+    if base is not None and base.names:
+        index.names, index.hashes, index.vectors = base.names, base.hashes, base.vectors
+    index.sync(texts)
+    if not os.path.exists(index.vectors_path):
+        index.save()
+
+    current_path = f_join(index_root, "CURRENT")
+    with open(f"{current_path}.{os.getpid()}.tmp", "w") as fp:
+        fp.write(version)
+    os.replace(f"{current_path}.{os.getpid()}.tmp", current_path)
+
+    versions = sorted(
+        entry.name for entry in os.scandir(index_root) if entry.is_dir()
+    )
+    for stale in versions[:-keep]:
+        shutil.rmtree(f_join(index_root, stale), ignore_errors=True)
+    return version, index
@@ -0,0 +1,22 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+
+import odyssey.utils as U
+from odyssey.utils.vector_index import index_lock, publish_version
+
+# this function publishes a new version of the skill index in index/ from skills.json,
+# run it once after editing the library so bots only have to memory-map the result
+def build_index(skill_dir, embedding_model):
+    skills = U.load_json(os.path.join(skill_dir, "skills.json"))
+    texts = {key: value["description"] for key, value in skills.items()}
+    index_root = os.path.join(skill_dir, "index")
+    with index_lock(index_root):
+        version, index = publish_version(index_root, "skill_index", texts, embedding_model)
+    print(f"Published skill index {version} with {len(index)} skills to {index_root}")
+
+if __name__ == "__main__":
+    skill_dir = os.path.dirname(os.path.abspath(__file__))
+    embedding_model = sys.argv[1] if len(sys.argv) > 1 else U.config.get("SENTENT_EMBEDDING_DIR")
+    build_index(skill_dir, embedding_model)
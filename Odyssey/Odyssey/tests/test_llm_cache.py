@@ -0,0 +1,74 @@
+import pytest
+
+from odyssey.utils import llm_cache
+from odyssey.utils.llm_cache import LLMCache, prompt_key
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(llm_cache.time, "time", lambda: now[0])
+    return now
+
+
+def test_prompt_key_depends_on_every_part():
+    assert prompt_key("model", "system", "user") == prompt_key("model", "system", "user")
+    assert prompt_key("model", "system", "user") != prompt_key("model", "system", "other")
+    assert prompt_key("ab", "c") != prompt_key("a", "bc")
+
+
+def test_hit_and_miss_are_counted_per_agent(tmp_path):
+    cache = LLMCache(str(tmp_path))
+    assert cache.get("k", agent="critic") is None
+    cache.put("k", "answer", agent="critic")
+    assert cache.get("k", agent="critic") == "answer"
+    assert cache.stats()["critic"] == {"hits": 1, "misses": 1, "expired": 0, "hit_rate": 0.5}
+
+
+def test_entries_expire_after_the_ttl(tmp_path, clock):
+    cache = LLMCache(str(tmp_path))
+    cache.put("k", "answer", agent="rerank")
+    clock[0] += 60
+    assert cache.get("k", agent="rerank", ttl=120) == "answer"
+    clock[0] += 61
+    assert cache.get("k", agent="rerank", ttl=120) is None
+    assert cache.stats()["rerank"]["expired"] == 1
+    # expired entries are dropped, not only skipped
+    assert len(cache) == 0
+
+
+def test_no_ttl_never_expires(tmp_path, clock):
+    cache = LLMCache(str(tmp_path))
+    cache.put("k", "answer")
+    clock[0] += 10 ** 9
+    assert cache.get("k") == "answer"
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, clock):
+    cache = LLMCache(str(tmp_path), max_bytes=1000)
+    for i in range(4):
+        clock[0] += 1
+        cache.put(f"k{i}", "x" * 200)
+    # k0 is the oldest insert but was read last
+    clock[0] += 1
+    assert cache.get("k0") == "x" * 200
+    clock[0] += 1
+    cache.put("k4", "x" * 200)
+    clock[0] += 1
+    cache.put("k5", "x" * 200)
+    # 1200 bytes: evicted down to 900, oldest accesses first
+    assert cache.get("k1") is None
+    assert cache.get("k2") is None
+    assert [cache.get(key) is not None for key in ("k0", "k3", "k4", "k5")] == [True] * 4
+
+
+def test_delete(tmp_path):
+    cache = LLMCache(str(tmp_path))
+    cache.put("k", "unparseable")
+    cache.delete("k")
+    assert cache.get("k") is None
+
+
+def test_cache_is_shared_through_the_directory(tmp_path):
+    LLMCache(str(tmp_path)).put("k", "answer")
+    assert LLMCache(str(tmp_path)).get("k") == "answer"
@@ -0,0 +1,94 @@
+import json
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from odyssey.env.bridge import VoyagerEnv, apply_patch
+
+DELTA_JS = os.path.join(os.path.dirname(__file__), "..", "odyssey", "env", "mineflayer", "observationDelta.js")
+ENCODE_SCRIPT = """
+const { encodeEvents } = require(process.argv[1]);
+const { base, events } = JSON.parse(require("fs").readFileSync(0, "utf8"));
+process.stdout.write(JSON.stringify(encodeEvents(base, events)));
+"""
+
+BASE = {
+    "status": {"health": 20, "position": {"x": 1.5, "y": 64, "z": -3.5}, "biome": "plains"},
+    "inventory": {"oak_log": 4, "stick": 2},
+    "voxels": ["stone", "dirt"],
+    "nearbyChests": {},
+}
+EVENTS = [
+    # unchanged payload
+    ["onSave", dict(BASE)],
+    # nested change, key added and key removed below the top level
+    ["onChat", {
+        "onChat": "Collected 1 oak_log",
+        "status": {"health": 19, "position": {"x": 2.0, "y": 64, "z": -3.5}, "biome": "plains", "food": 20},
+        "inventory": {"oak_log": 5},
+        "voxels": ["stone", "dirt"],
+        "nearbyChests": {},
+    }],
+    # top-level key removed, array replaced, key order changed
+    ["observe", {
+        "voxels": ["stone", "water"],
+        "inventory": {"oak_log": 5, "crafting_table": 1},
+        "status": {"health": 19, "position": {"x": 2.0, "y": 64, "z": -3.5}, "biome": "plains", "food": 20},
+    }],
+]
+
+
+def key_order(value):
+    if isinstance(value, dict):
+        return [(key, key_order(item)) for key, item in value.items()]
+    if isinstance(value, list):
+        return [key_order(item) for item in value]
+    return None
+
+
+def encode(base, events):
+    if shutil.which("node") is None:
+        pytest.skip("node is not installed")
+    result = subprocess.run(
+        ["node", "-e", ENCODE_SCRIPT, os.path.abspath(DELTA_JS)],
+        input=json.dumps({"base": base, "events": events}), capture_output=True, text=True, check=True,
+    )
+    return json.loads(result.stdout)
+
+
+@pytest.mark.parametrize("base", [{}, BASE], ids=["snapshot", "against-base"])
+def test_patches_round_trip(base):
+    payload = base
+    for (event_type, patch), (expected_type, expected) in zip(encode(base, EVENTS), EVENTS):
+        payload = apply_patch(payload, patch)
+        assert event_type == expected_type
+        assert payload == expected
+        assert key_order(payload) == key_order(expected)
+
+
+def test_unchanged_payload_is_an_empty_patch():
+    assert encode(BASE, [["observe", BASE]]) == [["observe", {}]]
+
+
+@pytest.fixture
+def env(tmp_path):
+    return VoyagerEnv(mc_port=25565, log_path=str(tmp_path))
+
+
+def test_materialize_observation_chains_steps(env):
+    first = encode({}, EVENTS[:2])
+    second = encode(EVENTS[1][1], EVENTS[2:])
+    assert env.materialize_observation({"session": "s", "seq": 1, "base": None, "events": first}) == EVENTS[:2]
+    assert env.materialize_observation({"session": "s", "seq": 2, "base": 1, "events": second}) == EVENTS[2:]
+    assert (env.observation_session, env.observation_seq) == ("s", 2)
+
+
+def test_materialize_observation_passes_full_events_through(env):
+    assert env.materialize_observation(EVENTS) is EVENTS
+
+
+def test_materialize_observation_rejects_malformed_replies(env):
+    with pytest.raises(RuntimeError, match="Malformed observation"):
+        env.materialize_observation({})
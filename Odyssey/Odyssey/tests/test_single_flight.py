@@ -0,0 +1,142 @@
+import asyncio
+import os
+import threading
+import time
+
+import pytest
+
+from odyssey.utils.single_flight import SingleFlight
+
+
+def run_concurrently(flight, key, fn, callers):
+    results = [None] * callers
+    errors = [None] * callers
+
+    def call(i):
+        try:
+            results[i] = flight.do(key, fn)
+        except Exception as e:
+            errors[i] = e
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(callers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, errors
+
+
+def slow(calls, result="answer", delay=0.2):
+    def fn():
+        calls.append(threading.get_ident())
+        time.sleep(delay)
+        return result
+    return fn
+
+
+def test_followers_share_the_leaders_result():
+    flight = SingleFlight()
+    calls = []
+    results, errors = run_concurrently(flight, "k", slow(calls), 5)
+    assert len(calls) == 1
+    assert results == ["answer"] * 5 and errors == [None] * 5
+    assert flight.stats() == {"leaders": 1, "shared": 4, "shared_across_processes": 0}
+
+
+def test_followers_get_the_leaders_exception():
+    flight = SingleFlight()
+
+    def fail():
+        time.sleep(0.2)
+        raise ValueError("boom")
+
+    _, errors = run_concurrently(flight, "k", fail, 3)
+    assert all(isinstance(error, ValueError) for error in errors)
+    assert flight.leaders == 1
+
+
+def test_calls_after_completion_run_again():
+    flight = SingleFlight()
+    calls = []
+    flight.do("k", slow(calls, delay=0))
+    flight.do("k", slow(calls, delay=0))
+    assert len(calls) == 2
+
+
+def test_different_keys_do_not_share():
+    flight = SingleFlight()
+    calls = []
+    threads = [threading.Thread(target=flight.do, args=(key, slow(calls))) for key in ("a", "b")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 2
+
+
+def test_coroutines_share_one_call():
+    flight = SingleFlight()
+    calls = []
+
+    async def fn():
+        calls.append(1)
+        await asyncio.sleep(0.1)
+        return "answer"
+
+    async def main():
+        return await asyncio.gather(*(flight.ado("k", fn) for _ in range(4)))
+
+    assert asyncio.run(main()) == ["answer"] * 4
+    assert len(calls) == 1
+
+
+# separate SingleFlight instances stand in for processes: each opens its own lock file descriptions
+def test_lock_dir_shares_results_across_instances(tmp_path):
+    leader, follower = SingleFlight(str(tmp_path)), SingleFlight(str(tmp_path))
+    calls = []
+    thread = threading.Thread(target=leader.do, args=("k", slow(calls, delay=0.5)))
+    thread.start()
+    time.sleep(0.1)
+    assert follower.do("k", slow(calls, "other")) == "answer"
+    thread.join()
+    assert len(calls) == 1
+    assert follower.shared_across_processes == 1
+
+
+def test_clean_keeps_locks_held_past_the_ttl(tmp_path):
+    leader, other = SingleFlight(str(tmp_path), result_ttl=0.1), SingleFlight(str(tmp_path), result_ttl=0.1)
+    calls = []
+    thread = threading.Thread(target=leader.do, args=("k", slow(calls, delay=0.6)))
+    thread.start()
+    time.sleep(0.3)
+    other._clean()
+    assert os.path.exists(tmp_path / "k.lock")
+    # still a follower of the running leader, not a second leader
+    assert other.do("k", slow(calls, "other")) == "answer"
+    thread.join()
+    assert len(calls) == 1
+
+
+def test_clean_removes_old_unheld_files(tmp_path):
+    flight = SingleFlight(str(tmp_path), result_ttl=0.1)
+    flight.do("k", lambda: "answer")
+    assert sorted(os.listdir(tmp_path)) == ["k.json", "k.lock"]
+    time.sleep(0.2)
+    flight._cleaned_at = 0
+    flight._clean()
+    assert os.listdir(tmp_path) == []
+
+
+def test_none_is_not_shared_across_instances(tmp_path):
+    flight = SingleFlight(str(tmp_path))
+    assert flight.do("k", lambda: None) is None
+    assert not os.path.exists(tmp_path / "k.json")
+
+
+@pytest.mark.parametrize("callers", [2, 8])
+def test_in_process_sharing_with_a_lock_dir(tmp_path, callers):
+    flight = SingleFlight(str(tmp_path))
+    calls = []
+    results, _ = run_concurrently(flight, "k", slow(calls), callers)
+    assert results == ["answer"] * callers
+    assert len(calls) == 1